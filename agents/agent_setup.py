@@ -14,47 +14,31 @@ from models.sustainability_Expert import SustainabilityExpert
 import re  # For parsing market prices from the message
 
 # Groq LLM integration for versatile Q&A (Llama 3.3 70B)
-import requests
-
-GROQ_API_KEY = os.getenv("GROQ_API_KEY", "")
-GROQ_API_URL = "https://api.groq.com/openai/v1/chat/completions"
-GROQ_MODEL = os.getenv("GROQ_MODEL", "llama-3.3-70b-versatile")
+from models.llm_config import call_gemini_text
+from models.llm_router import get_router
+from models.request_scope import request_scope
 
 def get_gemini_response(prompt):
     """Call Groq (Llama 3.3 70B) for general Q&A.
 
-    Function name kept for backward compatibility.
+    Function name kept for backward compatibility. Goes through
+    call_gemini like the agents, so the call is paced by the shared rate
+    limiter and settled against its tokens/min budget, and returns at
+    once, without a request, while the LLM circuit breaker is open.
     """
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {GROQ_API_KEY}",
-    }
-    data = {
-        "model": GROQ_MODEL,
-        "messages": [
-            {"role": "system", "content": "You are an expert agricultural assistant. Give clear, actionable advice for sustainable farming."},
-            {"role": "user", "content": prompt},
-        ],
-        "temperature": 0.5,
-        "max_tokens": 2048,
-    }
     try:
-        response = requests.post(GROQ_API_URL, headers=headers, json=data, timeout=20)
-        response.raise_for_status()
-        result = response.json()
-        print("[Groq API] Response received successfully")
-        choices = result.get("choices", [])
-        if choices:
-            return choices[0]["message"]["content"]
-        else:
-            print("[Groq API error] No choices in response.")
-            return "Sorry, I couldn't find an answer to your question right now."
-    except requests.exceptions.Timeout:
-        print("[Groq API error] Request timed out.")
-        return "Sorry, the AI service timed out. Please try again."
-    except requests.exceptions.RequestException as e:
-        print(f"[Groq API error] RequestException: {e}")
-        return f"Sorry, there was a problem reaching the AI service: {e}"
+        response = call_gemini_text(
+            "You are an expert agricultural assistant. Give clear, actionable advice for sustainable farming.",
+            prompt, temperature=0.5, timeout=20, max_retries=0,
+        )
+        if response:
+            print("[Groq API] Response received successfully")
+            return response
+        if get_router().all_open():
+            print("[Groq API error] Circuit open — not calling the AI service.")
+            return "Sorry, the AI service is temporarily unavailable. Please try again in a minute."
+        print("[Groq API error] No answer from the AI service.")
+        return "Sorry, I couldn't find an answer to your question right now."
     except Exception as e:
         print(f"[Groq API error] Unexpected: {e}")
         return f"Sorry, an unexpected error occurred: {e}"
@@ -494,11 +478,12 @@ def run_agent_collaboration(land_size, soil_type, crop_preference):
         f"WeatherAnalyst, predict weather for the next 3 months. "
         f"SustainabilityExpert, evaluate the sustainability of the suggested crops."
     )
-    # Initiate the chat
-    central_coordinator.initiate_chat(
-        group_chat_manager,
-        message={"content": initial_message, "role": "user"}
-    )
+    # Initiate the chat — one request scope, so agents asked twice answer once
+    with request_scope():
+        central_coordinator.initiate_chat(
+            group_chat_manager,
+            message={"content": initial_message, "role": "user"}
+        )
     # Retrieve the final result from the CentralCoordinator instance
     result = central_coordinator.final_result
     if result is None:
@@ -4,11 +4,15 @@ import os
 import io
 import sys
 import sqlite3
+import threading
+import time
+from contextlib import asynccontextmanager
 from datetime import datetime, timedelta
 from typing import List, Optional, Dict, Any
-from fastapi import FastAPI, UploadFile, File, Form, Depends, HTTPException, Query
+from fastapi import FastAPI, UploadFile, File, Form, Depends, Header, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, FileResponse
+from fastapi.responses import JSONResponse, FileResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel
 import json
@@ -37,6 +41,9 @@ except ImportError:
 # Add parent directory to path for imports
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
+from models.deadline import DEFAULT_DEADLINE_S
+from models.single_flight import SingleFlight
+
 # Import agent collaboration
 try:
     from agents.agent_setup import run_agent_collaboration
@@ -182,7 +189,109 @@ try:
 except ImportError:
     EnhancedPestDiseasePredictor = None
 
-app = FastAPI(title="Sustainable Farming AI API", version="2.0")
+# ─── Warm engine registry ────────────────────────────────────────────
+# AgriSmartEngine loads 4 joblib models and builds the AgriKnowledgeBase
+# (CSV parsing, crop statistics, retrieval index). That is far too slow to
+# repeat per request, so the engine, KB and agents are built ONCE per
+# process at startup and shared read-only by every request thread.
+ENGINE_WARMUP_TIMEOUT = float(os.getenv("ENGINE_WARMUP_TIMEOUT", "120"))
+
+
+class EngineRegistry:
+    """Process-wide holder for the warm engine, knowledge base and agents."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._thread = None
+        self.engine = None
+        self.kb = None
+        self.coordinator = None
+        self.error = None
+        self.warmup_seconds = None
+
+    def start(self):
+        """Kick off warm-up in a background thread (idempotent)."""
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._warm_up, name="engine-warmup", daemon=True)
+                self._thread.start()
+
+    def _warm_up(self):
+        started = time.perf_counter()
+        try:
+            from models.custom_engine import AgriSmartEngine
+            from models.central_coordinator import CentralCoordinator
+
+            try:
+                self.engine = AgriSmartEngine()
+                self.kb = self.engine.kb
+                # One throwaway recommendation primes lazy sklearn/numpy paths
+                self.engine.recommend(use_llm=False)
+            except Exception as e:
+                print(f"⚠️ Engine warm-up failed: {e}")
+                self.error = str(e)
+                self.engine = None
+            # Agents still serve without the engine, but don't pay for a
+            # second failing build inside the coordinator
+            self.coordinator = CentralCoordinator(
+                engine=self.engine, build_engine=self.engine is not None)
+        except Exception as e:
+            print(f"⚠️ Agent warm-up failed: {e}")
+            self.error = str(e)
+        finally:
+            self.warmup_seconds = round(time.perf_counter() - started, 3)
+            self._ready.set()
+            print(f"🔥 Engine registry warm in {self.warmup_seconds}s")
+
+    def _wait(self, timeout: Optional[float]):
+        self.start()
+        if not self._ready.wait(ENGINE_WARMUP_TIMEOUT if timeout is None else timeout):
+            raise RuntimeError("Engine warm-up still in progress — retry shortly")
+
+    def get_engine(self, timeout: Optional[float] = None):
+        self._wait(timeout)
+        if self.engine is None:
+            raise RuntimeError(f"AgriSmart engine unavailable: {self.error}")
+        return self.engine
+
+    def get_coordinator(self, timeout: Optional[float] = None):
+        self._wait(timeout)
+        if self.coordinator is None:
+            raise RuntimeError(f"CentralCoordinator unavailable: {self.error}")
+        return self.coordinator
+
+    @property
+    def is_ready(self) -> bool:
+        return self._ready.is_set() and self.coordinator is not None
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "ready": self.is_ready,
+            "warming_up": self._thread is not None and not self._ready.is_set(),
+            "engine_loaded": self.engine is not None,
+            "knowledge_base_loaded": bool(self.kb is not None and self.kb.is_loaded),
+            "warmup_seconds": self.warmup_seconds,
+            "error": self.error,
+        }
+
+
+engine_registry = EngineRegistry()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    engine_registry.start()
+    yield
+    try:
+        from models.llm_config import aclose_async_clients
+        await aclose_async_clients()
+    except Exception:
+        pass
+
+
+app = FastAPI(title="Sustainable Farming AI API", version="2.0", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -199,6 +308,7 @@ if not os.path.exists(os.path.dirname(DB_PATH)):
 
 # Open-Meteo API — free, no API key required
 OPEN_METEO_FORECAST = "https://api.open-meteo.com/v1/forecast"
+_weather_flight = SingleFlight("open_meteo")
 
 # Models
 class UserSignup(BaseModel):
@@ -275,6 +385,8 @@ class MultiAgentRecommendationRequest(BaseModel):
     humidity: float = 60.0
     ph: float = 6.5
     rainfall: float = 500.0
+    # Overall time budget in seconds (X-Deadline-Seconds header also accepted)
+    deadline_s: Optional[float] = None
 
 class OfflineDataRequest(BaseModel):
     username: str
@@ -670,8 +782,159 @@ except ImportError as e:
     print(f"⚠️ Could not import ML models: {e}")
     MODELS_AVAILABLE = False
 
+def _multi_agent_kwargs(req: MultiAgentRecommendationRequest,
+                        x_deadline_seconds: Optional[float]) -> Dict[str, Any]:
+    """CentralCoordinator arguments for a multi-agent request."""
+    # Calculate dynamic pesticide and yield estimates based on input
+    estimated_pesticide = min(4.0, max(0.5, req.nitrogen / 30))
+    estimated_yield = min(6.0, max(1.0, req.land_size * 0.8))
+    return dict(
+        soil_ph=req.ph,
+        soil_moisture=req.humidity, # Using humidity as proxy
+        temperature=req.temperature,
+        rainfall=req.rainfall,
+        fertilizer=req.nitrogen,
+        pesticide=estimated_pesticide,
+        crop_yield=estimated_yield,
+        land_size=req.land_size,
+        city_name=None,
+        crop_preference=req.crop_preference,
+        deadline_s=req.deadline_s or x_deadline_seconds or DEFAULT_DEADLINE_S,
+    )
+
+
+async def _multi_agent_coordinator():
+    if not MODELS_AVAILABLE:
+        raise ImportError("ML models not available on server")
+    # Shared, pre-warmed CentralCoordinator (built once at startup);
+    # only wait for warm-up off the event loop
+    if engine_registry.is_ready:
+        return engine_registry.get_coordinator()
+    return await run_in_threadpool(engine_registry.get_coordinator)
+
+
+def _multi_agent_response(result: Dict[str, Any]) -> Dict[str, Any]:
+    """Map a CentralCoordinator result onto the /multi_agent_recommendation schema."""
+    response = {
+        "agents": {},
+        "central_coordinator": {},
+        "chart_data": [],
+        "success": True
+    }
+    response["partial"] = result.get("Partial", False)
+    response["deadline"] = result.get("Deadline", {})
+    response["upstream_calls"] = result.get("Upstream Calls", {})
+    
+    # Map CentralCoordinator result to API response structure
+    # Now using REAL AI-generated insights from each agent (not hardcoded)
+    
+    # 1. Farmer Advisor — uses actual AI reasoning and confidence
+    response["agents"]["farmer_advisor"] = {
+        "name": "🚜 Farmer Advisor",
+        "recommended_crop": result['Recommended Crop'],
+        "confidence": result.get('Farmer Confidence', 85.0),
+        "advice": result.get('Farmer Advice', f"{result['Recommended Crop']} recommended for your conditions."),
+        "reasoning": result.get('Farmer Reasoning', ''),
+        "alternatives": result.get('Alternatives', []),
+        "original_prediction": result['Recommended Crop'],
+        "model_used": "Groq Llama-3.3-70B Agent"
+    }
+    
+    # 2. Market Researcher — uses AI-generated market analysis
+    response["agents"]["market_researcher"] = {
+        "name": "💰 Market Researcher",
+        "market_score": result['Market Score'],
+        "price_trend": result.get('Price Trend', 'Stable'),
+        "advice": result.get('Market Insights', f"Market score: {result['Market Score']}/10 for {result['Recommended Crop']}."),
+        "reasoning": result.get('Market Reasoning', '')
+    }
+    
+    # 3. Weather Analyst — uses AI-generated weather analysis
+    response["agents"]["weather_analyst"] = {
+        "name": "🌤️ Weather Analyst",
+        "weather_score": result['Weather Suitability Score'],
+        "risk_level": "Low" if result['Weather Suitability Score'] > 7 else "Medium" if result['Weather Suitability Score'] > 4 else "High",
+        "forecast": result.get('Weather Forecast', f"Temp: {result['Predicted Temperature']}°C, Rainfall: {result['Predicted Rainfall']}mm"),
+        "advice": result.get('Weather Advice', f"Weather suitability: {result['Weather Suitability Score']}/10."),
+        "reasoning": result.get('Weather Reasoning', '')
+    }
+    
+    # 4. Sustainability Expert — uses AI-generated sustainability analysis
+    response["agents"]["sustainability_expert"] = {
+        "name": "🌱 Sustainability Expert",
+        "sustainability_score": result['Sustainability Score'],
+        "environmental_impact": "Low" if result['Sustainability Score'] > 7 else "Medium" if result['Sustainability Score'] > 4 else "High",
+        "recommendations": result.get('Sustainability Recommendations', 'Follow sustainable practices.'),
+        "advice": result.get('Sustainability Reasoning', f"Sustainability: {result['Sustainability Score']}/10.")
+    }
+    
+    # Central Coordinator — AI-synthesised recommendation
+    pest_advice = result.get('Pest/Disease Advice')
+    pest_items = []
+    if isinstance(pest_advice, dict):
+         pest_items = list(pest_advice.values())
+    elif isinstance(pest_advice, str):
+         pest_items = [pest_advice]
+    elif isinstance(pest_advice, list):
+         pest_items = pest_advice
+    
+    response["central_coordinator"] = {
+        "final_crop": result['Recommended Crop'],
+        "overall_score": result['Final Score'],
+        "confidence_level": result.get('AI Confidence', 'Medium'),
+        "reasoning": result.get('AI Synthesis', f"Final score: {result['Final Score']}/10."),
+        "action_items": result.get('Warnings', []) + pest_items,
+        "action_plan": result.get('AI Action Plan', ''),
+        "key_factors": result.get('AI Key Factors', []),
+        "risk_summary": result.get('AI Risk Summary', ''),
+        "pest_ipm_plan": result.get('Pest IPM Plan', ''),
+        "conflicts_resolved": result.get('AI Conflicts Resolved', 'None'),
+        "agent_scores": result.get('Agent Scores', {}),
+    }
+    
+    # Chart Data
+    response["chart_data"] = [{
+        "crop": result['Recommended Crop'],
+        "labels": ["Market", "Weather", "Sustainability", "Carbon", "Water", "Erosion"],
+        "values": [
+            result['Market Score'] * 10,
+            result['Weather Suitability Score'] * 10,
+            result['Sustainability Score'] * 10,
+            result['Carbon Footprint Score'] * 10,
+            result['Water Score'] * 10,
+            result['Erosion Score'] * 10
+        ]
+    }]
+
+    # Custom Engine Data (novel hybrid engine)
+    custom_engine_data = result.get("Custom Engine", {})
+    if custom_engine_data.get("enabled"):
+        response["custom_engine"] = {
+            "enabled": True,
+            "engine_version": custom_engine_data.get("engine_version", "N/A"),
+            "custom_score": custom_engine_data.get("custom_score", 0),
+            "custom_confidence": custom_engine_data.get("custom_confidence", 0),
+            "layer_scores": custom_engine_data.get("layer_scores", {}),
+            "score_explanation": custom_engine_data.get("score_explanation", []),
+            "layers_used": custom_engine_data.get("layers_used", []),
+            "data_points_analysed": custom_engine_data.get("data_points_analysed", 0),
+            "historical_evidence": custom_engine_data.get("historical_evidence", {}),
+            "estimated_yield": custom_engine_data.get("estimated_yield", 0),
+            "estimated_price": custom_engine_data.get("estimated_price", 0),
+            "custom_alternatives": custom_engine_data.get("custom_alternatives", []),
+            "crop_icon": custom_engine_data.get("crop_icon", "🌱"),
+            "comparative": custom_engine_data.get("comparative", {}),
+        }
+    else:
+        response["custom_engine"] = {"enabled": False}
+
+    return response
+
+
 @app.post("/multi_agent_recommendation")
-def get_multi_agent_recommendation(req: MultiAgentRecommendationRequest):
+async def get_multi_agent_recommendation(
+        req: MultiAgentRecommendationRequest,
+        x_deadline_seconds: Optional[float] = Header(None)):
     """
     Multi-Agent AI Recommendation System
     Uses CentralCoordinator to orchestrate 4 trained AI models to provide comprehensive farming recommendations:
@@ -679,6 +942,10 @@ def get_multi_agent_recommendation(req: MultiAgentRecommendationRequest):
     2. Market Researcher - Market trends and price forecasting
     3. Weather Analyst - Weather impact analysis
     4. Sustainability Expert - Environmental impact assessment
+
+    The whole request runs under a deadline (``deadline_s`` field, else the
+    X-Deadline-Seconds header, else AGRISMART_DEADLINE_S = 8 s). If it runs
+    out, the engine's result comes back with ``"partial": true``.
     """
     response = {
         "agents": {},
@@ -688,133 +955,12 @@ def get_multi_agent_recommendation(req: MultiAgentRecommendationRequest):
     }
     
     try:
-        if not MODELS_AVAILABLE:
-            raise ImportError("ML models not available on server")
-
-        # Initialize CentralCoordinator
-        coordinator = CentralCoordinator()
-        
-        # Calculate dynamic pesticide and yield estimates based on input
-        estimated_pesticide = min(4.0, max(0.5, req.nitrogen / 30))
-        estimated_yield = min(6.0, max(1.0, req.land_size * 0.8))
-        
-        # Generate recommendation using the coordinator
-        # usage: generate_recommendation(soil_ph, soil_moisture, temperature, rainfall, fertilizer, pesticide, crop_yield, city_name=None)
-        result = coordinator.generate_recommendation(
-            soil_ph=req.ph,
-            soil_moisture=req.humidity, # Using humidity as proxy
-            temperature=req.temperature,
-            rainfall=req.rainfall,
-            fertilizer=req.nitrogen,
-            pesticide=estimated_pesticide,
-            crop_yield=estimated_yield,
-            land_size=req.land_size,
-            city_name=None,
-            crop_preference=req.crop_preference,
-        )
-        
-        # Map CentralCoordinator result to API response structure
-        # Now using REAL AI-generated insights from each agent (not hardcoded)
-        
-        # 1. Farmer Advisor — uses actual AI reasoning and confidence
-        response["agents"]["farmer_advisor"] = {
-            "name": "🚜 Farmer Advisor",
-            "recommended_crop": result['Recommended Crop'],
-            "confidence": result.get('Farmer Confidence', 85.0),
-            "advice": result.get('Farmer Advice', f"{result['Recommended Crop']} recommended for your conditions."),
-            "reasoning": result.get('Farmer Reasoning', ''),
-            "alternatives": result.get('Alternatives', []),
-            "original_prediction": result['Recommended Crop'],
-            "model_used": "Groq Llama-3.3-70B Agent"
-        }
-        
-        # 2. Market Researcher — uses AI-generated market analysis
-        response["agents"]["market_researcher"] = {
-            "name": "💰 Market Researcher",
-            "market_score": result['Market Score'],
-            "price_trend": result.get('Price Trend', 'Stable'),
-            "advice": result.get('Market Insights', f"Market score: {result['Market Score']}/10 for {result['Recommended Crop']}."),
-            "reasoning": result.get('Market Reasoning', '')
-        }
-        
-        # 3. Weather Analyst — uses AI-generated weather analysis
-        response["agents"]["weather_analyst"] = {
-            "name": "🌤️ Weather Analyst",
-            "weather_score": result['Weather Suitability Score'],
-            "risk_level": "Low" if result['Weather Suitability Score'] > 7 else "Medium" if result['Weather Suitability Score'] > 4 else "High",
-            "forecast": result.get('Weather Forecast', f"Temp: {result['Predicted Temperature']}°C, Rainfall: {result['Predicted Rainfall']}mm"),
-            "advice": result.get('Weather Advice', f"Weather suitability: {result['Weather Suitability Score']}/10."),
-            "reasoning": result.get('Weather Reasoning', '')
-        }
-        
-        # 4. Sustainability Expert — uses AI-generated sustainability analysis
-        response["agents"]["sustainability_expert"] = {
-            "name": "🌱 Sustainability Expert",
-            "sustainability_score": result['Sustainability Score'],
-            "environmental_impact": "Low" if result['Sustainability Score'] > 7 else "Medium" if result['Sustainability Score'] > 4 else "High",
-            "recommendations": result.get('Sustainability Recommendations', 'Follow sustainable practices.'),
-            "advice": result.get('Sustainability Reasoning', f"Sustainability: {result['Sustainability Score']}/10.")
-        }
-        
-        # Central Coordinator — AI-synthesised recommendation
-        pest_advice = result.get('Pest/Disease Advice')
-        pest_items = []
-        if isinstance(pest_advice, dict):
-             pest_items = list(pest_advice.values())
-        elif isinstance(pest_advice, str):
-             pest_items = [pest_advice]
-        elif isinstance(pest_advice, list):
-             pest_items = pest_advice
-        
-        response["central_coordinator"] = {
-            "final_crop": result['Recommended Crop'],
-            "overall_score": result['Final Score'],
-            "confidence_level": result.get('AI Confidence', 'Medium'),
-            "reasoning": result.get('AI Synthesis', f"Final score: {result['Final Score']}/10."),
-            "action_items": result.get('Warnings', []) + pest_items,
-            "action_plan": result.get('AI Action Plan', ''),
-            "key_factors": result.get('AI Key Factors', []),
-            "risk_summary": result.get('AI Risk Summary', ''),
-            "pest_ipm_plan": result.get('Pest IPM Plan', ''),
-            "conflicts_resolved": result.get('AI Conflicts Resolved', 'None'),
-            "agent_scores": result.get('Agent Scores', {}),
-        }
-        
-        # Chart Data
-        response["chart_data"] = [{
-            "crop": result['Recommended Crop'],
-            "labels": ["Market", "Weather", "Sustainability", "Carbon", "Water", "Erosion"],
-            "values": [
-                result['Market Score'] * 10,
-                result['Weather Suitability Score'] * 10,
-                result['Sustainability Score'] * 10,
-                result['Carbon Footprint Score'] * 10,
-                result['Water Score'] * 10,
-                result['Erosion Score'] * 10
-            ]
-        }]
-
-        # Custom Engine Data (novel hybrid engine)
-        custom_engine_data = result.get("Custom Engine", {})
-        if custom_engine_data.get("enabled"):
-            response["custom_engine"] = {
-                "enabled": True,
-                "engine_version": custom_engine_data.get("engine_version", "N/A"),
-                "custom_score": custom_engine_data.get("custom_score", 0),
-                "custom_confidence": custom_engine_data.get("custom_confidence", 0),
-                "layer_scores": custom_engine_data.get("layer_scores", {}),
-                "score_explanation": custom_engine_data.get("score_explanation", []),
-                "layers_used": custom_engine_data.get("layers_used", []),
-                "data_points_analysed": custom_engine_data.get("data_points_analysed", 0),
-                "historical_evidence": custom_engine_data.get("historical_evidence", {}),
-                "estimated_yield": custom_engine_data.get("estimated_yield", 0),
-                "estimated_price": custom_engine_data.get("estimated_price", 0),
-                "custom_alternatives": custom_engine_data.get("custom_alternatives", []),
-                "crop_icon": custom_engine_data.get("crop_icon", "🌱"),
-                "comparative": custom_engine_data.get("comparative", {}),
-            }
-        else:
-            response["custom_engine"] = {"enabled": False}
+        coordinator = await _multi_agent_coordinator()
+        # Async flow, so the agents' LLM calls multiplex on the event loop
+        # instead of threads
+        result = await coordinator.generate_recommendation_async(
+            **_multi_agent_kwargs(req, x_deadline_seconds))
+        response = _multi_agent_response(result)
 
     except Exception as e:
         print(f"Error in multi_agent_recommendation: {e}")
@@ -824,6 +970,59 @@ def get_multi_agent_recommendation(req: MultiAgentRecommendationRequest):
     return response
 
 
+
+# Which part of the /multi_agent_recommendation response each streamed
+# coordinator stage fills in ("crop" carries the custom engine's answer)
+_STREAM_SECTIONS = {
+    "crop": lambda r: {"custom_engine": r["custom_engine"],
+                       "central_coordinator": {"final_crop": r["central_coordinator"]["final_crop"]}},
+    "farmer": lambda r: {"agents": {"farmer_advisor": r["agents"]["farmer_advisor"]}},
+    "market": lambda r: {"agents": {"market_researcher": r["agents"]["market_researcher"]}},
+    "weather": lambda r: {"agents": {"weather_analyst": r["agents"]["weather_analyst"]}},
+    "sustainability": lambda r: {"agents": {"sustainability_expert": r["agents"]["sustainability_expert"]}},
+    "pest": lambda r: {"central_coordinator": {
+        "pest_ipm_plan": r["central_coordinator"]["pest_ipm_plan"],
+        "action_items": r["central_coordinator"]["action_items"]}},
+    "synthesis": lambda r: {"central_coordinator": r["central_coordinator"],
+                            "chart_data": r["chart_data"]},
+}
+
+
+def _sse(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+@app.post("/multi_agent_recommendation/stream")
+async def stream_multi_agent_recommendation(
+        req: MultiAgentRecommendationRequest,
+        x_deadline_seconds: Optional[float] = Header(None)):
+    """
+    Two-phase variant of /multi_agent_recommendation as Server-Sent Events.
+    The custom engine's answer goes out first (event ``engine``), then each
+    agent's section as it completes (``farmer``, ``market``, ``weather``,
+    ``sustainability``, ``pest``, ``synthesis``) — each a fragment of the
+    /multi_agent_recommendation response to merge in. The last event,
+    ``complete``, is the full response; ``error`` replaces it on failure.
+    """
+    async def stream():
+        try:
+            coordinator = await _multi_agent_coordinator()
+            async for stage, result in coordinator.generate_recommendation_stream(
+                    **_multi_agent_kwargs(req, x_deadline_seconds)):
+                response = _multi_agent_response(result)
+                if stage == "complete":
+                    yield _sse("complete", response)
+                else:
+                    yield _sse("engine" if stage == "crop" else stage,
+                               _STREAM_SECTIONS[stage](response))
+        except Exception as e:
+            print(f"Error in multi_agent_recommendation/stream: {e}")
+            yield _sse("error", {"success": False, "error": str(e)})
+
+    # no-cache / no proxy buffering, so each event reaches slow links at once
+    return StreamingResponse(stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
 @app.post("/api/quick_recommend")
 def quick_recommend(req: MultiAgentRecommendationRequest):
     """
@@ -833,8 +1032,7 @@ def quick_recommend(req: MultiAgentRecommendationRequest):
     Perfect for low-bandwidth / offline-first scenarios.
     """
     try:
-        from models.custom_engine import AgriSmartEngine
-        engine = AgriSmartEngine()
+        engine = engine_registry.get_engine()
         result = engine.recommend(
             ph=req.ph, temperature=req.temperature, rainfall=req.rainfall,
             nitrogen=req.nitrogen, phosphorus=req.phosphorus,
@@ -848,6 +1046,100 @@ def quick_recommend(req: MultiAgentRecommendationRequest):
         return {"success": False, "error": str(e)}
 
 
+MAX_BATCH_PLOTS = 100_000
+# Generous per-plot allowance; refuses oversized bodies before reading them
+MAX_BATCH_BYTES = MAX_BATCH_PLOTS * 1024
+
+
+def _too_many_plots():
+    return HTTPException(status_code=413, detail=f"At most {MAX_BATCH_PLOTS:,} plots per batch")
+
+
+def _read_plot_csv(data: bytes):
+    # One row past the limit is enough to know the batch is too big
+    plots = pd.read_csv(io.BytesIO(data), nrows=MAX_BATCH_PLOTS + 1)
+    if len(plots) > MAX_BATCH_PLOTS:
+        raise _too_many_plots()
+    return plots
+
+
+async def _read_batch_plots(request: Request):
+    """Parse a batch body (CSV upload, text/csv or JSON) into a DataFrame."""
+    content_type = request.headers.get("content-type", "")
+    if int(request.headers.get("content-length") or 0) > MAX_BATCH_BYTES:
+        raise _too_many_plots()
+    crop_preference = None
+    try:
+        if content_type.startswith("multipart/form-data"):
+            form = await request.form()
+            upload = form.get("file")
+            if upload is None:
+                raise HTTPException(status_code=400, detail="Missing 'file' field with the plot CSV")
+            plots = _read_plot_csv(await upload.read())
+            crop_preference = form.get("crop_preference") or None
+        elif "csv" in content_type:
+            plots = _read_plot_csv(await request.body())
+        else:
+            payload = await request.json()
+            if isinstance(payload, dict):
+                crop_preference = payload.get("crop_preference")
+                payload = payload.get("plots", [])
+            if not isinstance(payload, list):
+                raise HTTPException(status_code=400, detail="Expected a list of plots or {\"plots\": [...]}")
+            if len(payload) > MAX_BATCH_PLOTS:
+                raise _too_many_plots()
+            plots = pd.DataFrame(payload)
+    except (pd.errors.ParserError, pd.errors.EmptyDataError, ValueError) as e:
+        # Malformed CSV, or a JSON body that doesn't decode (JSONDecodeError
+        # and UnicodeDecodeError are ValueErrors) — the client's fault
+        raise HTTPException(status_code=400, detail=f"Could not parse plots: {e}")
+    plots.columns = [str(c).strip().lower() for c in plots.columns]
+    return plots, crop_preference
+
+
+@app.post("/api/quick_recommend/batch")
+async def quick_recommend_batch(request: Request, comparative: bool = False):
+    """
+    Batch variant of /api/quick_recommend for FPOs and extension officers.
+    Accepts a soil-test CSV (multipart 'file' or text/csv body) or JSON
+    (a list of plots, or {"plots": [...], "crop_preference": ...}) and
+    streams one NDJSON line per plot, in input order, as chunks are scored.
+    A plot with a non-numeric value gets a ``success: false`` line of its
+    own. ``?comparative=true`` adds the per-category comparison block.
+    """
+    if not HAS_ML:
+        raise HTTPException(status_code=503, detail="pandas is required for batch recommendations")
+    plots, crop_preference = await _read_batch_plots(request)
+    try:
+        # Warm-up can take a while; wait for it off the event loop
+        if engine_registry.is_ready:
+            engine = engine_registry.get_engine()
+        else:
+            engine = await run_in_threadpool(engine_registry.get_engine)
+    except RuntimeError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    plot_ids = plots["plot_id"].tolist() if "plot_id" in plots.columns else None
+
+    def stream():
+        row = 0
+        try:
+            for result in engine.recommend_batch(
+                    plots, crop_preference=crop_preference, comparative=comparative):
+                if "error" in result:
+                    line = {"row": row, "success": False, "error": result["error"]}
+                else:
+                    line = {"row": row, "success": True, "recommendation": result}
+                if plot_ids is not None:
+                    line["plot_id"] = plot_ids[row]
+                yield json.dumps(line, default=str) + "\n"
+                row += 1
+        except Exception as e:
+            print(f"Error in quick_recommend_batch: {e}")
+            yield json.dumps({"row": row, "success": False, "error": str(e)}) + "\n"
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+
 @app.post("/recommendation")
 def get_recommendation(req: RecommendationRequest):
     result = run_agent_collaboration(land_size=req.land_size, soil_type=req.soil_type, crop_preference=req.crop_preference)
@@ -908,22 +1200,28 @@ def _wmo_desc(code: int) -> str:
 
 
 # Weather API endpoint - REAL weather data via Open-Meteo (free, no key)
+def _fetch_open_meteo(lat: float, lon: float) -> Dict[str, Any]:
+    """Single call gets both current + 7-day forecast."""
+    params = {
+        "latitude": lat,
+        "longitude": lon,
+        "current": "temperature_2m,relative_humidity_2m,apparent_temperature,weather_code,wind_speed_10m,surface_pressure,cloud_cover",
+        "daily": "temperature_2m_max,temperature_2m_min,precipitation_sum,weather_code,relative_humidity_2m_mean",
+        "timezone": "auto",
+        "forecast_days": 7,
+    }
+    resp = requests.get(OPEN_METEO_FORECAST, params=params, timeout=12)
+    resp.raise_for_status()
+    return resp.json()
+
+
 @app.post("/weather")
 def get_weather(req: WeatherRequest):
     """Get real weather data from Open-Meteo API (free, no API key needed)"""
     try:
-        # Single call gets both current + 7-day forecast
-        params = {
-            "latitude": req.lat,
-            "longitude": req.lon,
-            "current": "temperature_2m,relative_humidity_2m,apparent_temperature,weather_code,wind_speed_10m,surface_pressure,cloud_cover",
-            "daily": "temperature_2m_max,temperature_2m_min,precipitation_sum,weather_code,relative_humidity_2m_mean",
-            "timezone": "auto",
-            "forecast_days": 7,
-        }
-        resp = requests.get(OPEN_METEO_FORECAST, params=params, timeout=12)
-        resp.raise_for_status()
-        data = resp.json()
+        # A burst of requests for the same spot shares one upstream fetch
+        data = _weather_flight.do((round(req.lat, 4), round(req.lon, 4)),
+                                  _fetch_open_meteo, req.lat, req.lon)
 
         cur = data.get("current", {})
         daily = data.get("daily", {})
@@ -2141,6 +2439,40 @@ Return JSON:
     except Exception as e:
         return JSONResponse(status_code=500, content={"detail": f"Insight generation failed: {str(e)}"})
 
+@app.get("/health")
+def health():
+    """Liveness probe — the process is up and serving requests."""
+    return {"status": "ok"}
+
+
+@app.get("/health/llm")
+def llm_health():
+    """LLM client metrics — HTTP pool counters, response-cache hit/miss and
+    circuit-breaker state (``open`` means agents are serving fallbacks)."""
+    try:
+        from models.llm_config import get_http_stats
+        from models.llm_cache import get_cache
+        from models.circuit_breaker import get_breaker
+    except ImportError as e:
+        return JSONResponse(status_code=503, content={"detail": f"LLM client unavailable: {e}"})
+    cache = get_cache()
+    breaker = get_breaker()
+    return {
+        "http": get_http_stats(),
+        "cache": cache.stats() if cache else {"enabled": False},
+        "circuit_breaker": breaker.stats() if breaker else {"enabled": False},
+    }
+
+
+@app.get("/health/ready")
+def readiness():
+    """Readiness probe — 200 only once the engine registry is warm."""
+    status = engine_registry.status()
+    if not status["ready"]:
+        return JSONResponse(status_code=503, content=status)
+    return status
+
+
 @app.get("/")
 def root():
     """Serve frontend index.html if it exists, else API info"""
@@ -2152,6 +2484,8 @@ def root():
         "message": "Sustainable Farming AI API v3.0",
         "endpoints": {
             "auth": ["/signup", "/login"],
+            "health": ["/health", "/health/ready", "/health/llm"],
+            "engine": ["/api/quick_recommend", "/api/quick_recommend/batch"],
             "farming": ["/recommendation", "/crop_rotation", "/fertilizer", "/soil_analysis"],
             "weather": ["/weather", "/pest_prediction"],
             "sustainability": ["/sustainability", "/sustainability/scores"],
@@ -6,26 +6,34 @@ The brain of the agentic AI system. Uses a HYBRID architecture:
   Layer A — AgriSmart Custom Engine (ML models + RAG KB + custom algorithm) → PRIMARY
   Layer B — Multi-Agent LLM Reasoning (5 specialist agents via Groq) → VALIDATION & ENRICHMENT
 
-Flow:
+Flow (a dependency graph — see CentralCoordinator._pipeline):
   1. Custom Engine generates data-driven recommendation (instant, offline-capable) — THIS PICKS THE CROP
-  2. FarmerAdvisor validates/enriches via LLM (does NOT override engine)
-  3. 4 specialist agents analyse the engine's crop in parallel (market, weather, sustainability, pest)
-  4. LLM Synthesis merges custom engine + agent insights for final report
+  2. FarmerAdvisor validates/enriches via LLM (does NOT override engine), concurrently with
+  3. 4 specialist agents analysing the engine's crop (market, weather, sustainability, pest)
+  4. LLM Synthesis merges custom engine + agent insights for final report once all agents settle
 
 The custom engine is ALWAYS the primary recommendation source.
 Groq API agents validate, enrich, and provide detailed analysis — they do NOT pick the crop.
 """
 
+import asyncio
 import os
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from typing import Dict, List, Optional
+from concurrent import futures
+from datetime import datetime
+from typing import AsyncIterator, Dict, List, Optional, Tuple
 
 from models.farmer_advisor import FarmerAdvisor
 from models.market_Researcher import MarketResearcher
 from models.weather_Analyst import WeatherAnalyst
 from models.sustainability_Expert import SustainabilityExpert
 from models.pest_disease_predictor import PestDiseasePredictor
-from models.llm_config import call_gemini
+from models.llm_config import acall_gemini, call_gemini
+from models.input_quantizer import quantize_inputs
+from models import deadline, prompt_reference
+from models.deadline import deadline_scope
+from models.request_scope import request_scope
+from models.specialist_panel import PANEL_ENABLED, SpecialistPanel
+from models.stage_graph import Stage, StageGraph
 
 # Import custom engine (the novel component)
 try:
@@ -67,6 +75,18 @@ Respond with a JSON object:
 }"""
 
 
+SPECIALISTS = ("market", "weather", "sustainability", "pest")
+
+# Stages that generate_recommendation_stream reports as they settle
+# ("crop" settles right after the engine, so it carries the engine's answer)
+STREAMED_STAGES = ("crop", "farmer") + SPECIALISTS + ("synthesis",)
+
+# Share of the *remaining* budget each agent stage may use; synthesis gets the rest
+STAGE_SHARES = {"agents": 1 / 2}
+# Extra wait for agents to hand back their fallback once their calls are cut
+STAGE_GRACE_S = 0.25
+
+
 class CentralCoordinator:
     """Orchestrates all five AI agents with parallel execution and LLM synthesis.
 
@@ -76,9 +96,19 @@ class CentralCoordinator:
             soil_ph=6.5, soil_moisture=65, temperature=28,
             rainfall=120, fertilizer=80, pesticide=2.0,
             crop_yield=3.5, land_size=1.0, city_name='Pune')
+
+        # or, from a running event loop:
+        result = await coordinator.generate_recommendation_async(...)
     """
 
-    def __init__(self, db_path: str = None):
+    def __init__(self, db_path: str = None, engine=None,
+                 panel_mode: Optional[bool] = None, build_engine: bool = True):
+        """``engine`` lets a long-lived host (e.g. the FastAPI registry) share
+        one warm AgriSmartEngine instead of building a new one here;
+        ``build_engine=False`` skips building one when the host already
+        knows the build fails.
+        ``panel_mode`` asks the 4 specialists in one fused LLM call
+        (default: AGRISMART_PANEL_MODE)."""
         self.db_path = db_path or os.path.join(
             os.path.dirname(__file__), "..", "database", "farming.db")
 
@@ -88,10 +118,14 @@ class CentralCoordinator:
         self.weather_analyst = WeatherAnalyst(self.db_path)
         self.sustainability_expert = SustainabilityExpert(self.db_path)
         self.pest_predictor = PestDiseasePredictor()
+        self.panel_mode = PANEL_ENABLED if panel_mode is None else panel_mode
+        self.panel = SpecialistPanel(
+            self.market_researcher, self.weather_analyst,
+            self.sustainability_expert, self.pest_predictor)
 
         # Initialise custom engine (novel hybrid layer)
-        self.custom_engine = None
-        if HAS_CUSTOM_ENGINE:
+        self.custom_engine = engine
+        if self.custom_engine is None and HAS_CUSTOM_ENGINE and build_engine:
             try:
                 self.custom_engine = AgriSmartEngine()
             except Exception as e:
@@ -108,161 +142,496 @@ class CentralCoordinator:
             temperature: float = 25, rainfall: float = 100,
             fertilizer: float = 80, pesticide: float = 2.0,
             crop_yield: float = 3.0, land_size: float = 1.0,
-            city_name: str = None, crop_preference: str = None) -> Dict:
+            city_name: str = None, crop_preference: str = None,
+            deadline_s: Optional[float] = None) -> Dict:
         """Generate a comprehensive multi-agent recommendation.
 
-        Flow:
-          1. FarmerAdvisor → crop recommendation (LLM call #1)
-          2. 4 specialists in parallel → analyse recommended crop (LLM calls #2-5)
-          3. Gemini synthesis → unified recommendation (LLM call #6)
+        Flow (see ``_pipeline``):
+          0. Custom engine → primary crop
+          1-2. FarmerAdvisor + 4 specialists concurrently (LLM calls #1-5)
+          3. Gemini synthesis once all agents settle (LLM call #6)
+
+        ``deadline_s`` bounds the whole request: each agent gets a share of
+        the remaining budget and every LLM call ``min(own timeout, remaining)``.
+        When time runs out the engine's result is returned with whatever
+        agent results finished, marked ``"Partial": True``.
+        """
+        with request_scope() as scope, deadline_scope(deadline_s) as budget:
+            graph = self._pipeline(
+                soil_ph, soil_moisture, temperature, rainfall, fertilizer,
+                pesticide, crop_yield, land_size, city_name, crop_preference,
+            )
+            results, errors, timed_out = graph.run()
+            result = self._collect(
+                results, errors, timed_out, budget,
+                soil_ph, soil_moisture, temperature, rainfall, fertilizer,
+            )
+            result["Upstream Calls"] = scope.stats()
+            return result
+
+    async def generate_recommendation_async(
+            self, soil_ph: float = 6.5, soil_moisture: float = 60,
+            temperature: float = 25, rainfall: float = 100,
+            fertilizer: float = 80, pesticide: float = 2.0,
+            crop_yield: float = 3.0, land_size: float = 1.0,
+            city_name: str = None, crop_preference: str = None,
+            deadline_s: Optional[float] = None) -> Dict:
+        """Async generate_recommendation — same graph, deadline and result dict.
+
+        LLM calls are awaited on the running event loop, so concurrent
+        recommendations multiplex on one loop instead of each holding a
+        thread pool. Only the CPU-bound engine and the optional
+        live-weather lookup run in worker threads.
+        """
+        with request_scope() as scope, deadline_scope(deadline_s) as budget:
+            graph = self._pipeline(
+                soil_ph, soil_moisture, temperature, rainfall, fertilizer,
+                pesticide, crop_yield, land_size, city_name, crop_preference,
+            )
+            results, errors, timed_out = await graph.run_async()
+            result = self._collect(
+                results, errors, timed_out, budget,
+                soil_ph, soil_moisture, temperature, rainfall, fertilizer,
+            )
+            result["Upstream Calls"] = scope.stats()
+            return result
+
+    async def generate_recommendation_stream(
+            self, soil_ph: float = 6.5, soil_moisture: float = 60,
+            temperature: float = 25, rainfall: float = 100,
+            fertilizer: float = 80, pesticide: float = 2.0,
+            crop_yield: float = 3.0, land_size: float = 1.0,
+            city_name: str = None, crop_preference: str = None,
+            deadline_s: Optional[float] = None) -> AsyncIterator[Tuple[str, Dict]]:
+        """Async generate_recommendation that reports progress as it goes.
+
+        Yields ``(stage, result)`` as each of STREAMED_STAGES settles —
+        ``"crop"`` first, carrying the engine's answer within milliseconds —
+        where ``result`` is the result dict built from the stages settled
+        so far (defaults for the rest). Ends with ``("complete", result)``,
+        the same dict generate_recommendation_async returns. Stages that
+        fail or time out are not reported; the final result covers them.
+        Closing the generator early cancels the agents still running.
+        """
+        queue: asyncio.Queue = asyncio.Queue()
+        done = object()
+
+        async def produce():
+            settled: Dict = {}
+            held: List[str] = []
+
+            with request_scope() as scope, deadline_scope(deadline_s) as budget:
+                def on_settle(name, stage_result):
+                    if stage_result is None:
+                        return
+                    settled[name] = stage_result
+                    if name in STREAMED_STAGES:
+                        held.append(name)
+                    if "crop" not in settled:
+                        return          # nothing useful to show before the crop
+                    while held:
+                        queue.put_nowait((held.pop(0), self._collect(
+                            settled, {}, [], budget,
+                            soil_ph, soil_moisture, temperature, rainfall, fertilizer,
+                            snapshot=True)))
+
+                graph = self._pipeline(
+                    soil_ph, soil_moisture, temperature, rainfall, fertilizer,
+                    pesticide, crop_yield, land_size, city_name, crop_preference,
+                )
+                results, errors, timed_out = await graph.run_async(on_settle)
+                result = self._collect(
+                    results, errors, timed_out, budget,
+                    soil_ph, soil_moisture, temperature, rainfall, fertilizer,
+                )
+                result["Upstream Calls"] = scope.stats()
+                queue.put_nowait(("complete", result))
+
+        producer = asyncio.ensure_future(produce())
+        producer.add_done_callback(lambda _: queue.put_nowait(done))
+        try:
+            while True:
+                item = await queue.get()
+                if item is done:
+                    break
+                yield item
+            await producer                  # re-raise a pipeline error
+        finally:
+            producer.cancel()
+
+    # ──────────────────────────────────────────────────────────────────
+    # Dependency graph (shared by the sync and async flows)
+    # ──────────────────────────────────────────────────────────────────
+
+    def _pipeline(self, soil_ph, soil_moisture, temperature, rainfall, fertilizer,
+                  pesticide, crop_yield, land_size, city_name,
+                  crop_preference) -> StageGraph:
+        """The recommendation as stages with declared inputs:
+
+            engine ─► crop ─► market, weather, sustainability, pest ─┐
+               └────► farmer ────────────────────────────────────┴─► synthesis
+            live (city weather, independent)
+
+        FarmerAdvisor only validates the engine's pick, so it is off the
+        critical path and runs alongside the specialists. The engine's
+        shortlist (``_candidates``) prunes the reference tables in the
+        FarmerAdvisor and MarketResearcher prompts.
+
+        In panel mode one ``panel`` stage asks all four specialists in a
+        single LLM call and each specialist stage just hands out its section
+        — on the async path as soon as that section has streamed in.
         """
+        farmer_kwargs = self._farmer_kwargs(
+            soil_ph, temperature, rainfall, soil_moisture, fertilizer)
+        share = STAGE_SHARES["agents"]
+
+        def calls(crop: str, engine) -> Dict[str, tuple]:
+            return self._specialist_calls(
+                crop, soil_ph, soil_moisture, temperature, rainfall,
+                fertilizer, pesticide, crop_yield, land_size,
+                self._candidates(engine),
+            )
+
+        def specialist(name: str) -> Stage:
+            def run(engine, crop):
+                fn, _, kwargs = calls(crop, engine)[name]
+                return fn(**kwargs)
+
+            async def arun(engine, crop):
+                _, afn, kwargs = calls(crop, engine)[name]
+                return await afn(**kwargs)
+
+            return Stage(name, run, ("engine", "crop"), arun, share)
 
+        # Panel sections are handed out through futures, not the panel
+        # stage's result, so a streamed section settles before the rest
+        sections = {name: futures.Future() for name in SPECIALISTS}
+
+        def hand_out(name: str, result: Dict):
+            if not sections[name].done():
+                sections[name].set_result(result)
+
+        def settle_sections():
+            for future in sections.values():
+                if not future.done():
+                    future.set_exception(LookupError("specialist panel gave no result"))
+
+        def panel(engine, crop):
+            try:
+                results = self.panel.run(calls(crop, engine))
+                for name, result in results.items():
+                    hand_out(name, result)
+                return results
+            finally:
+                settle_sections()
+
+        async def apanel(engine, crop):
+            try:
+                return await self.panel.run_async(calls(crop, engine), on_section=hand_out)
+            finally:
+                settle_sections()
+
+        def section(name: str) -> Stage:
+            def pick(engine, crop):
+                return sections[name].result()
+
+            async def apick(engine, crop):
+                return await asyncio.wrap_future(sections[name])
+
+            return Stage(name, pick, ("engine", "crop"), apick, share)
+
+        def farmer(engine):
+            return self.farmer_advisor.recommend_detailed(
+                **farmer_kwargs, candidates=self._candidates(engine))
+
+        async def afarmer(engine):
+            return await self.farmer_advisor.recommend_detailed_async(
+                **farmer_kwargs, candidates=self._candidates(engine))
+
+        # ── Step 0 → primary crop ───────────────────────────────────
+        def engine():
+            return self._run_engine(
+                soil_ph, temperature, rainfall, fertilizer,
+                soil_moisture, land_size, crop_preference,
+            )
+
+        def crop(engine):
+            engine_crop = engine[1] if engine else None
+            if engine_crop:
+                return self._resolve_crop(engine_crop, None)
+            # Engine could not pick: ask FarmerAdvisor — coalesces with the
+            # farmer stage's identical in-flight LLM call (single-flight)
+            try:
+                farmer_result = self.farmer_advisor.recommend_detailed(**farmer_kwargs)
+            except Exception:
+                farmer_result = None
+            return self._resolve_crop(None, farmer_result)
+
+        async def acrop(engine):
+            engine_crop = engine[1] if engine else None
+            if engine_crop:
+                return self._resolve_crop(engine_crop, None)
+            try:
+                farmer_result = await self.farmer_advisor.recommend_detailed_async(**farmer_kwargs)
+            except Exception:
+                farmer_result = None
+            return self._resolve_crop(None, farmer_result)
+
+        # ── Step 3: LLM Synthesis — unify all agent outputs ─────────
+        def agent_inputs(agents: Dict) -> Dict[str, Dict]:
+            return {name: result for name, result in agents.items() if result is not None}
+
+        def synthesis(crop, farmer, **agents):
+            if deadline.expired():
+                deadline.note_cut_short("synthesis")
+                return None
+            print("\n📡 Step 3: Synthesising all agent analyses with LLM...")
+            return self._synthesise_with_llm(
+                crop, farmer or {"alternatives": []}, agent_inputs(agents),
+                soil_ph, temperature, rainfall, soil_moisture,
+            )
+
+        async def asynthesis(crop, farmer, **agents):
+            if deadline.expired():
+                deadline.note_cut_short("synthesis")
+                return None
+            print("\n📡 Step 3: Synthesising all agent analyses with LLM...")
+            return await self._synthesise_with_llm_async(
+                crop, farmer or {"alternatives": []}, agent_inputs(agents),
+                soil_ph, temperature, rainfall, soil_moisture,
+            )
+
+        print("\n📡 Agents: FarmerAdvisor + 4 specialists run concurrently once the engine picks the crop"
+              + (" (specialists as one panel call)..." if self.panel_mode else "..."))
+        stages = [
+            Stage("engine", engine),
+            Stage("crop", crop, ("engine",), acrop),
+            Stage("farmer", farmer, ("engine",), afarmer, share),
+            *(([Stage("panel", panel, ("engine", "crop"), apanel, share)]
+               + [section(name) for name in SPECIALISTS]) if self.panel_mode
+              else [specialist(name) for name in SPECIALISTS]),
+            Stage("synthesis", synthesis, ("crop", "farmer") + SPECIALISTS, asynthesis),
+        ]
+        # ── Step 4: Live Weather (optional, independent) ─────────────
+        if city_name:
+            stages.append(Stage("live", lambda: self.weather_analyst.get_live_weather(city_name)))
+        return StageGraph(stages, grace=STAGE_GRACE_S)
+
+    def _collect(self, results, errors, timed_out, budget,
+                 soil_ph, soil_moisture, temperature, rainfall, fertilizer,
+                 snapshot: bool = False) -> Dict:
+        """Turn the settled stages into the result dict.
+
+        ``snapshot`` builds it mid-flight (for streaming): agents still
+        running get defaults, and nothing is logged or warned about.
+        """
         warnings: List[str] = []
+        custom_result, engine_crop = results.get("engine") or (None, None)
+
+        farmer_result = results.get("farmer")
+        if farmer_result is None and snapshot:
+            farmer_result = {"alternatives": [], "error": "still running"}
+        elif farmer_result is None:
+            farmer_result = self._farmer_error(
+                errors.get("farmer") or "deadline reached", warnings)
+        recommended_crop = results.get("crop") or self._resolve_crop(engine_crop, farmer_result)
+        if not snapshot:
+            self._check_agreement(engine_crop, farmer_result, warnings)
+
+        agent_results: Dict[str, Dict] = {}
+        for agent_name in SPECIALISTS:
+            if agent_name in results:
+                agent_results[agent_name] = results[agent_name]
+                if not snapshot:
+                    self._log_agent_result(agent_name, results[agent_name])
+            elif agent_name in errors:
+                warnings.append(f"{agent_name} agent error: {errors[agent_name]}")
+                print(f"   ❌ {agent_name}: {errors[agent_name]}")
+
+        # Summary text from the pest stage's result — not a second LLM call
+        pest_advice = (self.pest_predictor._summary_text(agent_results["pest"], recommended_crop)
+                       if "pest" in agent_results else "")
+
+        result = self._assemble(
+            recommended_crop, custom_result, farmer_result, agent_results,
+            pest_advice, results.get("synthesis"),
+            results.get("live"), warnings,
+            soil_ph, soil_moisture, temperature, rainfall, fertilizer,
+            log=not snapshot,
+        )
+        return result if snapshot else self._mark_deadline(result, budget, timed_out)
 
-        # ── Step 0: Custom Engine — instant data-driven analysis ─────
+    # ──────────────────────────────────────────────────────────────────
+    # Pipeline steps (shared by the sync and async flows)
+    # ──────────────────────────────────────────────────────────────────
+
+    def _run_engine(self, soil_ph, temperature, rainfall, fertilizer,
+                    soil_moisture, land_size, crop_preference):
+        """Step 0 → (custom_result, engine_crop); both None if unavailable."""
         # The custom engine is the PRIMARY recommendation source.
         # It uses ML models + Knowledge Base RAG + agronomic algorithm.
-        custom_result = None
-        engine_crop = None
-        if self.custom_engine:
-            print("\n🧠 Step 0: AgriSmart Custom Engine (ML + RAG + Algorithm) — PRIMARY...")
-            try:
-                custom_result = self.custom_engine.recommend(
-                    ph=soil_ph, temperature=temperature, rainfall=rainfall,
-                    nitrogen=fertilizer, phosphorus=30, potassium=30,
-                    humidity=soil_moisture, land_size=land_size,
-                    use_llm=False,  # LLM used separately by agents
-                    crop_preference=crop_preference,
-                )
-                engine_crop = custom_result['recommended_crop']
-                print(f"   → Custom Engine PRIMARY: {engine_crop} "
-                      f"(score: {custom_result['final_score']}, "
-                      f"confidence: {custom_result['confidence']}%, "
-                      f"data points: {custom_result['data_points_analysed']:,})")
-            except Exception as e:
-                print(f"   ⚠️ Custom engine error: {e}")
-
-        # ── Step 1: Farmer Advisor — validate / enrich the engine's pick ──
-        # Groq LLM validates the custom engine's recommendation and provides
-        # reasoning, advice, and alternatives. It does NOT override the engine.
-        print("\n📡 Step 1: FarmerAdvisor validating engine recommendation...")
+        if not self.custom_engine:
+            return None, None
+        print("\n🧠 Step 0: AgriSmart Custom Engine (ML + RAG + Algorithm) — PRIMARY...")
         try:
-            farmer_result = self.farmer_advisor.recommend_detailed(
-                ph=soil_ph, temperature=temperature,
-                rainfall=rainfall, humidity=soil_moisture,
+            custom_result = self.custom_engine.recommend(
+                ph=soil_ph, temperature=temperature, rainfall=rainfall,
                 nitrogen=fertilizer, phosphorus=30, potassium=30,
+                humidity=soil_moisture, land_size=land_size,
+                use_llm=False,  # LLM used separately by agents
+                crop_preference=crop_preference,
             )
-            farmer_llm_crop = farmer_result["crop"]
-            farmer_score = farmer_result["score"]
-            farmer_confidence = farmer_result["confidence"]
-            farmer_advice = farmer_result.get("advice", "")
-            farmer_reasoning = farmer_result.get("reasoning", "")
+            engine_crop = custom_result['recommended_crop']
+            print(f"   → Custom Engine PRIMARY: {engine_crop} "
+                  f"(score: {custom_result['final_score']}, "
+                  f"confidence: {custom_result['confidence']}%, "
+                  f"data points: {custom_result['data_points_analysed']:,})")
+            return custom_result, engine_crop
         except Exception as e:
-            warnings.append(f"FarmerAdvisor error: {e}")
-            farmer_llm_crop = None
-            farmer_score = 5.0
-            farmer_confidence = 50.0
-            farmer_advice = "Default recommendation due to error."
-            farmer_reasoning = str(e)
-            farmer_result = {"alternatives": []}
+            print(f"   ⚠️ Custom engine error: {e}")
+            return None, None
+
+    @staticmethod
+    def _candidates(engine) -> Optional[List[str]]:
+        """The engine's pick + its top-k runners-up (None without an engine pick)."""
+        custom_result, engine_crop = engine or (None, None)
+        if not engine_crop:
+            return None
+        runners_up = [a["crop"] for a in (custom_result or {}).get("alternatives", [])]
+        return [engine_crop] + runners_up[:prompt_reference.TOP_K]
+
+    @staticmethod
+    def _farmer_kwargs(soil_ph, temperature, rainfall, soil_moisture, fertilizer) -> Dict:
+        return dict(
+            ph=soil_ph, temperature=temperature,
+            rainfall=rainfall, humidity=soil_moisture,
+            nitrogen=fertilizer, phosphorus=30, potassium=30,
+        )
 
-        # PRIMARY CROP = custom engine's pick (or fallback to Farmer Advisor)
+    @staticmethod
+    def _farmer_error(error: Exception, warnings: List[str]) -> Dict:
+        warnings.append(f"FarmerAdvisor error: {error}")
+        return {"alternatives": [], "error": str(error)}
+
+    @staticmethod
+    def _resolve_crop(engine_crop, farmer_result: Optional[Dict]) -> str:
+        """PRIMARY CROP = custom engine's pick (or fallback to Farmer Advisor)."""
         if engine_crop:
             recommended_crop = engine_crop
-            # If Farmer Advisor disagrees, note the conflict for synthesis
-            if farmer_llm_crop and farmer_llm_crop.lower() != engine_crop.lower():
-                warnings.append(
-                    f"Agent disagreement: Custom Engine → {engine_crop}, "
-                    f"FarmerAdvisor → {farmer_llm_crop} (engine takes priority)"
-                )
-                print(f"   ⚡ Conflict: Engine={engine_crop}, Farmer={farmer_llm_crop} → using engine")
-            else:
-                print(f"   ✅ Agreement: both recommend {engine_crop}")
         else:
             # Fallback: engine failed, use Farmer Advisor's pick
-            recommended_crop = farmer_llm_crop or "Wheat"
+            recommended_crop = (farmer_result or {}).get("crop") or "Wheat"
             print(f"   ⚠️ Fallback to FarmerAdvisor: {recommended_crop}")
 
         print(f"   → FINAL PRIMARY CROP: {recommended_crop} (source: {'Custom Engine' if engine_crop else 'Farmer Advisor'})")
+        return recommended_crop
 
-        # ── Step 2: Run 4 specialist agents IN PARALLEL ──────────────
-        # Agents ANALYZE the engine's recommended crop (market, weather, etc.)
-        # They don't pick the crop — they validate and enrich.
-        print(f"\n📡 Step 2: Running 4 specialist agents in parallel for '{recommended_crop}'...")
-
-        market_result = {}
-        weather_result = {}
-        sust_result = {}
-        pest_result = {}
-        pest_advice = ""
-
-        def run_market():
-            return self.market_researcher.forecast_market_trends(
-                crop=recommended_crop,
-                area=land_size,
-                production=crop_yield * land_size,
-                year=__import__("datetime").datetime.now().year,
-            )
-
-        def run_weather():
-            return self.weather_analyst.analyze_weather_impact(
-                temperature=temperature,
-                rainfall=rainfall,
-                humidity=soil_moisture,
-                crop=recommended_crop,
-            )
-
-        def run_sustainability():
-            return self.sustainability_expert.assess_sustainability(
-                fertilizer_usage=fertilizer,
-                organic_matter=1.0,
-                ph=soil_ph,
-                nitrogen=fertilizer,
-                phosphorus=30,
-                pesticide_usage=pesticide * 30,
-                crop=recommended_crop,
-                land_size=land_size,
+    @staticmethod
+    def _check_agreement(engine_crop, farmer_result: Dict, warnings: List[str]):
+        """Note (for synthesis and the farmer) when FarmerAdvisor disagrees."""
+        # Groq LLM validates the custom engine's recommendation and provides
+        # reasoning, advice, and alternatives. It does NOT override the engine.
+        farmer_llm_crop = farmer_result.get("crop")
+        if not engine_crop:
+            return
+        if farmer_llm_crop and farmer_llm_crop.lower() != engine_crop.lower():
+            warnings.append(
+                f"Agent disagreement: Custom Engine → {engine_crop}, "
+                f"FarmerAdvisor → {farmer_llm_crop} (engine takes priority)"
             )
+            print(f"   ⚡ Conflict: Engine={engine_crop}, Farmer={farmer_llm_crop} → using engine")
+        else:
+            print(f"   ✅ Agreement: both recommend {engine_crop}")
 
-        def run_pest():
-            return self.pest_predictor.predict_detailed(
-                crop_type=recommended_crop,
-                soil_ph=soil_ph,
-                soil_moisture=soil_moisture,
-                temperature=temperature,
-                rainfall=rainfall,
-            )
+    def _specialist_calls(self, crop, soil_ph, soil_moisture, temperature,
+                          rainfall, fertilizer, pesticide, crop_yield,
+                          land_size, candidates=None) -> Dict[str, tuple]:
+        """name → (sync method, async method, kwargs) for the 4 specialists.
 
-        agent_tasks = {
-            "market": run_market,
-            "weather": run_weather,
-            "sustainability": run_sustainability,
-            "pest": run_pest,
+        Agents ANALYZE the engine's recommended crop (market, weather, etc.)
+        They don't pick the crop — they validate and enrich.
+        """
+        return {
+            "market": (
+                self.market_researcher.forecast_market_trends,
+                self.market_researcher.forecast_market_trends_async,
+                dict(crop=crop, area=land_size,
+                     production=crop_yield * land_size,
+                     year=datetime.now().year, candidates=candidates),
+            ),
+            "weather": (
+                self.weather_analyst.analyze_weather_impact,
+                self.weather_analyst.analyze_weather_impact_async,
+                dict(temperature=temperature, rainfall=rainfall,
+                     humidity=soil_moisture, crop=crop),
+            ),
+            "sustainability": (
+                self.sustainability_expert.assess_sustainability,
+                self.sustainability_expert.assess_sustainability_async,
+                dict(fertilizer_usage=fertilizer, organic_matter=1.0,
+                     ph=soil_ph, nitrogen=fertilizer, phosphorus=30,
+                     pesticide_usage=pesticide * 30, crop=crop,
+                     land_size=land_size),
+            ),
+            "pest": (
+                self.pest_predictor.predict_detailed,
+                self.pest_predictor.predict_detailed_async,
+                dict(crop_type=crop, soil_ph=soil_ph,
+                     soil_moisture=soil_moisture, temperature=temperature,
+                     rainfall=rainfall),
+            ),
         }
 
-        with ThreadPoolExecutor(max_workers=4) as executor:
-            futures = {executor.submit(fn): name
-                       for name, fn in agent_tasks.items()}
-
-            for future in as_completed(futures):
-                agent_name = futures[future]
-                try:
-                    result = future.result()
-                    if agent_name == "market":
-                        market_result = result
-                        print(f"   ✅ MarketResearcher: score={result.get('market_score')}, trend={result.get('price_trend')}")
-                    elif agent_name == "weather":
-                        weather_result = result
-                        print(f"   ✅ WeatherAnalyst: score={result.get('weather_score')}, risk={result.get('risk_level')}")
-                    elif agent_name == "sustainability":
-                        sust_result = result
-                        print(f"   ✅ SustainabilityExpert: score={result.get('sustainability_score')}, impact={result.get('environmental_impact')}")
-                    elif agent_name == "pest":
-                        pest_result = result
-                        print(f"   ✅ PestPredictor: risk={result.get('overall_risk')}, threats={len(result.get('threats', []))}")
-                except Exception as e:
-                    warnings.append(f"{agent_name} agent error: {e}")
-                    print(f"   ❌ {agent_name}: {e}")
+    @staticmethod
+    def _mark_deadline(result: Dict, budget, timed_out: List[str]) -> Dict:
+        """Attach the budget report; partial when any agent ran out of time."""
+        if budget is None:
+            return result
+        cut_short = [a for a in budget.cut_short if a not in timed_out]
+        partial = bool(timed_out or cut_short)
+        result["Partial"] = partial
+        result["Deadline"] = {
+            "budget_s": budget.budget,
+            "elapsed_s": round(budget.elapsed(), 2),
+            "timed_out": timed_out,      # no result — defaults used
+            "cut_short": cut_short,      # LLM call abandoned — agent used its fallback
+        }
+        if partial:
+            print(f"   ⏱️ Deadline {budget.budget}s reached — partial result "
+                  f"(timed out: {timed_out or 'none'}, cut short: {cut_short or 'none'})")
+        return result
+
+    @staticmethod
+    def _log_agent_result(agent_name: str, result: Dict):
+        if agent_name == "market":
+            print(f"   ✅ MarketResearcher: score={result.get('market_score')}, trend={result.get('price_trend')}")
+        elif agent_name == "weather":
+            print(f"   ✅ WeatherAnalyst: score={result.get('weather_score')}, risk={result.get('risk_level')}")
+        elif agent_name == "sustainability":
+            print(f"   ✅ SustainabilityExpert: score={result.get('sustainability_score')}, impact={result.get('environmental_impact')}")
+        elif agent_name == "pest":
+            print(f"   ✅ PestPredictor: risk={result.get('overall_risk')}, threats={len(result.get('threats', []))}")
+
+    def _assemble(self, recommended_crop, custom_result, farmer_result,
+                  agent_results, pest_advice, synthesis, live, warnings,
+                  soil_ph, soil_moisture, temperature, rainfall, fertilizer,
+                  log: bool = True) -> Dict:
+        """Steps 5-6: final score and the backward-compatible result dict."""
+        market_result = agent_results.get("market", {})
+        weather_result = agent_results.get("weather", {})
+        sust_result = agent_results.get("sustainability", {})
+        pest_result = agent_results.get("pest", {})
+
+        if "error" in farmer_result:
+            farmer_score = 5.0
+            farmer_confidence = 50.0
+            farmer_advice = "Default recommendation due to error."
+            farmer_reasoning = farmer_result["error"]
+        else:
+            farmer_score = farmer_result["score"]
+            farmer_confidence = farmer_result["confidence"]
+            farmer_advice = farmer_result.get("advice", "")
+            farmer_reasoning = farmer_result.get("reasoning", "")
 
         # Extract key values with defaults
         market_score = market_result.get("market_score", 5.0)
@@ -270,7 +639,6 @@ class CentralCoordinator:
         market_insights = market_result.get("insights", "")
 
         weather_score = weather_result.get("weather_score", 5.0)
-        weather_risk = weather_result.get("risk_level", "Unknown")
         weather_forecast = weather_result.get("forecast", "")
         weather_risks = weather_result.get("risks", [])
         if weather_risks and isinstance(weather_risks, list):
@@ -286,35 +654,9 @@ class CentralCoordinator:
             warnings.append(
                 f"Pest/Disease risk is {pest_overall_risk} for {recommended_crop}.")
 
-        # Build pest advice string
-        pest_advice = self.pest_predictor.predict(
-            crop_type=recommended_crop, soil_ph=soil_ph,
-            soil_moisture=soil_moisture, temperature=temperature,
-            rainfall=rainfall,
-        )
-
-        # ── Step 3: LLM Synthesis — unify all agent outputs ─────────
-        # Brief pause to respect Groq rate limits after parallel calls
-        import time as _time
-        _time.sleep(1.5)
-        print(f"\n📡 Step 3: Synthesising all agent analyses with LLM...")
-
-        synthesis = self._synthesise_with_llm(
-            recommended_crop, farmer_result,
-            market_result, weather_result,
-            sust_result, pest_result,
-            soil_ph, temperature, rainfall, soil_moisture,
-        )
-
-        # ── Step 4: Live Weather (optional) ──────────────────────────
         live_temp = temperature
-        if city_name:
-            try:
-                live = self.weather_analyst.get_live_weather(city_name)
-                if live:
-                    live_temp = live["temperature"]
-            except Exception:
-                pass
+        if live:
+            live_temp = live["temperature"]
 
         # ── Step 5: Compute Final Score ──────────────────────────────
         pest_score_val = self._pest_score(pest_overall_risk)
@@ -337,8 +679,9 @@ class CentralCoordinator:
                                             soil_ph, rainfall,
                                             soil_moisture, fertilizer))
 
-        print(f"\n🏁 Final Score: {round(final_score, 1)}/10 for {recommended_crop}")
-        if synthesis:
+        if log:
+            print(f"\n🏁 Final Score: {round(final_score, 1)}/10 for {recommended_crop}")
+        if log and synthesis:
             print(f"   Synthesis confidence: {synthesis.get('confidence_level', 'N/A')}")
 
         # ── Step 6: Build backward-compatible result dict ────────────
@@ -405,19 +748,24 @@ class CentralCoordinator:
     # LLM Synthesis
     # ──────────────────────────────────────────────────────────────────
 
-    def _synthesise_with_llm(self, crop, farmer_result,
-                             market_result, weather_result,
-                             sust_result, pest_result,
-                             soil_ph, temperature, rainfall,
-                             humidity) -> Optional[Dict]:
-        """Feed all agent outputs to Gemini for unified synthesis."""
+    def _synthesis_prompt(self, crop, farmer_result, agent_results,
+                          soil_ph, temperature, rainfall, humidity) -> str:
+        """Build the synthesis user prompt from all agent outputs."""
+        market_result = agent_results.get("market", {})
+        weather_result = agent_results.get("weather", {})
+        sust_result = agent_results.get("sustainability", {})
+        pest_result = agent_results.get("pest", {})
+        # Bucketed like the agents' inputs so repeat requests hit the LLM cache
+        farm = quantize_inputs("synthesis", dict(
+            soil_ph=soil_ph, temperature=temperature,
+            rainfall=rainfall, humidity=humidity))
 
-        user_prompt = f"""Synthesise these 5 specialist agent reports into a unified farming recommendation:
+        return f"""Synthesise these 5 specialist agent reports into a unified farming recommendation:
 
 RECOMMENDED CROP: {crop}
 
 FARM CONDITIONS:
-  pH: {soil_ph}, Temperature: {temperature}°C, Rainfall: {rainfall}mm, Humidity: {humidity}%
+  pH: {farm['soil_ph']}, Temperature: {farm['temperature']}°C, Rainfall: {farm['rainfall']}mm, Humidity: {farm['humidity']}%
 
 AGENT REPORT #1 — FarmerAdvisor (Crop Selection):
   Score: {farmer_result.get('score', 'N/A')}/10, Confidence: {farmer_result.get('confidence', 'N/A')}%
@@ -445,16 +793,42 @@ AGENT REPORT #5 — PestDiseasePredictor (Pest/Disease Risk):
 
 Synthesise all reports into a unified recommendation. Identify if agents agree or conflict, and provide a clear action plan."""
 
+    def _synthesise_with_llm(self, crop, farmer_result, agent_results,
+                             soil_ph, temperature, rainfall,
+                             humidity) -> Optional[Dict]:
+        """Feed all agent outputs to Gemini for unified synthesis."""
+        user_prompt = self._synthesis_prompt(
+            crop, farmer_result, agent_results,
+            soil_ph, temperature, rainfall, humidity,
+        )
         try:
             response = call_gemini(
                 SYNTHESIS_PROMPT, user_prompt,
                 temperature=0.3, max_retries=3, timeout=45,
+                agent="synthesis",
             )
             return response
         except Exception as e:
             print(f"⚠️ Synthesis LLM call failed: {e}")
             return None
 
+    async def _synthesise_with_llm_async(self, crop, farmer_result, agent_results,
+                                         soil_ph, temperature, rainfall,
+                                         humidity) -> Optional[Dict]:
+        user_prompt = self._synthesis_prompt(
+            crop, farmer_result, agent_results,
+            soil_ph, temperature, rainfall, humidity,
+        )
+        try:
+            return await acall_gemini(
+                SYNTHESIS_PROMPT, user_prompt,
+                temperature=0.3, max_retries=3, timeout=45,
+                agent="synthesis",
+            )
+        except Exception as e:
+            print(f"⚠️ Synthesis LLM call failed: {e}")
+            return None
+
     # ──────────────────────────────────────────────────────────────────
     # Helpers
     # ──────────────────────────────────────────────────────────────────
@@ -0,0 +1,238 @@
+"""
+circuit_breaker — Fast-fail the LLM layer while Groq is down
+============================================================
+Without a breaker, every agent call during an outage still runs
+``max_retries + 1`` attempts with back-off sleeps and long timeouts
+before falling back to its rule-based ``_fallback_*`` answer, and a
+recommendation makes six such calls.
+
+States:
+  • closed    — calls go through; outcomes fill a sliding window
+  • open      — calls are refused immediately (agents use their fallbacks)
+                until the cooldown has passed
+  • half_open — a limited number of probe calls go through; one success
+                closes the breaker, one failure re-opens it
+
+The breaker opens when, over the last ``window`` attempts (and at least
+``min_calls`` of them), the failure rate reaches ``failure_rate``. An
+authentication error or a missing API key opens it straight away.
+
+Environment variables (optional):
+  LLM_BREAKER               — "0" disables the breaker
+  LLM_BREAKER_WINDOW        — attempts in the sliding window (default 20)
+  LLM_BREAKER_MIN_CALLS     — attempts needed before the rate counts (default 5)
+  LLM_BREAKER_FAILURE_RATE  — failure fraction that opens it (default 0.5)
+  LLM_BREAKER_COOLDOWN      — seconds open before probing again (default 30)
+  LLM_BREAKER_PROBES        — concurrent half-open probe calls (default 1)
+"""
+
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, Optional
+
+
+BREAKER_ENABLED = os.getenv("LLM_BREAKER", "1") != "0"
+BREAKER_WINDOW = int(os.getenv("LLM_BREAKER_WINDOW", "20"))
+BREAKER_MIN_CALLS = int(os.getenv("LLM_BREAKER_MIN_CALLS", "5"))
+BREAKER_FAILURE_RATE = float(os.getenv("LLM_BREAKER_FAILURE_RATE", "0.5"))
+BREAKER_COOLDOWN = float(os.getenv("LLM_BREAKER_COOLDOWN", "30"))
+BREAKER_PROBES = int(os.getenv("LLM_BREAKER_PROBES", "1"))
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+
+class CircuitBreaker:
+    """Failure-rate circuit breaker with cooldown and half-open probes."""
+
+    def __init__(self, name: str = "llm", window: int = BREAKER_WINDOW,
+                 min_calls: int = BREAKER_MIN_CALLS,
+                 failure_rate: float = BREAKER_FAILURE_RATE,
+                 cooldown: float = BREAKER_COOLDOWN, probes: int = BREAKER_PROBES):
+        self.name = name
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.cooldown = cooldown
+        self.probes = max(1, probes)
+        self._lock = threading.Lock()
+        self._outcomes = deque(maxlen=window)     # True = failure
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._probes_out = 0
+        self._reason = ""
+        self._stats = {"allowed": 0, "rejected": 0, "successes": 0,
+                       "failures": 0, "opened": 0}
+
+    # ── State machine (caller holds self._lock) ───────────────────────
+
+    def _open(self, reason: str):
+        if self._state != OPEN:
+            self._stats["opened"] += 1
+            print(f"🔌 Circuit '{self.name}' OPEN for {self.cooldown:.0f}s — {reason}")
+        self._state = OPEN
+        self._opened_at = time.monotonic()
+        self._probes_out = 0
+        self._reason = reason
+
+    def _close(self):
+        if self._state != CLOSED:
+            print(f"✅ Circuit '{self.name}' closed — upstream recovered")
+        self._state = CLOSED
+        self._outcomes.clear()
+        self._probes_out = 0
+        self._reason = ""
+
+    def _current_state(self) -> str:
+        if self._state == OPEN and time.monotonic() - self._opened_at >= self.cooldown:
+            self._state = HALF_OPEN
+            self._probes_out = 0
+        return self._state
+
+    # ── Public API ────────────────────────────────────────────────────
+
+    def allow(self) -> bool:
+        """True if a call may go upstream now; False → use the fallback."""
+        with self._lock:
+            state = self._current_state()
+            if state == OPEN or (state == HALF_OPEN and self._probes_out >= self.probes):
+                self._stats["rejected"] += 1
+                return False
+            if state == HALF_OPEN:
+                self._probes_out += 1
+            self._stats["allowed"] += 1
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self._stats["successes"] += 1
+            if self._state == HALF_OPEN:
+                self._close()
+            else:
+                self._outcomes.append(False)
+
+    def record_failure(self, reason: str = "upstream failure"):
+        with self._lock:
+            self._stats["failures"] += 1
+            if self._state == HALF_OPEN:
+                self._open(f"probe failed: {reason}")
+                return
+            if self._state == OPEN:
+                return
+            self._outcomes.append(True)
+            n = len(self._outcomes)
+            rate = sum(self._outcomes) / n
+            if n >= self.min_calls and rate >= self.failure_rate:
+                self._open(f"{rate:.0%} of last {n} calls failed ({reason})")
+
+    def release(self):
+        """Neutral outcome (429, bad request) — frees a half-open probe slot."""
+        with self._lock:
+            if self._state == HALF_OPEN and self._probes_out:
+                self._probes_out -= 1
+
+    def trip(self, reason: str):
+        """Open immediately (bad credentials, no API key...)."""
+        with self._lock:
+            self._open(reason)
+
+    def reset(self):
+        with self._lock:
+            self._close()
+            for key in self._stats:
+                self._stats[key] = 0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            state = self._current_state()
+            stats = dict(self._stats)
+            n = len(self._outcomes)
+            stats.update({
+                "state": state,
+                "reason": self._reason,
+                "window_calls": n,
+                "window_failure_rate": round(sum(self._outcomes) / n, 3) if n else 0.0,
+                "retry_in_s": (round(max(0.0, self.cooldown - (time.monotonic() - self._opened_at)), 1)
+                               if state == OPEN else 0.0),
+            })
+        return stats
+
+
+_breaker: Optional[CircuitBreaker] = None
+_breaker_lock = threading.Lock()
+
+
+def get_breaker() -> Optional[CircuitBreaker]:
+    """The process-wide LLM breaker (None when disabled)."""
+    global _breaker
+    if not BREAKER_ENABLED:
+        return None
+    if _breaker is None:
+        with _breaker_lock:
+            if _breaker is None:
+                _breaker = CircuitBreaker()
+    return _breaker
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# Demo: six agent calls against a stand-in Groq that answers 503
+#   python -m models.circuit_breaker
+# ═══════════════════════════════════════════════════════════════════════════════
+
+if __name__ == "__main__":
+    import sys
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    from pathlib import Path
+    sys.path.insert(0, str(Path(__file__).parent.parent))
+
+    class _Down(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            body = b'{"error": "service unavailable"}'
+            self.send_response(503)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _Down)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    import models.circuit_breaker as circuit_breaker
+    from models import llm_config, rate_limiter
+    from models.market_Researcher import MarketResearcher
+    llm_config.GROQ_API_URL = f"http://127.0.0.1:{server.server_port}/v1/chat/completions"
+    rate_limiter.RATE_LIMIT_ENABLED = False
+
+    def six_calls() -> float:
+        start = time.perf_counter()
+        for agent in ("farmer", "market", "weather", "sustainability", "pest", "synthesis"):
+            llm_config.call_gemini("system", f"{agent} prompt", use_cache=False, agent=agent)
+        return time.perf_counter() - start
+
+    circuit_breaker.BREAKER_ENABLED = False
+    without = six_calls()
+    circuit_breaker.BREAKER_ENABLED = True
+    with_breaker = six_calls()
+
+    researcher = MarketResearcher()
+    start = time.perf_counter()
+    researcher.forecast_market_trends("Rice")
+    fallback_us = (time.perf_counter() - start) * 1e6
+
+    print("\n📊 Six LLM calls during an outage (stand-in answers HTTP 503)")
+    print(f"   without breaker: {without:.2f}s")
+    print(f"   with breaker:    {with_breaker:.2f}s  → {circuit_breaker.get_breaker().stats()}")
+    print(f"   MarketResearcher fallback while open: {fallback_us:.0f} µs")
+    server.shutdown()
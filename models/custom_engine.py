@@ -4,7 +4,7 @@ AgriSmart Hybrid Recommendation Engine (AHRE)
 A NOVEL multi-layer recommendation system that combines:
 
   Layer 1 — Trained ML Models (sklearn RandomForest on 296K records)
-  Layer 2 — Knowledge Base RAG (TF-IDF over real agricultural data)
+  Layer 2 — Knowledge Base RAG (k-NN over real agricultural data)
   Layer 3 — Custom Agronomic Scoring Algorithm (domain-specific)
   Layer 4 — LLM Enhancement (Groq/Llama — optional enrichment, NOT primary)
 
@@ -47,8 +47,9 @@ What makes this unique:
 
 import os
 import numpy as np
+import pandas as pd
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple
+from typing import Dict, Iterator, List, Optional, Tuple
 from datetime import datetime
 
 try:
@@ -119,6 +120,79 @@ def _category_of(crop_name: str) -> str:
     return "Other"
 
 
+# ═══════════════════════════════════════════════════════════════════════════════
+# Compiled Crop-Condition Matrix — CROP_OPTIMAL_CONDITIONS as NumPy arrays
+# Layer 3 scores every crop in one array expression instead of a Python loop,
+# so its cost stays flat as the crop catalogue grows.
+# ═══════════════════════════════════════════════════════════════════════════════
+
+# Row order of the low/high/margin matrices (and of the input vector)
+CONDITION_FEATURES = ("ph", "temp", "rain", "n", "p", "k")
+CONDITION_MARGINS = {"ph": 0.8, "temp": 5, "rain": 30, "n": 20, "p": 15, "k": 15}
+
+SEASON_BITS = {"kharif": 1, "rabi": 2, "zaid": 4}
+ALL_SEASONS_MASK = 1 | 2 | 4
+
+CATEGORY_NAMES = list(CROP_CATEGORIES) + ["Other"]
+
+CROP_NAMES = list(CROP_OPTIMAL_CONDITIONS)
+CROP_INDEX = {name: i for i, name in enumerate(CROP_NAMES)}
+
+COND_LOW = np.array(
+    [[CROP_OPTIMAL_CONDITIONS[c][f][0] for c in CROP_NAMES] for f in CONDITION_FEATURES],
+    dtype=float,
+)
+COND_HIGH = np.array(
+    [[CROP_OPTIMAL_CONDITIONS[c][f][1] for c in CROP_NAMES] for f in CONDITION_FEATURES],
+    dtype=float,
+)
+COND_MARGIN = np.array(
+    [[CONDITION_MARGINS[f]] * len(CROP_NAMES) for f in CONDITION_FEATURES],
+    dtype=float,
+)
+SEASON_MASK = np.array([
+    ALL_SEASONS_MASK if "all" in CROP_OPTIMAL_CONDITIONS[c]["season"]
+    else sum(SEASON_BITS.get(s, 0) for s in CROP_OPTIMAL_CONDITIONS[c]["season"])
+    for c in CROP_NAMES
+], dtype=np.int64)
+CATEGORY_IDS = np.array(
+    [CATEGORY_NAMES.index(_category_of(c)) for c in CROP_NAMES], dtype=np.int64
+)
+# Preference matching is by membership (a crop may sit in several categories)
+CATEGORY_MEMBERS = {
+    cat: np.array([c in members for c in CROP_NAMES], dtype=bool)
+    for cat, members in CROP_CATEGORIES.items()
+}
+
+
+# Batch input columns (order of the (N, 6) condition matrix) and the
+# defaults recommend() uses when a value is missing
+BATCH_COLUMNS = ("ph", "temperature", "rainfall", "nitrogen", "phosphorus", "potassium")
+BATCH_DEFAULTS = {
+    "ph": 6.5, "temperature": 25, "rainfall": 100,
+    "nitrogen": 80, "phosphorus": 30, "potassium": 30,
+}
+
+
+def _plain_number(value: float):
+    """An integral float as int, so explanations read "25°C" whether a
+    condition arrives as 25, 25.0 (JSON / pydantic) or a numpy float."""
+    return int(value) if float(value).is_integer() else float(value)
+
+
+def _range_scores(values, low, high, margin):
+    """Score how well values fit their optimal ranges (broadcasts over any shape).
+    Returns 0.0-1.0: 1.0 = inside [low, high], linear decay within ``margin``,
+    then a slower tail down to 0.0 = far out of range.
+    """
+    distance = np.maximum(np.maximum(low - values, values - high), 0.0)
+    safe_margin = np.where(margin > 0, margin, 1.0)
+    near = 1.0 - (distance / safe_margin) * 0.6
+    far = np.maximum(0.0, 0.4 - distance / np.where(margin > 0, margin * 3, 10.0))
+    within_margin = (margin > 0) & (distance <= margin)
+    return np.where(distance <= 0, 1.0, np.where(within_margin, near, far))
+
+
 # ═══════════════════════════════════════════════════════════════════════════════
 # The Custom Engine
 # ═══════════════════════════════════════════════════════════════════════════════
@@ -128,7 +202,7 @@ class AgriSmartEngine:
     Hybrid multi-layer crop recommendation engine.
 
     Layer 1: ML Model predictions  (sklearn, trained on 296K records)
-    Layer 2: Knowledge Base RAG    (TF-IDF retrieval from real data)
+    Layer 2: Knowledge Base RAG    (k-NN retrieval from real data)
     Layer 3: Agronomic Algorithm   (custom multi-criteria scoring)
     Layer 4: LLM Enhancement       (optional Groq/Llama enrichment)
 
@@ -140,7 +214,7 @@ class AgriSmartEngine:
         )
     """
 
-    def __init__(self):
+    def __init__(self, kb: Optional[AgriKnowledgeBase] = None):
         # Layer 1: ML models
         self.crop_classifier = None
         self.crop_scaler = None
@@ -153,8 +227,8 @@ class AgriSmartEngine:
         self.sust_scaler = None
         self._load_ml_models()
 
-        # Layer 2: Knowledge base
-        self.kb = AgriKnowledgeBase()
+        # Layer 2: Knowledge base (an already-built KB may be shared in)
+        self.kb = kb if kb is not None else AgriKnowledgeBase()
 
         print("🧠 AgriSmart Hybrid Engine initialised — 4 layers active")
 
@@ -229,15 +303,9 @@ class AgriSmartEngine:
           - data evidence from knowledge base
           - optional LLM-generated advice
         """
-
-        # Determine current season
-        month = datetime.now().month
-        if month in (6, 7, 8, 9, 10):
-            current_season = "kharif"
-        elif month in (11, 12, 1, 2, 3):
-            current_season = "rabi"
-        else:
-            current_season = "zaid"
+        ph, temperature, rainfall, nitrogen, phosphorus, potassium = map(
+            _plain_number, (ph, temperature, rainfall, nitrogen, phosphorus, potassium))
+        current_season = self._current_season()
 
         # ── Layer 1: ML Model Predictions ────────────────────────────
         ml_predictions = self._layer1_ml_predict(
@@ -246,7 +314,7 @@ class AgriSmartEngine:
 
         # ── Layer 2: Knowledge Base Retrieval ────────────────────────
         kb_results = self._layer2_kb_retrieve(
-            temperature, rainfall, ph, nitrogen
+            temperature, rainfall, ph, nitrogen, phosphorus, potassium
         )
 
         # ── Layer 3: Custom Agronomic Scoring ────────────────────────
@@ -256,14 +324,158 @@ class AgriSmartEngine:
             crop_preference,
         )
 
+        return self._build_result(
+            crop_scores, kb_results,
+            ph, temperature, rainfall, nitrogen, phosphorus, potassium,
+            current_season, region, use_llm, crop_preference,
+        )
+
+    def recommend_batch(
+        self,
+        conditions,
+        crop_preference: str = None,
+        region: str = None,
+        chunk_size: int = 1024,
+        comparative: bool = False,
+    ) -> Iterator[Dict]:
+        """
+        Recommend for many plots at once (e.g. an FPO soil-test sheet).
+
+        ``conditions`` may be a pandas DataFrame, a list of dicts, or an
+        (N, k) array whose columns follow BATCH_COLUMNS. Missing columns and
+        blank cells take the same defaults as ``recommend()``; per-row
+        ``crop_preference`` / ``region`` columns override the arguments.
+        A row with a non-numeric cell yields ``{"error": ...}`` instead of
+        a result, and the rest of the batch carries on.
+
+        Each layer runs once per chunk: one ``predict_proba`` for Layer 1,
+        one batched KB query for Layer 2 and one array expression for
+        Layer 3, which also ranks every row's crops. Layer 4 (LLM) is never
+        used. Results are yielded row by row, in input order, with the same
+        schema as ``recommend()`` — except the per-category ``comparative``
+        block, a UI aid built from every crop's scores, which is only
+        included with ``comparative=True``.
+        """
+        columns, n_rows = self._batch_columns(conditions)
+        current_season = self._current_season()
+        # Only the top crops reach a result unless the comparative block
+        # needs them all
+        n_ranked = len(CROP_NAMES) if comparative else 5
+
+        for start in range(0, n_rows, chunk_size):
+            stop = min(start + chunk_size, n_rows)
+            values = np.column_stack([
+                columns[c][start:stop] for c in BATCH_COLUMNS
+            ])
+            ph, temperature, rainfall, nitrogen, phosphorus, potassium = values.T
+            prefs = [p or crop_preference for p in columns["crop_preference"][start:stop]]
+            regions = [r or region for r in columns["region"][start:stop]]
+
+            ml_batch = self._layer1_ml_predict_batch(values)
+            kb_batch = self._layer2_kb_retrieve_batch(
+                temperature, rainfall, ph, nitrogen, phosphorus, potassium
+            )
+
+            ml_prob = np.stack([self._ml_prob_vector(m) for m in ml_batch])
+            kb_freq, kb_yield, kb_price = (
+                np.stack(v) for v in zip(*(self._kb_vectors(k) for k in kb_batch)))
+            pref_score = np.stack([self._pref_vector(p) for p in prefs])
+            scores = self._layer3_score_matrix(
+                values, SEASON_BITS.get(current_season, 0),
+                ml_prob, kb_freq, pref_score,
+            )
+            # Stable descending order, as the single path's list sort
+            ranked = np.argsort(-scores["final_score"], axis=1, kind="stable")[:, :n_ranked]
+            ranked_crops = self._ranked_crops(
+                scores, ranked, ml_batch, kb_freq, kb_yield, kb_price,
+            )
+
+            for i, crop_scores in enumerate(ranked_crops):
+                if columns["error"][start + i]:
+                    yield {"error": columns["error"][start + i]}
+                    continue
+                yield self._build_result(
+                    crop_scores, kb_batch[i],
+                    *(_plain_number(v) for v in values[i]),
+                    current_season, regions[i], False, prefs[i],
+                    comparative=comparative,
+                )
+
+    @staticmethod
+    def _batch_columns(conditions) -> Tuple[Dict[str, object], int]:
+        """Normalise batch input into per-column arrays (numeric + text).
+
+        ``columns["error"]`` holds, per row, why a numeric cell could not
+        be read (or None).
+        """
+        if hasattr(conditions, "columns"):            # pandas DataFrame
+            records = {c: conditions[c].reset_index(drop=True) for c in conditions.columns}
+            n_rows = len(conditions)
+        elif isinstance(conditions, np.ndarray):
+            arr = np.atleast_2d(conditions)
+            records = {c: pd.Series(arr[:, j])
+                       for j, c in enumerate(BATCH_COLUMNS[:arr.shape[1]])}
+            n_rows = arr.shape[0]
+        else:                                          # iterable of dicts
+            rows = list(conditions)
+            keys = {k for row in rows for k in row}
+            records = {k: pd.Series([row.get(k) for row in rows], dtype=object) for k in keys}
+            n_rows = len(rows)
+
+        columns = {"error": [None] * n_rows}
+        for name in BATCH_COLUMNS:
+            raw = records.get(name)
+            if raw is None:
+                columns[name] = np.full(n_rows, BATCH_DEFAULTS[name], dtype=float)
+                continue
+            col = pd.to_numeric(raw, errors="coerce").to_numpy(dtype=float, copy=True)
+            missing = raw.isna().to_numpy()
+            if raw.dtype == object:
+                missing = missing | raw.map(lambda v: isinstance(v, str) and not v.strip()).to_numpy(dtype=bool)
+            for row in np.flatnonzero(np.isnan(col) & ~missing):
+                columns["error"][row] = columns["error"][row] or (
+                    f"{name} is not a number: {raw.iloc[row]!r}")
+            col[np.isnan(col)] = BATCH_DEFAULTS[name]
+            columns[name] = col
+        for name in ("crop_preference", "region"):
+            raw = records.get(name, [None] * n_rows)
+            columns[name] = [v if isinstance(v, str) and v.strip() else None for v in raw]
+        return columns, n_rows
+
+    @staticmethod
+    def _current_season() -> str:
+        month = datetime.now().month
+        if month in (6, 7, 8, 9, 10):
+            return "kharif"
+        elif month in (11, 12, 1, 2, 3):
+            return "rabi"
+        return "zaid"
+
+    def _build_result(
+        self, crop_scores, kb_results,
+        ph, temperature, rainfall, nitrogen, phosphorus, potassium,
+        current_season, region, use_llm, crop_preference, comparative=True,
+    ) -> Dict:
+        """Rank Layer-3 scores and assemble the public recommendation dict."""
+
         # Sort by final fused score
         crop_scores.sort(key=lambda x: x["final_score"], reverse=True)
         top_crop = crop_scores[0] if crop_scores else None
         alternatives = crop_scores[1:5] if len(crop_scores) > 1 else []
 
+        # Explanations only for what reaches the response: the top crop's
+        # in full, and the first line (the alternatives' "reason") for the rest
+        for rank, entry in enumerate(crop_scores[:5]):
+            entry["explanation"] = self._explain_crop(
+                entry, ph, temperature, rainfall,
+                nitrogen, phosphorus, potassium,
+                current_season, crop_preference, brief=rank > 0,
+            )
+
         # ── Build comparative data for ALL crops ─────────────────────
         # Group by category so UI can show "why X over Y"
-        comparative = self._build_comparative(crop_scores, crop_preference)
+        if comparative:
+            comparative = self._build_comparative(crop_scores, crop_preference)
 
         # ── Layer 4: LLM Enhancement (optional) ─────────────────────
         llm_advice = ""
@@ -285,7 +497,7 @@ class AgriSmartEngine:
                 top_crop["crop"], region
             )
 
-        return {
+        result = {
             # Primary recommendation
             "recommended_crop": top_crop["crop"],
             "crop_icon": CROP_OPTIMAL_CONDITIONS.get(
@@ -344,9 +556,11 @@ class AgriSmartEngine:
                 top_crop.get("sustainability", 5.0), 1
             ),
 
-            # Comparative scoring (why this crop, not others?)
-            "comparative": comparative,
         }
+        if comparative:
+            # Comparative scoring (why this crop, not others?)
+            result["comparative"] = comparative
+        return result
 
     # ─────────────────────────────────────────────────────────────────
     # LAYER 1: ML MODEL PREDICTIONS
@@ -356,55 +570,67 @@ class AgriSmartEngine:
         self, ph, temperature, rainfall, nitrogen, phosphorus, potassium
     ) -> Dict:
         """Use trained sklearn models for crop/yield/price prediction."""
-        results = {
-            "crop_predictions": [],
-            "yield_estimate": None,
-            "price_estimate": None,
-            "sustainability_estimate": None,
-        }
+        return self._layer1_ml_predict_batch(np.array([[
+            ph, temperature, rainfall, nitrogen, phosphorus, potassium,
+        ]], dtype=float))[0]
+
+    def _layer1_ml_predict_batch(self, values: np.ndarray) -> List[Dict]:
+        """Layer 1 for (B, 6) BATCH_COLUMNS rows — one model call per model."""
+        ph, temperature, rainfall, nitrogen, phosphorus, potassium = values.T
+        n_rows = len(values)
+        year = datetime.now().year
+        results = [
+            {
+                "crop_predictions": [],
+                "yield_estimate": None,
+                "price_estimate": None,
+                "sustainability_estimate": None,
+            }
+            for _ in range(n_rows)
+        ]
 
         # 1. Crop classification
         if self.crop_classifier and self.crop_scaler and self.crop_encoder:
             try:
-                features = np.array([[
+                features = np.column_stack([
                     temperature, rainfall, nitrogen, phosphorus,
-                    potassium, ph, 1.5  # organic_matter default
-                ]])
+                    potassium, ph, np.full(n_rows, 1.5),  # organic_matter default
+                ])
                 scaled = self.crop_scaler.transform(features)
-                probas = self.crop_classifier.predict_proba(scaled)[0]
+                probas = self.crop_classifier.predict_proba(scaled)
                 classes = self.crop_encoder.inverse_transform(
-                    range(len(probas))
+                    range(probas.shape[1])
                 )
-                # Top 5 predictions
-                top_indices = probas.argsort()[-5:][::-1]
-                results["crop_predictions"] = [
-                    {"crop": str(classes[i]), "probability": float(probas[i])}
-                    for i in top_indices
-                ]
+                # Top 5 predictions per row
+                top_indices = probas.argsort(axis=1)[:, -5:][:, ::-1]
+                for r, (row, idx) in enumerate(zip(results, top_indices)):
+                    row["crop_predictions"] = [
+                        {"crop": str(classes[i]), "probability": float(probas[r, i])}
+                        for i in idx
+                    ]
             except Exception as e:
                 print(f"   ⚠️ Crop classifier error: {e}")
 
         # 2. Yield prediction
         if self.yield_model and self.yield_scaler:
             try:
-                features = np.array([[temperature, rainfall, datetime.now().year]])
+                features = np.column_stack([temperature, rainfall, np.full(n_rows, year)])
                 scaled = self.yield_scaler.transform(features)
-                results["yield_estimate"] = float(
-                    self.yield_model.predict(scaled)[0]
-                )
+                for row, y in zip(results, self.yield_model.predict(scaled)):
+                    row["yield_estimate"] = float(y)
             except Exception as e:
                 print(f"   ⚠️ Yield model error: {e}")
 
-        # 3. Price prediction
+        # 3. Price prediction (condition-independent defaults → one call)
         if self.price_model and self.price_scaler:
             try:
                 features = np.array([[
-                    1.0, 3.0, 3.0, datetime.now().year, 80  # defaults
+                    1.0, 3.0, 3.0, year, 80  # defaults
                 ]])
                 scaled = self.price_scaler.transform(features)
-                results["price_estimate"] = float(
-                    self.price_model.predict(scaled)[0]
-                )
+                price = float(self.price_model.predict(scaled)[0])
+                for row in results:
+                    row["price_estimate"] = price
             except Exception as e:
                 print(f"   ⚠️ Price model error: {e}")
 
@@ -412,13 +638,14 @@ class AgriSmartEngine:
         if self.sust_model and self.sust_scaler:
             try:
                 organic_matter = 1.5
-                features = np.array([[
-                    80, organic_matter, ph, nitrogen, phosphorus
-                ]])
+                features = np.column_stack([
+                    np.full(n_rows, 80.0), np.full(n_rows, organic_matter),
+                    ph, nitrogen, phosphorus,
+                ])
                 scaled = self.sust_scaler.transform(features)
-                results["sustainability_estimate"] = float(
-                    np.clip(self.sust_model.predict(scaled)[0], 0, 10)
-                )
+                preds = np.clip(self.sust_model.predict(scaled), 0, 10)
+                for row, s in zip(results, preds):
+                    row["sustainability_estimate"] = float(s)
             except Exception as e:
                 print(f"   ⚠️ Sustainability model error: {e}")
 
@@ -429,13 +656,31 @@ class AgriSmartEngine:
     # ─────────────────────────────────────────────────────────────────
 
     def _layer2_kb_retrieve(
-        self, temperature, rainfall, ph, nitrogen
+        self, temperature, rainfall, ph, nitrogen, phosphorus=None, potassium=None
     ) -> List[Dict]:
         """Retrieve similar historical records from knowledge base."""
+        return self._layer2_kb_retrieve_batch(
+            [temperature], [rainfall], [ph], [nitrogen],
+            None if phosphorus is None else [phosphorus],
+            None if potassium is None else [potassium],
+        )[0]
+
+    def _layer2_kb_retrieve_batch(
+        self, temperature, rainfall, ph, nitrogen, phosphorus=None, potassium=None
+    ) -> List[List[Dict]]:
+        """Layer 2 for a batch — a single batched KB query."""
         if not self.kb.is_loaded:
-            return []
-        return self.kb.get_best_crops_for_conditions(
-            temperature, rainfall, ph, nitrogen, top_k=10
+            return [[] for _ in range(len(temperature))]
+        if phosphorus is not None and potassium is not None:
+            # NPK all zero means "not entered" — match on the other conditions
+            phosphorus = np.asarray(phosphorus, dtype=float)
+            potassium = np.asarray(potassium, dtype=float)
+            npk_unknown = (np.asarray(nitrogen) == 0) & (phosphorus == 0) & (potassium == 0)
+            phosphorus = np.where(npk_unknown, np.nan, phosphorus)
+            potassium = np.where(npk_unknown, np.nan, potassium)
+        return self.kb.get_best_crops_for_conditions_batch(
+            temperature, rainfall, ph, nitrogen, top_k=10,
+            phosphorus=phosphorus, potassium=potassium,
         )
 
     # ─────────────────────────────────────────────────────────────────
@@ -458,179 +703,279 @@ class AgriSmartEngine:
           S_pref  = crop preference match boost (0-1.5)
           Final   = S_agro + S_ml + S_kb + S_season + S_pref (normalized 0-10)
 
-        Each score component has a human-readable explanation.
+        All crops are scored at once against the compiled condition matrix.
+        Human-readable explanations are NOT built here — call
+        ``_explain_crop`` for the crops that end up in the response.
         """
+        values = np.array([[
+            ph, temperature, rainfall, nitrogen, phosphorus, potassium,
+        ]], dtype=float)
+        kb_vectors = self._kb_vectors(kb_results)
+        scores = self._layer3_score_matrix(
+            values, SEASON_BITS.get(current_season, 0),
+            self._ml_prob_vector(ml_predictions)[None, :],
+            kb_vectors[0][None, :],
+            self._pref_vector(crop_preference)[None, :],
+        )
+        return self._scored_crops(scores, 0, ml_predictions, kb_vectors)
 
+    @staticmethod
+    def _layer3_score_matrix(values, season_bits, ml_prob, kb_freq, pref_score) -> Dict:
+        """Layer-3 fusion for (B, 6) condition rows × all crops → (B, n) arrays."""
         # Detect unknown NPK (all zero means user didn't enter values)
-        npk_unknown = (nitrogen == 0 and phosphorus == 0 and potassium == 0)
+        npk_unknown = np.all(values[:, 3:6] == 0, axis=1)
+
+        # ─── 3a/3b. Range fit for all 6 conditions × all crops ─────────
+        fit = _range_scores(values[:, :, None], COND_LOW, COND_HIGH, COND_MARGIN)
+        agronomic_score = (
+            fit[:, 0] * 3.0      # pH weight: 30%
+            + fit[:, 1] * 3.5    # Temperature weight: 35%
+            + fit[:, 2] * 3.5    # Rainfall weight: 35%
+        )
+        # User didn't enter NPK → treat as neutral (5/10)
+        npk_score = np.where(
+            npk_unknown[:, None], 5.0,
+            (fit[:, 3] + fit[:, 4] + fit[:, 5]) / 3 * 10,
+        )
 
-        # Build ML lookup
-        ml_lookup = {}
-        for pred in ml_predictions.get("crop_predictions", []):
-            ml_lookup[pred["crop"].lower()] = pred["probability"]
+        # ─── 3c. Season Match (0 or 1) ──────────────────────────────
+        season_bonus = np.broadcast_to(
+            ((SEASON_MASK & season_bits) != 0).astype(float), npk_score.shape
+        )
 
-        # Build KB lookup
-        kb_lookup = {}
-        for rec in kb_results:
-            kb_lookup[rec["crop"].lower()] = {
-                "frequency": rec.get("frequency", 0),
-                "avg_yield": rec.get("avg_yield", 0),
-                "avg_price": rec.get("avg_price", 0),
-                "confidence": rec.get("confidence", 0),
-            }
+        # ─── 3d/3e. ML (0-2) and Knowledge Base (0-2) boosts ──────────
+        ml_score = ml_prob * 2.0                      # Scale 0-1 probability to 0-2
+        kb_score = np.minimum(2.0, kb_freq / 10 * 2)  # Normalize to 0-2
+
+        # ─── 3g. Combine — Weighted Fusion ──────────────────────────
+        # Max possible: agronomic(10)*0.35 + npk(10)*0.12 + season(1) + ml(2) + kb(2)*0.75 + pref(1.5) ≈ 10
+        raw_total = (
+            agronomic_score * 0.35     # 35% weight: soil-climate match
+            + npk_score * 0.12         # 12% weight: nutrient balance
+            + season_bonus * 1.0       # season match
+            + ml_score * 0.8           # ML evidence
+            + kb_score * 0.6           # Knowledge base evidence
+            + pref_score * 1.0         # User preference alignment
+        )
 
-        scored_crops = []
+        # Confidence calibration
+        confidence = np.minimum(98, (
+            30
+            + np.minimum(30, agronomic_score * 3)   # up to +30 from soil/climate
+            + np.minimum(10, npk_score)             # up to +10 from nutrients
+            + season_bonus * 10                     # +10 if in season
+            + np.minimum(10, ml_prob * 10)          # up to +10 from ML
+            + np.minimum(10, kb_freq * 2)           # up to +10 from data evidence
+        ))
 
-        for crop_name, conditions in CROP_OPTIMAL_CONDITIONS.items():
-            explanation = []
-            score_components = {}
+        return {
+            "fit": fit,
+            "agronomic_score": agronomic_score,
+            "npk_score": npk_score,
+            "season_bonus": season_bonus,
+            "ml_prob": ml_prob,
+            "ml_score": ml_score,
+            "kb_score": kb_score,
+            "pref_score": pref_score,
+            "final_score": np.minimum(10.0, raw_total),
+            "confidence": confidence,
+        }
 
-            # ─── 3a. Soil-Climate Suitability (0-10) ────────────────
-            ph_score = self._range_score(
-                ph, conditions["ph"][0], conditions["ph"][1], margin=0.8
-            )
-            temp_score = self._range_score(
-                temperature, conditions["temp"][0], conditions["temp"][1], margin=5
-            )
-            rain_score = self._range_score(
-                rainfall, conditions["rain"][0], conditions["rain"][1], margin=30
-            )
+    @staticmethod
+    def _ml_prob_vector(ml_predictions: Dict) -> np.ndarray:
+        ml_prob = np.zeros(len(CROP_NAMES))
+        for pred in ml_predictions.get("crop_predictions", []):
+            idx = CROP_INDEX.get(pred["crop"].lower())
+            if idx is not None:
+                ml_prob[idx] = pred["probability"]
+        return ml_prob
 
-            if ph_score > 0.7:
-                explanation.append(f"✅ pH {ph} is excellent for {crop_name}")
-            elif ph_score > 0.4:
-                explanation.append(f"⚠️ pH {ph} is acceptable for {crop_name}")
-            else:
-                explanation.append(f"❌ pH {ph} is poor for {crop_name}")
+    @staticmethod
+    def _kb_vectors(kb_results: List[Dict]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """KB evidence as per-crop (frequency, avg_yield, avg_price) vectors."""
+        kb_freq = np.zeros(len(CROP_NAMES))
+        kb_yield = np.zeros(len(CROP_NAMES))
+        kb_price = np.zeros(len(CROP_NAMES))
+        for rec in kb_results:
+            idx = CROP_INDEX.get(rec["crop"].lower())
+            if idx is not None:
+                kb_freq[idx] = rec.get("frequency", 0)
+                kb_yield[idx] = rec.get("avg_yield", 0)
+                kb_price[idx] = rec.get("avg_price", 0)
+        return kb_freq, kb_yield, kb_price
 
-            if temp_score > 0.7:
-                explanation.append(f"✅ Temperature {temperature}°C suits {crop_name} well")
-            elif temp_score > 0.4:
-                explanation.append(f"⚠️ Temperature {temperature}°C is marginal for {crop_name}")
-            else:
-                explanation.append(f"❌ Temperature {temperature}°C is outside range for {crop_name}")
+    @staticmethod
+    def _pref_vector(crop_preference: Optional[str]) -> np.ndarray:
+        pref_key = crop_preference.strip() if crop_preference else ""
+        if pref_key in CATEGORY_MEMBERS:
+            return CATEGORY_MEMBERS[pref_key] * 1.5
+        return np.zeros(len(CROP_NAMES))
 
-            if rain_score > 0.7:
-                explanation.append(f"✅ Rainfall {rainfall}mm matches {crop_name} needs")
-            elif rain_score > 0.4:
-                explanation.append(f"⚠️ Rainfall {rainfall}mm is marginal for {crop_name}")
-            else:
-                explanation.append(f"❌ Rainfall {rainfall}mm doesn't suit {crop_name}")
+    @staticmethod
+    def _scored_crops(scores: Dict, row: int, ml_predictions: Dict, kb_vectors) -> List[Dict]:
+        """Materialise one row of the Layer-3 score matrix as per-crop dicts."""
+        kb_freq, kb_yield, kb_price = kb_vectors
+        fit = scores["fit"][row]
+
+        # Predicted yield/price from KB or ML
+        yield_estimate = ml_predictions.get("yield_estimate")
+        price_estimate = ml_predictions.get("price_estimate")
+        sustainability = ml_predictions.get("sustainability_estimate") or 5.0
+
+        final_score = scores["final_score"][row]
+        confidence = scores["confidence"][row]
+        agronomic_score = scores["agronomic_score"][row]
+        npk_score = scores["npk_score"][row]
+        season_bonus = scores["season_bonus"][row]
+        ml_prob = scores["ml_prob"][row]
+        ml_score = scores["ml_score"][row]
+        kb_score = scores["kb_score"][row]
+        pref_score = scores["pref_score"][row]
+
+        return [
+            {
+                "crop": crop_name.title(),
+                "final_score": float(final_score[i]),
+                "confidence": float(confidence[i]),
+                "agronomic_score": float(agronomic_score[i]),
+                "npk_score": float(npk_score[i]),
+                "season_bonus": float(season_bonus[i]),
+                "ml_score": float(ml_score[i]),
+                "kb_score": float(kb_score[i]),
+                "pref_score": float(pref_score[i]),
+                "category": CATEGORY_NAMES[CATEGORY_IDS[i]],
+                "condition_fit": {
+                    "ph": float(fit[0, i]),
+                    "temp": float(fit[1, i]),
+                    "rain": float(fit[2, i]),
+                },
+                "ml_probability": float(ml_prob[i]),
+                "kb_frequency": int(kb_freq[i]),
+                "kb_avg_yield": float(kb_yield[i]),
+                "predicted_yield": yield_estimate or float(kb_yield[i]),
+                "predicted_price": price_estimate or float(kb_price[i]),
+                "sustainability": sustainability,
+            }
+            for i, crop_name in enumerate(CROP_NAMES)
+        ]
 
-            agronomic_score = (
-                ph_score * 3.0      # pH weight: 30%
-                + temp_score * 3.5  # Temperature weight: 35%
-                + rain_score * 3.5  # Rainfall weight: 35%
-            )
-            score_components["agronomic_score"] = agronomic_score
-
-            # ─── 3b. NPK Balance Score (0-10) ───────────────────────
-            if npk_unknown:
-                # User didn't enter NPK → treat as neutral (5/10)
-                npk_score = 5.0
-                n_score = p_score = k_score = 0.5
-                explanation.append("ℹ️ NPK not provided — using neutral score")
-            else:
-                n_score = self._range_score(
-                    nitrogen, conditions["n"][0], conditions["n"][1], margin=20
-                )
-                p_score = self._range_score(
-                    phosphorus, conditions["p"][0], conditions["p"][1], margin=15
-                )
-                k_score = self._range_score(
-                    potassium, conditions["k"][0], conditions["k"][1], margin=15
-                )
-                npk_score = (n_score + p_score + k_score) / 3 * 10
-
-                if npk_score > 7:
-                    explanation.append(f"✅ NPK levels well-balanced for {crop_name}")
-                elif npk_score > 4:
-                    explanation.append(f"⚠️ Some NPK adjustment needed for {crop_name}")
-                else:
-                    explanation.append(f"❌ NPK levels need significant correction for {crop_name}")
-            score_components["npk_score"] = npk_score
-
-            # ─── 3c. Season Match (0 or 1) ──────────────────────────
-            season_bonus = 0.0
-            if current_season in conditions["season"] or "all" in conditions["season"]:
-                season_bonus = 1.0
-                explanation.append(f"✅ {crop_name} is in-season ({current_season})")
-            else:
-                explanation.append(f"⚠️ {crop_name} is typically grown in {'/'.join(conditions['season'])}")
-            score_components["season_bonus"] = season_bonus
-
-            # ─── 3d. ML Model Confidence Boost (0-2) ────────────────
-            ml_prob = ml_lookup.get(crop_name, 0)
-            ml_score = ml_prob * 2.0  # Scale 0-1 probability to 0-2
-            score_components["ml_score"] = ml_score
-            if ml_prob > 0.3:
-                explanation.append(f"🤖 ML model strongly predicts {crop_name} ({ml_prob*100:.0f}% confidence)")
-            elif ml_prob > 0.1:
-                explanation.append(f"🤖 ML model supports {crop_name} ({ml_prob*100:.0f}%)")
-
-            # ─── 3e. Knowledge Base Evidence Boost (0-2) ─────────────
-            kb_data = kb_lookup.get(crop_name, {})
-            kb_freq = kb_data.get("frequency", 0)
-            kb_score = min(2.0, kb_freq / 10 * 2)  # Normalize to 0-2
-            score_components["kb_score"] = kb_score
-            if kb_freq > 5:
-                explanation.append(
-                    f"📊 Historical data supports {crop_name} "
-                    f"({kb_freq} similar records, avg yield: {kb_data.get('avg_yield', 0):.1f} t/ha)"
-                )
+    @staticmethod
+    def _ranked_crops(scores: Dict, ranked: np.ndarray, ml_batch: List[Dict],
+                      kb_freq, kb_yield, kb_price) -> List[List[Dict]]:
+        """Batch counterpart of ``_scored_crops``: per-row dicts for the
+        (B, m) ``ranked`` crop indices of a chunk, gathered in one step."""
+        def take(values):
+            return np.take_along_axis(values, ranked, axis=1).tolist()
+
+        columns = [take(scores[name]) for name in (
+            "final_score", "confidence", "agronomic_score", "npk_score",
+            "season_bonus", "ml_score", "kb_score", "pref_score", "ml_prob")]
+        columns += [take(scores["fit"][:, f]) for f in range(3)]
+        columns += [take(v) for v in (kb_freq, kb_yield, kb_price)]
+
+        results = []
+        for r, crops in enumerate(ranked.tolist()):
+            yield_estimate = ml_batch[r].get("yield_estimate")
+            price_estimate = ml_batch[r].get("price_estimate")
+            sustainability = ml_batch[r].get("sustainability_estimate") or 5.0
+            results.append([
+                {
+                    "crop": CROP_NAMES[c].title(),
+                    "final_score": final,
+                    "confidence": confidence,
+                    "agronomic_score": agronomic,
+                    "npk_score": npk,
+                    "season_bonus": season,
+                    "ml_score": ml_score,
+                    "kb_score": kb_score,
+                    "pref_score": pref,
+                    "category": CATEGORY_NAMES[CATEGORY_IDS[c]],
+                    "condition_fit": {"ph": ph_fit, "temp": temp_fit, "rain": rain_fit},
+                    "ml_probability": ml_prob,
+                    "kb_frequency": int(freq),
+                    "kb_avg_yield": kb_avg_yield,
+                    "predicted_yield": yield_estimate or kb_avg_yield,
+                    "predicted_price": price_estimate or kb_avg_price,
+                    "sustainability": sustainability,
+                }
+                for (c, final, confidence, agronomic, npk, season, ml_score, kb_score,
+                     pref, ml_prob, ph_fit, temp_fit, rain_fit, freq, kb_avg_yield,
+                     kb_avg_price) in zip(crops, *(col[r] for col in columns))
+            ])
+        return results
 
-            # ─── 3f. Crop Preference Boost (0-1.5) ────────────────────
-            pref_score = 0.0
-            crop_category = _category_of(crop_name)
-            if crop_preference and crop_preference.strip():
-                pref_key = crop_preference.strip()
-                if pref_key in CROP_CATEGORIES and crop_name in CROP_CATEGORIES[pref_key]:
-                    pref_score = 1.5
-                    explanation.append(f"⭐ Matches your preference ({pref_key})")
-                else:
-                    explanation.append(f"↘️ Not in your preferred category ({pref_key})")
-            score_components["pref_score"] = pref_score
-
-            # ─── 3g. Combine — Weighted Fusion ──────────────────────
-            # Max possible: agronomic(10)*0.35 + npk(10)*0.12 + season(1) + ml(2) + kb(2)*0.75 + pref(1.5) ≈ 10
-            raw_total = (
-                agronomic_score * 0.35     # 35% weight: soil-climate match
-                + npk_score * 0.12         # 12% weight: nutrient balance
-                + season_bonus * 1.0       # season match
-                + ml_score * 0.8           # ML evidence
-                + kb_score * 0.6           # Knowledge base evidence
-                + pref_score * 1.0         # User preference alignment
-            )
-            final_score = min(10.0, raw_total)
+    @staticmethod
+    def _explain_crop(
+        scored: Dict, ph, temperature, rainfall,
+        nitrogen, phosphorus, potassium,
+        current_season, crop_preference=None, brief=False,
+    ) -> List[str]:
+        """Human-readable breakdown of one Layer-3 scored crop
+        (``brief``: only its first line)."""
+        crop_name = scored["crop"].lower()
+        fit = scored["condition_fit"]
+        explanation = []
+
+        if fit["ph"] > 0.7:
+            explanation.append(f"✅ pH {ph} is excellent for {crop_name}")
+        elif fit["ph"] > 0.4:
+            explanation.append(f"⚠️ pH {ph} is acceptable for {crop_name}")
+        else:
+            explanation.append(f"❌ pH {ph} is poor for {crop_name}")
+        if brief:
+            return explanation
+
+        if fit["temp"] > 0.7:
+            explanation.append(f"✅ Temperature {temperature}°C suits {crop_name} well")
+        elif fit["temp"] > 0.4:
+            explanation.append(f"⚠️ Temperature {temperature}°C is marginal for {crop_name}")
+        else:
+            explanation.append(f"❌ Temperature {temperature}°C is outside range for {crop_name}")
 
-            # Confidence calibration
-            confidence = self._calibrate_confidence(
-                agronomic_score, npk_score, season_bonus, ml_prob, kb_freq
-            )
+        if fit["rain"] > 0.7:
+            explanation.append(f"✅ Rainfall {rainfall}mm matches {crop_name} needs")
+        elif fit["rain"] > 0.4:
+            explanation.append(f"⚠️ Rainfall {rainfall}mm is marginal for {crop_name}")
+        else:
+            explanation.append(f"❌ Rainfall {rainfall}mm doesn't suit {crop_name}")
+
+        npk_score = scored["npk_score"]
+        if nitrogen == 0 and phosphorus == 0 and potassium == 0:
+            explanation.append("ℹ️ NPK not provided — using neutral score")
+        elif npk_score > 7:
+            explanation.append(f"✅ NPK levels well-balanced for {crop_name}")
+        elif npk_score > 4:
+            explanation.append(f"⚠️ Some NPK adjustment needed for {crop_name}")
+        else:
+            explanation.append(f"❌ NPK levels need significant correction for {crop_name}")
 
-            # Predicted yield/price from KB or ML
-            predicted_yield = ml_predictions.get("yield_estimate") or kb_data.get("avg_yield", 0)
-            predicted_price = ml_predictions.get("price_estimate") or kb_data.get("avg_price", 0)
-            sustainability = ml_predictions.get("sustainability_estimate") or 5.0
+        if scored["season_bonus"]:
+            explanation.append(f"✅ {crop_name} is in-season ({current_season})")
+        else:
+            seasons = CROP_OPTIMAL_CONDITIONS.get(crop_name, {}).get("season", [])
+            explanation.append(f"⚠️ {crop_name} is typically grown in {'/'.join(seasons)}")
+
+        ml_prob = scored["ml_probability"]
+        if ml_prob > 0.3:
+            explanation.append(f"🤖 ML model strongly predicts {crop_name} ({ml_prob*100:.0f}% confidence)")
+        elif ml_prob > 0.1:
+            explanation.append(f"🤖 ML model supports {crop_name} ({ml_prob*100:.0f}%)")
+
+        kb_freq = scored["kb_frequency"]
+        if kb_freq > 5:
+            explanation.append(
+                f"📊 Historical data supports {crop_name} "
+                f"({kb_freq} similar records, avg yield: {scored['kb_avg_yield']:.1f} t/ha)"
+            )
 
-            scored_crops.append({
-                "crop": crop_name.title(),
-                "final_score": final_score,
-                "confidence": confidence,
-                "agronomic_score": agronomic_score,
-                "npk_score": npk_score,
-                "season_bonus": season_bonus,
-                "ml_score": ml_score,
-                "kb_score": kb_score,
-                "pref_score": pref_score,
-                "category": crop_category,
-                "explanation": explanation,
-                "predicted_yield": predicted_yield,
-                "predicted_price": predicted_price,
-                "sustainability": sustainability,
-            })
+        if crop_preference and crop_preference.strip():
+            pref_key = crop_preference.strip()
+            if scored["pref_score"] > 0:
+                explanation.append(f"⭐ Matches your preference ({pref_key})")
+            else:
+                explanation.append(f"↘️ Not in your preferred category ({pref_key})")
 
-        return scored_crops
+        return explanation
 
     # ─────────────────────────────────────────────────────────────────
     # LAYER 4: LLM ENHANCEMENT (Optional)
@@ -660,7 +1005,7 @@ Keep it short, practical, and in simple language."""
 
             response = call_gemini_text(
                 "You are a friendly farming advisor. Speak simply.",
-                prompt, temperature=0.4, max_retries=2, timeout=20,
+                prompt, temperature=0.4, max_retries=2, timeout=20, agent="engine",
             )
             if response:
                 # Split into advice and reasoning
@@ -746,42 +1091,16 @@ Keep it short, practical, and in simple language."""
     # SCORING HELPERS
     # ─────────────────────────────────────────────────────────────────
 
-    @staticmethod
-    def _range_score(value, low, high, margin=0):
-        """Score how well a value fits within an optimal range.
-        Returns 0.0-1.0: 1.0 = perfect match, 0.0 = far out of range.
-        """
-        if low <= value <= high:
-            return 1.0
-        elif value < low:
-            distance = low - value
-            if margin > 0 and distance <= margin:
-                return 1.0 - (distance / margin) * 0.6
-            return max(0.0, 0.4 - distance / (margin * 3 if margin else 10))
-        else:  # value > high
-            distance = value - high
-            if margin > 0 and distance <= margin:
-                return 1.0 - (distance / margin) * 0.6
-            return max(0.0, 0.4 - distance / (margin * 3 if margin else 10))
-
-    @staticmethod
-    def _calibrate_confidence(
-        agronomic, npk, season, ml_prob, kb_freq
-    ):
-        """Calibrate overall confidence percentage."""
-        base = 30  # minimum
-        base += min(30, agronomic * 3)     # up to +30 from soil/climate
-        base += min(10, npk)               # up to +10 from nutrients
-        base += season * 10                # +10 if in season
-        base += min(10, ml_prob * 10)      # up to +10 from ML
-        base += min(10, kb_freq * 2)       # up to +10 from data evidence
-        return min(98, base)               # cap at 98%
-
     def _get_active_layers(self, use_llm):
         layers = []
         if self.crop_classifier:
             layers.append("ML Models (trained on 296K records)")
-        layers.append("Knowledge Base RAG (TF-IDF retrieval)")
+        if self.kb.knn_trees and self.kb.retrieval == "ivf":
+            layers.append("Knowledge Base RAG (approximate IVF retrieval)")
+        elif self.kb.knn_trees:
+            layers.append("Knowledge Base RAG (exact k-NN retrieval)")
+        else:
+            layers.append("Knowledge Base RAG (TF-IDF retrieval)")
         layers.append("Custom Agronomic Algorithm")
         if use_llm:
             layers.append("LLM Enhancement (Groq/Llama 3.3)")
@@ -816,3 +1135,106 @@ Keep it short, practical, and in simple language."""
             "estimated_price": 0,
             "sustainability_score": 5.0,
         }
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# Batch throughput benchmark + equality check against recommend()
+#   python -m models.custom_engine [n_plots]
+# ═══════════════════════════════════════════════════════════════════════════════
+
+if __name__ == "__main__":
+    import contextlib
+    import io
+    import json
+    import sys
+    import time
+    sys.path.insert(0, str(Path(__file__).parent.parent))
+
+    n_plots = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+    with contextlib.redirect_stdout(io.StringIO()):
+        engine = AgriSmartEngine()
+    if not engine.kb.is_loaded:
+        print("⚠️ No datasets found — nothing to benchmark")
+        sys.exit(1)
+
+    rng = np.random.default_rng(0)
+    plots = np.column_stack([
+        rng.uniform(4.5, 8.5, n_plots), rng.uniform(10, 38, n_plots),
+        rng.uniform(20, 300, n_plots), rng.uniform(0, 140, n_plots),
+        rng.uniform(5, 100, n_plots), rng.uniform(5, 200, n_plots),
+    ]).round(1)
+    n_single = min(n_plots, 500)
+
+    def per_plot():
+        with contextlib.redirect_stdout(io.StringIO()):
+            return [engine.recommend(*plot, use_llm=False) for plot in plots[:n_single]]
+
+    def batch(**kwargs):
+        # Consumed row by row and serialised, as the NDJSON endpoint does
+        for result in engine.recommend_batch(plots, **kwargs):
+            json.dumps(result, default=str)
+
+    def best_of(fn, repeats=3):
+        best = float("inf")
+        for _ in range(repeats):
+            start = time.perf_counter()
+            fn()
+            best = min(best, time.perf_counter() - start)
+        return best
+
+    single_rate = n_single / best_of(per_plot)
+    batch_rate = n_plots / best_of(batch)
+    full_rate = n_plots / best_of(lambda: batch(comparative=True))
+
+    # Where a batch plot's time goes: each stage timed over one more pass
+    stage_s = {}
+
+    def timed(stage, fn):
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                stage_s[stage] = stage_s.get(stage, 0.0) + time.perf_counter() - start
+        return wrapper
+
+    for stage, name in (("input parsing", "_batch_columns"), ("Layer 1 ML", "_layer1_ml_predict_batch"),
+                        ("Layer 2 KB k-NN query", "_layer2_kb_retrieve_batch"),
+                        ("Layer 3 score matrix", "_layer3_score_matrix"),
+                        ("per-crop dicts", "_ranked_crops"), ("result dicts", "_build_result")):
+        setattr(engine, name, timed(stage, getattr(engine, name)))
+    dumps = timed("JSON encoding", json.dumps)
+    start = time.perf_counter()
+    for result in engine.recommend_batch(plots):
+        dumps(result, default=str)
+    profiled_s = time.perf_counter() - start
+    stage_s["other (vectors, ranking)"] = profiled_s - sum(stage_s.values())
+    for name in ("_batch_columns", "_layer1_ml_predict_batch", "_layer2_kb_retrieve_batch",
+                 "_layer3_score_matrix", "_ranked_crops", "_build_result"):
+        delattr(engine, name)
+
+    # Same answers as recommend(), and one bad cell only fails its own row
+    singles = per_plot()
+    batched = list(engine.recommend_batch(plots[:n_single], comparative=True))
+    identical = sum(
+        json.dumps(a, default=str, sort_keys=True) == json.dumps(b, default=str, sort_keys=True)
+        for a, b in zip(singles, batched))
+    mixed = list(engine.recommend_batch([
+        {"ph": 6.5, "temperature": 25}, {"ph": 6.5, "temperature": "hot"}, {"ph": ""}]))
+    with contextlib.redirect_stdout(io.StringIO()):
+        reference = engine.recommend(ph=6.5, temperature=25, use_llm=False)
+
+    print(f"\n⏱️  Recommendations for {n_plots:,} plots (Layers 1-3, no LLM)")
+    print(f"   recommend() per plot        {single_rate:9,.0f} plots/s")
+    print(f"   recommend_batch()           {batch_rate:9,.0f} plots/s  "
+          f"({batch_rate / single_rate:.1f}×)")
+    print(f"   recommend_batch(comparative) {full_rate:8,.0f} plots/s  "
+          f"({full_rate / single_rate:.1f}×)")
+    print(f"\n🔬 recommend_batch() per plot, by stage ({profiled_s / n_plots * 1e6:.0f} µs in all)")
+    for stage, seconds in sorted(stage_s.items(), key=lambda item: -item[1]):
+        print(f"   {stage:<26} {seconds / n_plots * 1e6:6.1f} µs  {seconds / profiled_s:4.0%}")
+    print(f"\n🔍 {identical}/{n_single} batch results identical to recommend()")
+    print(f"   row with temperature='hot': {mixed[1]}")
+    print(f"   neighbouring rows scored: {[('error' not in r) for r in mixed]}, "
+          f"explanation matches recommend(): "
+          f"{mixed[0]['score_explanation'] == reference['score_explanation']}")
@@ -0,0 +1,134 @@
+"""
+deadline — Request-scoped time budget shared by every LLM call
+==============================================================
+A recommendation request carries one overall budget (default 8 s on
+``/multi_agent_recommendation``). The coordinator opens it with
+``deadline_scope`` and carves it into per-stage scopes with ``stage``;
+``llm_config`` reads the innermost scope from a context variable, so
+every agent call gets ``min(own timeout, remaining)`` and stops retrying
+once the budget is spent — without threading a parameter through every
+agent method.
+
+Context variables follow asyncio tasks (``gather``, ``to_thread``)
+automatically; work handed to a ThreadPoolExecutor must be submitted via
+``contextvars.copy_context().run``.
+
+Environment variables (optional):
+  AGRISMART_DEADLINE_S  — default request budget in seconds (default 8)
+"""
+
+import contextvars
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterator, List, Optional
+
+
+DEFAULT_DEADLINE_S = float(os.getenv("AGRISMART_DEADLINE_S", "8"))
+
+
+class Deadline:
+    """An absolute expiry time; nested deadlines never outlive their parent."""
+
+    def __init__(self, seconds: float, parent: Optional["Deadline"] = None):
+        now = time.monotonic()
+        self.budget = seconds
+        self.started = now
+        self.expires_at = now + max(0.0, seconds)
+        self.parent = parent
+        if parent is not None:
+            self.expires_at = min(self.expires_at, parent.expires_at)
+        self._lock = threading.Lock()
+        self._cut_short: List[str] = []
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started
+
+    def expired(self) -> bool:
+        return time.monotonic() >= self.expires_at
+
+    def timeout(self, own: float) -> float:
+        return min(own, self.remaining())
+
+    def note_cut_short(self, agent: Optional[str]):
+        """Record that ``agent`` gave up on the LLM because time ran out."""
+        root = self
+        while root.parent is not None:
+            root = root.parent
+        with root._lock:
+            name = agent or "other"
+            if name not in root._cut_short:
+                root._cut_short.append(name)
+
+    @property
+    def cut_short(self) -> List[str]:
+        with self._lock:
+            return list(self._cut_short)
+
+
+_current: contextvars.ContextVar[Optional[Deadline]] = contextvars.ContextVar(
+    "agrismart_deadline", default=None)
+
+
+def current() -> Optional[Deadline]:
+    """The innermost active deadline, or None when the caller set none."""
+    return _current.get()
+
+
+@contextmanager
+def deadline_scope(seconds: Optional[float]) -> Iterator[Optional[Deadline]]:
+    """Run the body under a budget of ``seconds`` (None → no deadline)."""
+    if seconds is None:
+        yield None
+        return
+    deadline = Deadline(seconds, parent=_current.get())
+    token = _current.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def stage(fraction: float) -> Iterator[Optional[Deadline]]:
+    """Sub-budget: ``fraction`` of the time remaining in the current scope."""
+    parent = _current.get()
+    if parent is None:
+        yield None
+        return
+    with deadline_scope(parent.remaining() * fraction) as deadline:
+        yield deadline
+
+
+# ── Helpers for the LLM layer ───────────────────────────────────────────
+
+def clamp_timeout(timeout: float) -> float:
+    """``min(timeout, remaining)`` under a deadline, else ``timeout``."""
+    deadline = _current.get()
+    return timeout if deadline is None else deadline.timeout(timeout)
+
+
+def expired() -> bool:
+    deadline = _current.get()
+    return deadline is not None and deadline.expired()
+
+
+def remaining() -> Optional[float]:
+    deadline = _current.get()
+    return None if deadline is None else deadline.remaining()
+
+
+def fits(seconds: float) -> bool:
+    """True when a ``seconds`` back-off still leaves time for another try."""
+    deadline = _current.get()
+    return deadline is None or deadline.remaining() > seconds
+
+
+def note_cut_short(agent: Optional[str]):
+    deadline = _current.get()
+    if deadline is not None:
+        deadline.note_cut_short(agent)
@@ -19,7 +19,11 @@ import os
 from datetime import datetime
 from typing import Dict, List, Optional
 
-from models.llm_config import call_gemini
+from models.llm_config import acall_gemini, call_gemini
+from models.request_scope import memoized
+from models.prompt_reference import ReferenceBlock
+from models.input_quantizer import quantize_inputs, with_inputs
+from models.response_schema import Number, Records, Schema, Text, TextList
 
 
 # ═══════════════════════════════════════════════════════════════════════════════
@@ -56,6 +60,20 @@ CROP_PROFILES: Dict[str, Dict] = {
 }
 
 
+def _profile_line(name: str, data: Dict) -> str:
+    msp = f"₹{data['msp']}/q" if data['msp'] else "Market-priced"
+    return (
+        f"  {name}: pH {data['ph']}, Temp {data['temp']}, Rain {data['rain']}, "
+        f"Season {data['season']}, Soil [{data['soil']}], Water {data['water']}, "
+        f"NPK {data['npk']}, MSP {msp}"
+    )
+
+
+# Rendered once; prompts carry only the engine's candidate crops
+CROP_REFERENCE = ReferenceBlock.table(
+    {name: _profile_line(name, data) for name, data in CROP_PROFILES.items()})
+
+
 # ═══════════════════════════════════════════════════════════════════════════════
 # Agent System Prompt
 # ═══════════════════════════════════════════════════════════════════════════════
@@ -99,6 +117,22 @@ Respond with a JSON object:
   "warnings": ["Any risks or concerns the farmer should watch for"]
 }"""
 
+ALTERNATIVE_SCHEMA = Schema("FarmerAdvisor", {
+    "crop": Text(),
+    "score": Number(5.0),
+    "reason": Text(),
+})
+
+RESPONSE_SCHEMA = Schema("FarmerAdvisor", {
+    "crop": Text(strip=True, required=True),
+    "score": Number(5.0, lo=0.0, hi=10.0, ndigits=1),
+    "confidence": Number(60.0, lo=0.0, hi=100.0, ndigits=1),
+    "reasoning": Text(),
+    "advice": Text(),
+    "alternatives": Records(ALTERNATIVE_SCHEMA, key="crop", limit=5),
+    "warnings": TextList(),
+})
+
 
 # ═══════════════════════════════════════════════════════════════════════════════
 # FarmerAdvisor Agent
@@ -131,15 +165,21 @@ class FarmerAdvisor:
         )
         return result["crop"]
 
+    @memoized("farmer")
     def recommend_detailed(self, ph=6.5, temperature=25, rainfall=100,
                            humidity=60, nitrogen=80, phosphorus=30,
-                           potassium=30, soil_type=None) -> Dict:
-        """Full recommendation via LLM with fallback."""
+                           potassium=30, soil_type=None,
+                           candidates: Optional[List[str]] = None) -> Dict:
+        """Full recommendation via LLM with fallback.
+
+        ``candidates`` (the engine's shortlist) limits the crop reference
+        sent to the LLM; None sends every crop.
+        """
 
         # Try LLM first
         llm_result = self._llm_recommend(
             ph, temperature, rainfall, humidity,
-            nitrogen, phosphorus, potassium, soil_type,
+            nitrogen, phosphorus, potassium, soil_type, candidates,
         )
         if llm_result:
             return llm_result
@@ -151,11 +191,31 @@ class FarmerAdvisor:
             nitrogen, phosphorus, potassium,
         )
 
+    @memoized("farmer")
+    async def recommend_detailed_async(self, ph=6.5, temperature=25, rainfall=100,
+                                       humidity=60, nitrogen=80, phosphorus=30,
+                                       potassium=30, soil_type=None,
+                                       candidates: Optional[List[str]] = None) -> Dict:
+        """Async recommend_detailed — awaits the LLM without holding a thread."""
+        llm_result = await self._llm_recommend_async(
+            ph, temperature, rainfall, humidity,
+            nitrogen, phosphorus, potassium, soil_type, candidates,
+        )
+        if llm_result:
+            return llm_result
+
+        print("⚠️ FarmerAdvisor: LLM unavailable, using fallback scoring")
+        return self._fallback_recommend(
+            ph, temperature, rainfall, humidity,
+            nitrogen, phosphorus, potassium,
+        )
+
     # ── LLM Path ─────────────────────────────────────────────────────
 
-    def _llm_recommend(self, ph, temperature, rainfall, humidity,
-                       nitrogen, phosphorus, potassium, soil_type) -> Optional[Dict]:
-        """Build prompt, call Gemini, parse and validate response."""
+    def _recommend_prompt(self, ph, temperature, rainfall, humidity,
+                          nitrogen, phosphorus, potassium, soil_type,
+                          candidates=None) -> str:
+        """Build the crop-recommendation user prompt."""
 
         now = datetime.now()
         month_name = now.strftime("%B")
@@ -167,16 +227,7 @@ class FarmerAdvisor:
         else:
             season = "Zaid (summer)"
 
-        # Build crop reference text
-        ref_lines = []
-        for name, data in CROP_PROFILES.items():
-            msp = f"₹{data['msp']}/q" if data['msp'] else "Market-priced"
-            ref_lines.append(
-                f"  {name}: pH {data['ph']}, Temp {data['temp']}, Rain {data['rain']}, "
-                f"Season {data['season']}, Soil [{data['soil']}], Water {data['water']}, "
-                f"NPK {data['npk']}, MSP {msp}"
-            )
-        crop_ref = "\n".join(ref_lines)
+        crop_ref = CROP_REFERENCE.select(candidates)
 
         user_prompt = f"""Analyse these farm conditions and recommend the best crop:
 
@@ -198,52 +249,40 @@ CROP REFERENCE DATA (Indian agricultural standards):
 Based on these conditions and the crop reference data, recommend the optimal crop.
 Think step-by-step through soil compatibility, climate match, nutrient balance, and seasonal timing."""
 
-        response = call_gemini(SYSTEM_PROMPT, user_prompt, temperature=0.3)
+        return user_prompt
+
+    def _llm_recommend(self, ph, temperature, rainfall, humidity,
+                       nitrogen, phosphorus, potassium, soil_type,
+                       candidates=None) -> Optional[Dict]:
+        """Build prompt, call Gemini, parse and validate response."""
+        raw = dict(ph=ph, temperature=temperature, rainfall=rainfall,
+                   humidity=humidity, nitrogen=nitrogen, phosphorus=phosphorus,
+                   potassium=potassium, soil_type=soil_type)
+        inputs = quantize_inputs("farmer", raw)
+        user_prompt = self._recommend_prompt(**inputs, candidates=candidates)
+        response = call_gemini(SYSTEM_PROMPT, user_prompt, temperature=0.3, agent="farmer")
+        if not response:
+            return None
+
+        return with_inputs(self._validate_llm_response(response), raw, inputs)
+
+    async def _llm_recommend_async(self, ph, temperature, rainfall, humidity,
+                                   nitrogen, phosphorus, potassium,
+                                   soil_type, candidates=None) -> Optional[Dict]:
+        raw = dict(ph=ph, temperature=temperature, rainfall=rainfall,
+                   humidity=humidity, nitrogen=nitrogen, phosphorus=phosphorus,
+                   potassium=potassium, soil_type=soil_type)
+        inputs = quantize_inputs("farmer", raw)
+        user_prompt = self._recommend_prompt(**inputs, candidates=candidates)
+        response = await acall_gemini(SYSTEM_PROMPT, user_prompt, temperature=0.3, agent="farmer")
         if not response:
             return None
 
-        return self._validate_llm_response(response)
+        return with_inputs(self._validate_llm_response(response), raw, inputs)
 
     def _validate_llm_response(self, resp: Dict) -> Optional[Dict]:
         """Ensure LLM response has required fields with valid values."""
-        try:
-            crop = str(resp.get("crop", "")).strip()
-            if not crop:
-                return None
-
-            score = float(resp.get("score", 5.0))
-            score = max(0.0, min(10.0, score))
-
-            confidence = float(resp.get("confidence", 60.0))
-            confidence = max(0.0, min(100.0, confidence))
-
-            reasoning = str(resp.get("reasoning", ""))
-            advice = str(resp.get("advice", ""))
-            warnings = resp.get("warnings", [])
-            if isinstance(warnings, str):
-                warnings = [warnings]
-
-            alternatives = []
-            for alt in resp.get("alternatives", []):
-                if isinstance(alt, dict) and "crop" in alt:
-                    alternatives.append({
-                        "crop": str(alt["crop"]),
-                        "score": float(alt.get("score", 5.0)),
-                        "reason": str(alt.get("reason", "")),
-                    })
-
-            return {
-                "crop": crop,
-                "score": round(score, 1),
-                "confidence": round(confidence, 1),
-                "reasoning": reasoning,
-                "advice": advice,
-                "alternatives": alternatives[:5],
-                "warnings": warnings,
-            }
-        except Exception as e:
-            print(f"⚠️ FarmerAdvisor: LLM response validation failed: {e}")
-            return None
+        return RESPONSE_SCHEMA.validate(resp)
 
     # ── Fallback Path ────────────────────────────────────────────────
 
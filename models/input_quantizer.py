@@ -0,0 +1,223 @@
+"""
+input_quantizer — Bucket agent inputs so near-identical requests share cache hits
+===============================================================================
+Users type pH 6.47 vs 6.5 or rainfall 812 vs 800; exact prompt hashing
+treats those as different requests. Each agent snaps its numeric inputs to
+per-agent buckets *before* building the prompt, so the prompt — and thus
+the LLM cache key — is built from quantized values, while the agent's
+result still reports the raw inputs the farmer sent.
+
+Default buckets: pH 0.1, temperature 1 °C, rainfall 25 mm, N/P/K and
+fertiliser/pesticide 5 kg/ha, humidity / soil moisture 5 %.
+
+Environment variables (optional):
+  AGRISMART_QUANTIZE        — "0" sends raw inputs to the LLM (no bucketing)
+  AGRISMART_QUANT_BUCKETS   — JSON overrides, per field or per agent, e.g.
+                              '{"rainfall": 50, "pest": {"soil_ph": 0.2}}'
+  AGRISMART_QUANT_LOG       — append every agent request (raw inputs) to this
+                              JSONL file for offline replay
+
+Replay a request log and report achievable cache hit rate per scheme:
+    python -m models.input_quantizer replay requests.jsonl
+    python -m models.input_quantizer replay requests.jsonl --scheme wide='{"rainfall": 100}'
+"""
+
+import json
+import math
+import os
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List, Optional
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# Bucket definitions
+# ═══════════════════════════════════════════════════════════════════════════════
+
+QUANTIZE_ENABLED = os.getenv("AGRISMART_QUANTIZE", "1") != "0"
+QUANT_LOG_PATH = os.getenv("AGRISMART_QUANT_LOG", "")
+
+# agent → {argument name: bucket size}; arguments not listed pass through
+AGENT_BUCKETS: Dict[str, Dict[str, float]] = {
+    "farmer": {"ph": 0.1, "temperature": 1, "rainfall": 25, "humidity": 5,
+               "nitrogen": 5, "phosphorus": 5, "potassium": 5},
+    "market": {},               # prompt varies only by crop / area / month
+    "weather": {"temperature": 1, "rainfall": 25, "humidity": 5},
+    "sustainability": {"ph": 0.1, "nitrogen": 5, "phosphorus": 5,
+                       "fertilizer_usage": 5, "pesticide_usage": 5},
+    "pest": {"soil_ph": 0.1, "temperature": 1, "rainfall": 25, "soil_moisture": 5},
+    "synthesis": {"soil_ph": 0.1, "temperature": 1, "rainfall": 25, "humidity": 5},
+}
+
+
+def apply_overrides(buckets: Dict[str, Dict[str, float]],
+                    overrides: Dict[str, Any]) -> Dict[str, Dict[str, float]]:
+    """Copy of ``buckets`` with field-wide or per-agent size overrides."""
+    merged = {agent: dict(fields) for agent, fields in buckets.items()}
+    for name, value in overrides.items():
+        if isinstance(value, dict):
+            merged.setdefault(name, {}).update(value)
+        else:
+            for fields in merged.values():
+                if name in fields:
+                    fields[name] = value
+    return merged
+
+
+_env_overrides = os.getenv("AGRISMART_QUANT_BUCKETS")
+if _env_overrides:
+    try:
+        AGENT_BUCKETS = apply_overrides(AGENT_BUCKETS, json.loads(_env_overrides))
+    except (ValueError, AttributeError) as _e:
+        print(f"⚠️ Ignoring invalid AGRISMART_QUANT_BUCKETS: {_e}")
+
+
+def set_buckets(agent: str, **sizes: float):
+    """Change bucket sizes at runtime, e.g. set_buckets("farmer", rainfall=50)."""
+    AGENT_BUCKETS.setdefault(agent, {}).update(sizes)
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# Quantization
+# ═══════════════════════════════════════════════════════════════════════════════
+
+def quantize(value: Any, step: float) -> Any:
+    """Snap ``value`` to the nearest multiple of ``step``.
+
+    Results are formatted stably (int for whole-number steps, otherwise
+    rounded to the step's decimals) so they hash identically in prompts.
+    Non-numeric values and non-positive steps pass through.
+    """
+    if not step or step <= 0 or isinstance(value, bool):
+        return value
+    try:
+        snapped = round(float(value) / step) * step
+    except (TypeError, ValueError):
+        return value
+    if not math.isfinite(snapped):
+        return value
+    if float(step).is_integer():
+        return int(snapped)
+    decimals = max(0, -math.floor(math.log10(step))) + 1
+    return round(snapped, decimals)
+
+
+def quantize_with(buckets: Dict[str, float], inputs: Dict[str, Any]) -> Dict[str, Any]:
+    return {name: quantize(value, buckets[name]) if name in buckets else value
+            for name, value in inputs.items()}
+
+
+_log_lock = threading.Lock()
+
+
+def quantize_inputs(agent: str, inputs: Dict[str, Any]) -> Dict[str, Any]:
+    """Bucketed copy of an agent's prompt inputs (logs the raw request)."""
+    if QUANT_LOG_PATH:
+        _log_request(agent, inputs)
+    if not QUANTIZE_ENABLED:
+        return dict(inputs)
+    return quantize_with(AGENT_BUCKETS.get(agent, {}), inputs)
+
+
+def with_inputs(result: Optional[Dict], raw: Dict[str, Any],
+                quantized: Dict[str, Any]) -> Optional[Dict]:
+    """Attach the farmer's raw inputs (and the bucketed ones the LLM saw)."""
+    if result is not None:
+        result["inputs"] = dict(raw)
+        if quantized != raw:
+            result["quantized_inputs"] = dict(quantized)
+    return result
+
+
+def _log_request(agent: str, inputs: Dict[str, Any]):
+    record = {"ts": time.time(), "agent": agent, "inputs": inputs}
+    try:
+        line = json.dumps(record, default=str)
+        with _log_lock, open(QUANT_LOG_PATH, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+    except OSError as e:
+        print(f"⚠️ Request log write failed: {e}")
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# Offline replay — achievable hit rate per bucketing scheme
+# ═══════════════════════════════════════════════════════════════════════════════
+
+def replay_hit_rate(records: Iterable[Dict], buckets: Optional[Dict[str, Dict[str, float]]],
+                    ttl: Optional[float] = None) -> Dict[str, Dict[str, float]]:
+    """Replay logged requests through a cache keyed on bucketed inputs.
+
+    ``buckets=None`` means exact keys. A repeat counts as a hit if its key
+    was seen within ``ttl`` seconds (any time when ttl is None). The
+    calendar month is part of the key, as it is in every agent prompt.
+    """
+    seen: Dict[str, float] = {}
+    counts = defaultdict(lambda: {"requests": 0, "hits": 0})
+    for record in sorted(records, key=lambda r: r.get("ts", 0)):
+        agent = record.get("agent", "other")
+        ts = record.get("ts", 0)
+        inputs = record.get("inputs", {})
+        if buckets is not None:
+            inputs = quantize_with(buckets.get(agent, {}), inputs)
+        month = time.strftime("%Y-%m", time.localtime(ts))
+        key = json.dumps([agent, month, sorted(inputs.items())], default=str)
+
+        counts[agent]["requests"] += 1
+        last = seen.get(key)
+        if last is not None and (ttl is None or ts - last <= ttl):
+            counts[agent]["hits"] += 1
+        else:
+            seen[key] = ts
+
+    report = {}
+    for agent, c in sorted(counts.items()):
+        report[agent] = {**c, "hit_rate": round(c["hits"] / c["requests"], 3)}
+    total = sum(c["requests"] for c in counts.values())
+    hits = sum(c["hits"] for c in counts.values())
+    report["all"] = {"requests": total, "hits": hits,
+                     "hit_rate": round(hits / total, 3) if total else 0.0}
+    return report
+
+
+def default_schemes() -> Dict[str, Optional[Dict[str, Dict[str, float]]]]:
+    """exact / current buckets / half-size / double-size."""
+    def scaled(factor):
+        return {a: {f: s * factor for f, s in fields.items()}
+                for a, fields in AGENT_BUCKETS.items()}
+    return {"exact": None, "fine (x0.5)": scaled(0.5),
+            "default": AGENT_BUCKETS, "coarse (x2)": scaled(2)}
+
+
+def load_log(path: str) -> List[Dict]:
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Replay logged agent requests")
+    sub = parser.add_subparsers(dest="command", required=True)
+    rp = sub.add_parser("replay", help="hit rate per bucketing scheme")
+    rp.add_argument("log", help="JSONL written via AGRISMART_QUANT_LOG")
+    rp.add_argument("--scheme", action="append", default=[], metavar="NAME=JSON",
+                    help="extra scheme as overrides of the default buckets")
+    rp.add_argument("--ttl", type=float, default=None,
+                    help="only count repeats within this many seconds")
+    args = parser.parse_args()
+
+    records = load_log(args.log)
+    schemes = default_schemes()
+    for spec in args.scheme:
+        name, _, overrides = spec.partition("=")
+        schemes[name] = apply_overrides(AGENT_BUCKETS, json.loads(overrides))
+
+    agents = sorted({r.get("agent", "other") for r in records})
+    print(f"\n📊 Replaying {len(records):,} logged requests"
+          + (f" (TTL {args.ttl:.0f}s)" if args.ttl else ""))
+    print(f"   {'scheme':<16}" + "".join(f"{a:>15}" for a in agents + ["all"]))
+    for name, buckets in schemes.items():
+        report = replay_hit_rate(records, buckets, args.ttl)
+        print(f"   {name:<16}" + "".join(
+            f"{report.get(a, {}).get('hit_rate', 0):>15.1%}" for a in agents + ["all"]))
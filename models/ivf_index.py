@@ -0,0 +1,186 @@
+"""
+IVF Index — approximate nearest-neighbour search in pure NumPy
+==============================================================
+Inverted-file index for the knowledge base's growing-condition vectors:
+
+  1. A k-means coarse quantizer splits the points into ``n_lists`` cells
+  2. Points are stored contiguously, grouped by cell (CSR-style offsets)
+  3. A query scans only the ``n_probe`` nearest cells, then re-ranks the
+     candidates exactly
+
+``n_probe`` is the recall/latency knob: 1 scans a single cell, ``n_lists``
+degenerates to exact search. Same ``query(X, k) -> (dist, idx)`` contract
+as sklearn's KDTree, so the knowledge base can use either.
+
+Recall benchmark against exact search:
+    python -m models.ivf_index
+"""
+
+import time
+import numpy as np
+from typing import Dict, Iterable, List, Tuple
+
+
+class IVFIndex:
+    """Inverted-file ANN index over Euclidean distance."""
+
+    def __init__(self, points: np.ndarray, n_lists: int = None, n_probe: int = 8,
+                 n_iter: int = 10, seed: int = 42):
+        points = np.ascontiguousarray(points, dtype=np.float64)
+        n_points = len(points)
+        self.n_lists = max(1, min(n_points, n_lists or int(np.sqrt(n_points))))
+        self.n_probe = n_probe
+
+        self.centroids = self._train(points, self.n_lists, n_iter, seed)
+        assign = self._nearest(points, self.centroids)
+        order = np.argsort(assign, kind="stable")
+        # Points grouped by cell; ids map back to the caller's row numbers
+        self.points = points[order]
+        self.ids = order.astype(np.int64)
+        self.offsets = np.concatenate([
+            [0], np.cumsum(np.bincount(assign, minlength=self.n_lists))
+        ]).astype(np.int64)
+
+    def __len__(self):
+        return len(self.ids)
+
+    # ── Build ─────────────────────────────────────────────────────────
+
+    @classmethod
+    def _train(cls, points, n_lists, n_iter, seed) -> np.ndarray:
+        """Lloyd's k-means on a sample of the points."""
+        rng = np.random.default_rng(seed)
+        sample_size = min(len(points), 64 * n_lists)
+        sample = points[rng.choice(len(points), sample_size, replace=False)]
+        centroids = sample[rng.choice(sample_size, n_lists, replace=False)].copy()
+
+        for _ in range(n_iter):
+            assign = cls._nearest(sample, centroids)
+            counts = np.bincount(assign, minlength=n_lists)
+            sums = np.column_stack([
+                np.bincount(assign, weights=sample[:, j], minlength=n_lists)
+                for j in range(sample.shape[1])
+            ])
+            filled = counts > 0
+            centroids[filled] = sums[filled] / counts[filled, None]
+            # Re-seed empty cells from random sample points
+            n_empty = int((~filled).sum())
+            if n_empty:
+                centroids[~filled] = sample[rng.choice(sample_size, n_empty, replace=False)]
+        return centroids
+
+    @staticmethod
+    def _nearest(points, centroids, chunk_size: int = 8192) -> np.ndarray:
+        c_norm = (centroids ** 2).sum(axis=1)
+        assign = np.empty(len(points), dtype=np.int64)
+        for start in range(0, len(points), chunk_size):
+            block = points[start:start + chunk_size]
+            # ||x||² is constant per row, so argmin needs only -2x·c + ||c||²
+            assign[start:start + chunk_size] = np.argmin(c_norm - 2 * block @ centroids.T, axis=1)
+        return assign
+
+    # ── Query ─────────────────────────────────────────────────────────
+
+    def query(self, queries: np.ndarray, k: int = 1, n_probe: int = None
+              ) -> Tuple[np.ndarray, np.ndarray]:
+        """Approximate top-k per query → (distances, row ids), nearest first."""
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float64))
+        n_probe = max(1, min(self.n_lists, n_probe or self.n_probe))
+        k = min(k, len(self.ids))
+        sizes = np.diff(self.offsets)
+
+        cell_dist = (
+            (queries ** 2).sum(axis=1)[:, None]
+            - 2 * queries @ self.centroids.T
+            + (self.centroids ** 2).sum(axis=1)[None, :]
+        )
+        cell_order = np.argsort(cell_dist, axis=1)
+
+        dist = np.empty((len(queries), k))
+        idx = np.empty((len(queries), k), dtype=np.int64)
+        for q, query in enumerate(queries):
+            # Keep probing until at least k candidates are available
+            n_cells = n_probe
+            while sizes[cell_order[q, :n_cells]].sum() < k:
+                n_cells += 1
+            cells = cell_order[q, :n_cells]
+            spans = [np.arange(self.offsets[c], self.offsets[c + 1]) for c in cells]
+            candidates = np.concatenate(spans)
+            d2 = ((self.points[candidates] - query) ** 2).sum(axis=1)
+            top = np.argpartition(d2, k - 1)[:k] if k < len(d2) else np.arange(len(d2))
+            top = top[np.argsort(d2[top], kind="stable")]
+            dist[q] = np.sqrt(d2[top])
+            idx[q] = self.ids[candidates[top]]
+        return dist, idx
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# Recall benchmark
+# ═══════════════════════════════════════════════════════════════════════════════
+
+def exact_search(points: np.ndarray, queries: np.ndarray, k: int,
+                 chunk_size: int = 64) -> Tuple[np.ndarray, np.ndarray]:
+    """Brute-force top-k (distances, row ids) — ground truth for the benchmark."""
+    p_norm = (points ** 2).sum(axis=1)
+    dist, idx = [], []
+    for start in range(0, len(queries), chunk_size):
+        block = queries[start:start + chunk_size]
+        d2 = p_norm[None, :] - 2 * block @ points.T + (block ** 2).sum(axis=1)[:, None]
+        top = np.argpartition(d2, k - 1, axis=1)[:, :k]
+        top_d2 = np.take_along_axis(d2, top, axis=1)
+        order = np.argsort(top_d2, axis=1)
+        idx.append(np.take_along_axis(top, order, axis=1))
+        dist.append(np.sqrt(np.maximum(np.take_along_axis(top_d2, order, axis=1), 0)))
+    return np.vstack(dist), np.vstack(idx)
+
+
+def benchmark_recall(index: IVFIndex, points: np.ndarray, queries: np.ndarray,
+                     k: int = 50, n_probes: Iterable[int] = (1, 2, 4, 8, 16, 32)
+                     ) -> List[Dict]:
+    """Recall@k and latency of ``index`` per ``n_probe`` versus exact search.
+
+    A hit is a returned neighbour no farther than the true k-th neighbour,
+    so duplicate rows at equal distance are not counted as misses.
+    """
+    start = time.perf_counter()
+    truth_dist, _ = exact_search(points, queries, k)
+    exact_ms = (time.perf_counter() - start) / len(queries) * 1000
+    kth = truth_dist[:, -1:] + 1e-9
+
+    rows = []
+    for n_probe in n_probes:
+        start = time.perf_counter()
+        found_dist, _ = index.query(queries, k, n_probe=n_probe)
+        elapsed_ms = (time.perf_counter() - start) / len(queries) * 1000
+        rows.append({
+            "n_probe": n_probe,
+            "recall": float((found_dist <= kth).mean()),
+            "ms_per_query": elapsed_ms,
+            "exact_ms_per_query": exact_ms,
+        })
+    return rows
+
+
+if __name__ == "__main__":
+    import sys
+    from pathlib import Path
+    sys.path.insert(0, str(Path(__file__).parent.parent))
+    from models.knowledge_base import AgriKnowledgeBase, KNN_FEATURES
+
+    kb = AgriKnowledgeBase(retrieval="ivf")
+    if kb.agricultural_df is None:
+        print("⚠️ No agricultural dataset found — nothing to benchmark")
+        sys.exit(1)
+    index = kb.knn_trees[tuple(KNN_FEATURES)]
+    points = np.empty_like(index.points)
+    points[index.ids] = index.points
+
+    rng = np.random.default_rng(0)
+    queries = points[rng.choice(len(points), 200, replace=False)]
+    queries = queries + rng.normal(0, 0.1, queries.shape)
+
+    print(f"\n📊 IVF recall@50 — {len(points):,} points, {index.n_lists} lists")
+    for row in benchmark_recall(index, points, queries):
+        print(f"   n_probe={row['n_probe']:>3}  recall={row['recall']:.3f}  "
+              f"{row['ms_per_query']:.3f} ms/query  "
+              f"(exact {row['exact_ms_per_query']:.3f} ms)")
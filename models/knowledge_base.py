@@ -1,71 +1,192 @@
 """
-AgriSmart Knowledge Base — TF-IDF RAG Engine
-=============================================
+AgriSmart Knowledge Base — k-NN RAG Engine
+==========================================
 Retrieval-Augmented Generation using local agricultural datasets.
-No external vector DB needed — pure sklearn TF-IDF + cosine similarity.
+No external vector DB needed — a sklearn KD-tree or a NumPy IVF index.
 
 Architecture:
   1. Loads 246K Indian crop production records + 50K synthetic data
-  2. Builds a TF-IDF index over crop-region-season document corpus
-  3. At query time, retrieves the most relevant historical records
-  4. Returns structured context for the custom recommendation engine
+  2. Standardizes each record's growing conditions (temperature,
+     rainfall, pH, N, P, K) into a numeric vector; a second index over
+     temperature, rainfall, pH and N serves queries without P/K
+  3. Indexes the vectors for nearest-neighbour search
+     (AGRISMART_KB_RETRIEVAL):
+       • knn   — exact k-NN over a KD-tree (default)
+       • ivf   — approximate inverted-file index (k-means cells, scans
+                 AGRISMART_KB_IVF_NPROBE of them) for very large corpora
+       • tfidf — the legacy TF-IDF index over stringified rows
+  4. At query time, standardizes the plot's conditions the same way,
+     retrieves the nearest historical records and aggregates them per
+     crop (frequency, similarity, yield, price)
+  5. Returns structured context for the custom recommendation engine
+
+Cold start: the parsed datasets, statistics and index are persisted as a
+snapshot (one .npy per column + manifest.json + index.joblib) keyed by a
+hash of the source CSVs, and memory-mapped back in on the next start.
+Build it ahead of time with ``python -m models.knowledge_base --build-snapshot``.
+
+Multi-worker: every array a worker reads (columns, category codes, index)
+stays a read-only mapping of the snapshot files, so uvicorn/gunicorn
+workers share one copy through the page cache. The first worker builds
+the snapshot under a file lock; the others wait and attach to it.
+Check with ``python -m models.knowledge_base --worker-memory 4``, which
+loads the KB in N workers with and without the snapshot and fails
+unless a snapshot worker costs a small fraction of a private copy.
 
 This is a LOCAL knowledge base — no API calls, instant retrieval.
 """
 
 import os
+import sys
+import json
+import shutil
+import hashlib
 import pandas as pd
 import numpy as np
 from pathlib import Path
+from contextlib import contextmanager
 from typing import Dict, List, Optional, Tuple
-from collections import defaultdict
+
+try:
+    import joblib
+    HAS_JOBLIB = True
+except ImportError:
+    HAS_JOBLIB = False
+
+try:
+    import fcntl
+    HAS_FCNTL = True
+except ImportError:  # Windows — workers may build the snapshot concurrently
+    HAS_FCNTL = False
 
 try:
     from sklearn.feature_extraction.text import TfidfVectorizer
     from sklearn.metrics.pairwise import cosine_similarity
+    from sklearn.neighbors import KDTree
     HAS_SKLEARN = True
 except ImportError:
     HAS_SKLEARN = False
 
+from models.ivf_index import IVFIndex
+
 DATASETS_DIR = Path(__file__).parent.parent / "datasets"
 
+# Retrieval backend: "knn" (exact KD-tree over numeric conditions),
+# "ivf" (approximate inverted-file index, scales to millions of rows) or
+# "tfidf" (legacy text index over a 10K-row sample of stringified rows)
+KB_RETRIEVAL = os.getenv("AGRISMART_KB_RETRIEVAL", "knn").lower()
+# IVF recall/latency knob: cells scanned per query
+KB_IVF_NPROBE = int(os.getenv("AGRISMART_KB_IVF_NPROBE", "8"))
+
+# Query argument → agricultural_df column used by the k-NN index
+KNN_FEATURES = {
+    "temperature": "temperature_avg",
+    "rainfall": "rainfall_mm",
+    "ph": "ph",
+    "nitrogen": "nitrogen",
+    "phosphorus": "phosphorus",
+    "potassium": "potassium",
+}
+# Without P/K the index falls back to this subspace
+KNN_BASE_FEATURES = ("temperature", "rainfall", "ph", "nitrogen")
+
+# ── Snapshot ──────────────────────────────────────────────────────────
+SOURCE_FILES = {
+    "crop_production_df": "crop_production.csv",
+    "agricultural_df": "large_agricultural_dataset.csv",
+}
+SNAPSHOT_DIR = Path(os.getenv("AGRISMART_KB_SNAPSHOT_DIR", DATASETS_DIR / ".kb_snapshot"))
+SNAPSHOT_ENABLED = os.getenv("AGRISMART_KB_SNAPSHOT", "1") != "0"
+SNAPSHOT_VERSION = 3  # bump when the snapshot layout or statistics change
+
+
+class _RecordStore:
+    """Columnar store of the indexed rows.
+
+    Numeric columns are plain arrays and text columns integer codes plus a
+    category table. Arrays are the DataFrame's own (memory-mapped when the
+    KB came from a snapshot); ``rows`` maps index positions to frame rows.
+    Queries work on positions; record dicts are only built on request.
+    """
+
+    def __init__(self, df: pd.DataFrame, rows: np.ndarray):
+        self.rows = rows
+        self.values = {}          # column → numeric array or category codes
+        self.categories = {}      # text column → object array of labels
+        for name in df.columns:
+            col = df[name]
+            if isinstance(col.dtype, pd.CategoricalDtype):
+                self.values[name] = col.array.codes
+                self.categories[name] = np.asarray(col.cat.categories, dtype=object)
+            elif pd.api.types.is_numeric_dtype(col):
+                self.values[name] = col.to_numpy()
+            else:
+                codes, labels = pd.factorize(col)
+                self.values[name] = codes.astype(np.int32)
+                self.categories[name] = np.asarray(labels, dtype=object)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def take(self, name: str, positions, default: float = 0.0) -> np.ndarray:
+        """Values of ``name`` at index positions (float; ``default`` if absent)."""
+        positions = np.asarray(positions)
+        if name not in self.values:
+            return np.full(positions.shape, default, dtype=float)
+        values = self.values[name][self.rows[positions]]
+        return values if name in self.categories else values.astype(float, copy=False)
+
+    def column(self, name: str, default: float = 0.0) -> np.ndarray:
+        """Numeric column over all indexed rows."""
+        return self.take(name, np.arange(len(self.rows)), default)
+
+    def __getitem__(self, i) -> Dict:
+        row = self.rows[i]
+        record = {}
+        for name, values in self.values.items():
+            v = values[row]
+            if name in self.categories:
+                record[name] = self.categories[name][v] if v >= 0 else np.nan
+            else:
+                record[name] = v.item() if isinstance(v, np.generic) else v
+        return record
+
 
 class AgriKnowledgeBase:
     """Local RAG engine for agricultural data retrieval."""
 
-    def __init__(self):
+    def __init__(self, retrieval: str = None, n_probe: int = None):
+        self.retrieval = (retrieval or KB_RETRIEVAL).lower()
+        self.n_probe = n_probe or KB_IVF_NPROBE
         self.crop_production_df = None  # 246K records
         self.agricultural_df = None     # 50K records
         self.vectorizer = None
         self.tfidf_matrix = None
-        self.doc_records = []           # parallel array of record dicts
+        self.knn_trees = {}             # feature tuple → KDTree / IVFIndex
+        self.knn_mean = {}              # per-feature standardization
+        self.knn_std = {}
+        self.doc_index = np.empty(0, dtype=np.int64)  # agricultural_df rows in the index
+        self.doc_records = []           # _RecordStore aligned with the index
         self.crop_stats = {}            # precomputed crop statistics
-        self.region_crop_stats = {}     # region-wise crop stats
+        self.region_crop_stats = {}     # crop → regions, best yield first
+        self.yield_trends = {}          # crop → region ("" = all) → trend
         self._loaded = False
         self._load_datasets()
 
     def _load_datasets(self):
-        """Load and index all agricultural datasets."""
+        """Load and index all agricultural datasets (from snapshot if current)."""
         try:
-            # Load Indian crop production (246K records)
-            crop_file = DATASETS_DIR / "crop_production.csv"
-            if crop_file.exists():
-                self.crop_production_df = pd.read_csv(crop_file)
-                self.crop_production_df.columns = [
-                    c.strip() for c in self.crop_production_df.columns
-                ]
-                print(f"📚 Knowledge Base: Loaded {len(self.crop_production_df):,} crop production records")
-
-            # Load synthetic agricultural dataset (50K records)
-            agri_file = DATASETS_DIR / "large_agricultural_dataset.csv"
-            if agri_file.exists():
-                self.agricultural_df = pd.read_csv(agri_file)
-                print(f"📚 Knowledge Base: Loaded {len(self.agricultural_df):,} agricultural records")
-
-            # Build indices
-            self._build_crop_statistics()
-            if HAS_SKLEARN:
-                self._build_tfidf_index()
+            source_hash = self._source_hash()
+            if not SNAPSHOT_ENABLED:
+                self._build_from_sources()
+            elif not self._load_snapshot(source_hash):
+                # One worker builds; the rest block here, then attach
+                with self._build_lock():
+                    if not self._load_snapshot(source_hash):
+                        self._build_from_sources()
+                        if self.save_snapshot(source_hash):
+                            # Swap private copies for the shared mapping
+                            self._load_snapshot(source_hash)
 
             self._loaded = True
             total = 0
@@ -79,59 +200,357 @@ class AgriKnowledgeBase:
             print(f"⚠️ Knowledge Base load error: {e}")
             self._loaded = False
 
+    def _build_from_sources(self):
+        """Parse the CSVs and rebuild statistics + retrieval index."""
+        # Load Indian crop production (246K records)
+        crop_file = DATASETS_DIR / SOURCE_FILES["crop_production_df"]
+        if crop_file.exists():
+            self.crop_production_df = pd.read_csv(crop_file)
+            self.crop_production_df.columns = [
+                c.strip() for c in self.crop_production_df.columns
+            ]
+            print(f"📚 Knowledge Base: Loaded {len(self.crop_production_df):,} crop production records")
+
+        # Load synthetic agricultural dataset (50K records)
+        agri_file = DATASETS_DIR / SOURCE_FILES["agricultural_df"]
+        if agri_file.exists():
+            self.agricultural_df = pd.read_csv(agri_file)
+            print(f"📚 Knowledge Base: Loaded {len(self.agricultural_df):,} agricultural records")
+
+        # Build indices
+        self._build_crop_statistics()
+        if self.retrieval == "ivf":
+            self._build_knn_index()         # pure NumPy, no sklearn needed
+        elif HAS_SKLEARN:
+            if self.retrieval == "tfidf":
+                self._build_tfidf_index()
+            else:
+                self._build_knn_index()
+        if self.agricultural_df is not None and len(self.doc_index) == 0:
+            # No sklearn index — the brute-force fallback scans every row
+            self.doc_index = np.arange(len(self.agricultural_df))
+        self._build_record_store()
+
+    def _build_record_store(self):
+        if self.agricultural_df is not None:
+            self.doc_records = _RecordStore(self.agricultural_df, self.doc_index)
+
+    # ── Snapshot ─────────────────────────────────────────────────────
+
+    def _source_hash(self) -> str:
+        """Snapshot key: retrieval mode + content hash of the source CSVs."""
+        digest = hashlib.sha256(f"v{SNAPSHOT_VERSION}".encode())
+        for filename in SOURCE_FILES.values():
+            path = DATASETS_DIR / filename
+            digest.update(filename.encode())
+            if path.exists():
+                with open(path, "rb") as f:
+                    for block in iter(lambda: f.read(1 << 20), b""):
+                        digest.update(block)
+        return f"{self.retrieval}-{digest.hexdigest()[:16]}"
+
+    @staticmethod
+    @contextmanager
+    def _build_lock():
+        """Exclusive cross-process lock around snapshot builds."""
+        if not HAS_FCNTL:
+            yield
+            return
+        SNAPSHOT_DIR.mkdir(parents=True, exist_ok=True)
+        with open(SNAPSHOT_DIR / ".build.lock", "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def save_snapshot(self, source_hash: str = None) -> Optional[Path]:
+        """Persist DataFrames, statistics and index under SNAPSHOT_DIR/<hash>."""
+        if not HAS_JOBLIB:
+            return None
+        source_hash = source_hash or self._source_hash()
+        target = SNAPSHOT_DIR / source_hash
+        tmp = SNAPSHOT_DIR / f".{source_hash}.{os.getpid()}.tmp"
+        try:
+            shutil.rmtree(tmp, ignore_errors=True)
+            tmp.mkdir(parents=True)
+            manifest = {
+                "version": SNAPSHOT_VERSION,
+                "source_hash": source_hash,
+                "retrieval": self.retrieval,
+                "frames": {},
+                "crop_stats": self.crop_stats,
+                "region_crop_stats": self.region_crop_stats,
+                "yield_trends": self.yield_trends,
+            }
+            for attr in SOURCE_FILES:
+                df = getattr(self, attr)
+                if df is not None:
+                    manifest["frames"][attr] = self._save_frame(df, tmp, attr)
+            np.save(tmp / "doc_index.npy", self.doc_index)
+            joblib.dump({
+                "knn_trees": self.knn_trees,
+                "knn_mean": self.knn_mean,
+                "knn_std": self.knn_std,
+                "vectorizer": self.vectorizer,
+                "tfidf_matrix": self.tfidf_matrix,
+            }, tmp / "index.joblib")
+            with open(tmp / "manifest.json", "w") as f:
+                json.dump(manifest, f)
+
+            if target.exists():
+                shutil.rmtree(target)
+            os.replace(tmp, target)
+            # Drop this mode's snapshots of older source data
+            for old in SNAPSHOT_DIR.glob(f"{self.retrieval}-*"):
+                if old.is_dir() and old.name != source_hash:
+                    shutil.rmtree(old, ignore_errors=True)
+            print(f"💾 Knowledge Base snapshot saved: {target}")
+            return target
+        except Exception as e:
+            print(f"⚠️ Knowledge Base snapshot save failed: {e}")
+            shutil.rmtree(tmp, ignore_errors=True)
+            return None
+
+    def _load_snapshot(self, source_hash: str) -> bool:
+        """Memory-map a snapshot matching ``source_hash``; False if absent/stale."""
+        path = SNAPSHOT_DIR / source_hash
+        if not HAS_JOBLIB or not (path / "manifest.json").exists():
+            return False
+        try:
+            with open(path / "manifest.json") as f:
+                manifest = json.load(f)
+            if (manifest.get("version") != SNAPSHOT_VERSION
+                    or manifest.get("source_hash") != source_hash):
+                return False
+
+            for attr, spec in manifest["frames"].items():
+                setattr(self, attr, self._load_frame(path, attr, spec))
+            self.crop_stats = manifest["crop_stats"]
+            self.region_crop_stats = manifest["region_crop_stats"]
+            self.yield_trends = manifest["yield_trends"]
+            # TF-IDF vectorizers hold object arrays, which cannot be mmapped
+            index = joblib.load(
+                path / "index.joblib",
+                mmap_mode=None if self.retrieval == "tfidf" else "r",
+            )
+            self.knn_trees = index["knn_trees"]
+            for tree in self.knn_trees.values():
+                if isinstance(tree, IVFIndex):
+                    tree.n_probe = self.n_probe
+            self.knn_mean = index["knn_mean"]
+            self.knn_std = index["knn_std"]
+            self.vectorizer = index["vectorizer"]
+            self.tfidf_matrix = index["tfidf_matrix"]
+            self.doc_index = np.load(path / "doc_index.npy", mmap_mode="r")
+            self._build_record_store()
+            print(f"📚 Knowledge Base: Loaded snapshot {source_hash}")
+            return True
+        except Exception as e:
+            print(f"⚠️ Knowledge Base snapshot unreadable, rebuilding: {e}")
+            for attr in SOURCE_FILES:
+                setattr(self, attr, None)
+            return False
+
+    @staticmethod
+    def _save_frame(df: pd.DataFrame, directory: Path, prefix: str) -> List[Dict]:
+        """One .npy per column; text columns as category codes + labels."""
+        columns = []
+        for i, name in enumerate(df.columns):
+            col = df[name]
+            spec = {"name": name, "file": f"{prefix}.{i}.npy"}
+            if not pd.api.types.is_numeric_dtype(col):
+                # Codes stored in pandas' own code dtype so loading is zero-copy
+                cat = col.array if isinstance(col.dtype, pd.CategoricalDtype) else pd.Categorical(col)
+                np.save(directory / spec["file"], cat.codes)
+                spec["categories"] = cat.categories.tolist()
+            else:
+                np.save(directory / spec["file"], col.to_numpy())
+            columns.append(spec)
+        return columns
+
+    @staticmethod
+    def _load_frame(directory: Path, prefix: str, columns: List[Dict]) -> pd.DataFrame:
+        """Rebuild a frame over read-only memory maps (text → categorical)."""
+        data = {}
+        for spec in columns:
+            values = np.load(directory / spec["file"], mmap_mode="r")
+            if "categories" in spec:
+                values = pd.Categorical.from_codes(
+                    values, categories=spec["categories"], validate=False
+                )
+            data[spec["name"]] = values
+        return pd.DataFrame(data, copy=False)
+
     def _build_crop_statistics(self):
-        """Precompute aggregate statistics per crop for fast lookup."""
+        """Precompute per-crop statistics, yield trends and region performance.
+
+        One groupby pass per dataset; the query helpers below are then plain
+        dictionary lookups.
+        """
+        self.crop_stats = {}
+        self.region_crop_stats = {}
+        self.yield_trends = {}
+
         if self.agricultural_df is not None:
             df = self.agricultural_df
-            for crop in df["crop"].unique():
-                crop_data = df[df["crop"] == crop]
-                self.crop_stats[crop.lower()] = {
-                    "avg_yield": float(crop_data["yield_tons_per_ha"].mean()),
-                    "avg_price": float(crop_data["price_per_ton"].mean()),
-                    "avg_temp": float(crop_data["temperature_avg"].mean()),
-                    "avg_rainfall": float(crop_data["rainfall_mm"].mean()),
-                    "avg_fertilizer": float(crop_data["fertilizer_kg_ha"].mean()),
-                    "avg_nitrogen": float(crop_data["nitrogen"].mean()),
-                    "avg_phosphorus": float(crop_data["phosphorus"].mean()),
-                    "avg_potassium": float(crop_data["potassium"].mean()),
-                    "avg_ph": float(crop_data["ph"].mean()),
-                    "std_yield": float(crop_data["yield_tons_per_ha"].std()),
-                    "std_price": float(crop_data["price_per_ton"].std()),
-                    "min_temp": float(crop_data["temperature_avg"].min()),
-                    "max_temp": float(crop_data["temperature_avg"].max()),
-                    "min_rain": float(crop_data["rainfall_mm"].min()),
-                    "max_rain": float(crop_data["rainfall_mm"].max()),
-                    "min_ph": float(crop_data["ph"].min()),
-                    "max_ph": float(crop_data["ph"].max()),
-                    "record_count": len(crop_data),
-                    "regions": crop_data["region"].unique().tolist(),
-                    "soil_types": crop_data["soil_type"].unique().tolist(),
-                }
+            agg = df.groupby("crop", sort=False).agg(
+                avg_yield=("yield_tons_per_ha", "mean"),
+                avg_price=("price_per_ton", "mean"),
+                avg_temp=("temperature_avg", "mean"),
+                avg_rainfall=("rainfall_mm", "mean"),
+                avg_fertilizer=("fertilizer_kg_ha", "mean"),
+                avg_nitrogen=("nitrogen", "mean"),
+                avg_phosphorus=("phosphorus", "mean"),
+                avg_potassium=("potassium", "mean"),
+                avg_ph=("ph", "mean"),
+                std_yield=("yield_tons_per_ha", "std"),
+                std_price=("price_per_ton", "std"),
+                min_temp=("temperature_avg", "min"),
+                max_temp=("temperature_avg", "max"),
+                min_rain=("rainfall_mm", "min"),
+                max_rain=("rainfall_mm", "max"),
+                min_ph=("ph", "min"),
+                max_ph=("ph", "max"),
+                record_count=("crop", "size"),
+                regions=("region", "unique"),
+                soil_types=("soil_type", "unique"),
+            )
+            float_cols = [c for c in agg.columns
+                          if c not in ("record_count", "regions", "soil_types")]
+            for crop, row in zip(agg.index, agg.to_dict("records")):
+                stats = {c: float(row[c]) for c in float_cols}
+                stats["record_count"] = int(row["record_count"])
+                stats["regions"] = list(row["regions"].tolist())
+                stats["soil_types"] = list(row["soil_types"].tolist())
+                self.crop_stats[crop.lower()] = stats
+
+            self._build_yield_cube(df)
 
         # Production stats from Indian dataset
         if self.crop_production_df is not None:
             df = self.crop_production_df
-            for crop in df["Crop"].dropna().unique():
-                crop_data = df[df["Crop"] == crop]
+            grouped = df.groupby("Crop", sort=False)
+            production = (
+                grouped["Production"].sum() if "Production" in df.columns else None
+            )
+            states = (
+                grouped["State_Name"].unique() if "State_Name" in df.columns else None
+            )
+            seasons = grouped["Season"].unique() if "Season" in df.columns else None
+            for crop in grouped.size().index:
                 key = crop.lower().strip()
-                if key not in self.crop_stats:
-                    self.crop_stats[key] = {}
-                self.crop_stats[key]["total_indian_production"] = float(
-                    crop_data["Production"].sum()
-                ) if "Production" in crop_data.columns else 0
-                self.crop_stats[key]["indian_states"] = (
-                    crop_data["State_Name"].unique().tolist()
-                    if "State_Name" in crop_data.columns else []
+                stats = self.crop_stats.setdefault(key, {})
+                stats["total_indian_production"] = (
+                    float(production[crop]) if production is not None else 0
                 )
-                self.crop_stats[key]["indian_seasons"] = (
-                    crop_data["Season"].dropna().unique().tolist()
-                    if "Season" in crop_data.columns else []
+                stats["indian_states"] = (
+                    states[crop].tolist() if states is not None else []
                 )
+                stats["indian_seasons"] = (
+                    [s for s in seasons[crop].tolist() if not pd.isna(s)]
+                    if seasons is not None else []
+                )
+
+    def _build_yield_cube(self, df: pd.DataFrame):
+        """(crop, region, year) cube → yield trends and region performance."""
+        crop_key = df["crop"].str.lower().rename("crop_key")
+        region_key = df["region"].str.lower().rename("region_key")
+        cube = df.groupby([crop_key, region_key, "year"], dropna=False).agg(
+            rows=("year", "size"),
+            yield_sum=("yield_tons_per_ha", "sum"),
+            yield_n=("yield_tons_per_ha", "count"),
+            price_sum=("price_per_ton", "sum"),
+            price_n=("price_per_ton", "count"),
+        )
+        by_crop_year = cube.groupby(level=["crop_key", "year"], dropna=False).sum()
+
+        # Trend over all regions ("") and per region
+        for crop, yearly in by_crop_year.groupby(level="crop_key"):
+            self.yield_trends.setdefault(crop, {})[""] = self._yield_trend(yearly)
+        for (crop, region), yearly in cube.groupby(
+            level=["crop_key", "region_key"], dropna=False
+        ):
+            if not pd.isna(region):
+                self.yield_trends.setdefault(crop, {})[region] = self._yield_trend(yearly)
+
+        # Region performance, best-yielding region first
+        by_region = df.groupby([crop_key, "region"]).agg({
+            "yield_tons_per_ha": "mean",
+            "price_per_ton": "mean",
+            "temperature_avg": "mean",
+            "rainfall_mm": "mean",
+        })
+        for (crop, region), row in zip(by_region.index, by_region.to_dict("records")):
+            self.region_crop_stats.setdefault(crop, []).append({
+                "region": region,
+                "avg_yield": round(float(row["yield_tons_per_ha"]), 2),
+                "avg_price": round(float(row["price_per_ton"]), 2),
+                "avg_temp": round(float(row["temperature_avg"]), 1),
+                "avg_rain": round(float(row["rainfall_mm"]), 1),
+            })
+        for results in self.region_crop_stats.values():
+            results.sort(key=lambda x: x["avg_yield"], reverse=True)
+
+    @staticmethod
+    def _yield_trend(cells: pd.DataFrame) -> Dict:
+        """Trend dict from cube cells of one crop (and optionally region)."""
+        if int(cells["rows"].sum()) < 5:
+            return {"trend": "insufficient_data", "data": []}
+
+        cells = cells[cells.index.get_level_values("year").notna()]
+        yearly = cells.groupby(level="year").sum().sort_index()
+        years = yearly.index.tolist()
+        yields = (yearly["yield_sum"] / yearly["yield_n"]).to_numpy()
+        prices = (yearly["price_sum"] / yearly["price_n"]).to_numpy()
+
+        if len(years) >= 2:
+            yield_change = yields[-1] - yields[0]
+            if yield_change > 0.5:
+                trend = "increasing"
+            elif yield_change < -0.5:
+                trend = "decreasing"
+            else:
+                trend = "stable"
+        else:
+            trend = "stable"
+
+        return {
+            "trend": trend,
+            "years": years,
+            "yields": np.round(yields, 2).tolist(),
+            "prices": np.round(prices, 2).tolist(),
+        }
+
+    def _build_knn_index(self):
+        """Build k-NN indices (exact KD-tree or IVF) over standardized conditions."""
+        df = self.agricultural_df
+        if df is None or not all(c in df.columns for c in KNN_FEATURES.values()):
+            return
+        self.doc_index = np.flatnonzero(
+            df[list(KNN_FEATURES.values())].notna().all(axis=1).to_numpy()
+        )
+        df = df.iloc[self.doc_index]
+
+        for name, col in KNN_FEATURES.items():
+            values = df[col].to_numpy(dtype=float)
+            self.knn_mean[name] = float(values.mean())
+            self.knn_std[name] = float(values.std()) or 1.0
+
+        # One tree with all six conditions, one for queries without P/K
+        for features in (tuple(KNN_FEATURES), KNN_BASE_FEATURES):
+            points = np.column_stack([
+                (df[KNN_FEATURES[f]].to_numpy(dtype=float) - self.knn_mean[f]) / self.knn_std[f]
+                for f in features
+            ])
+            if self.retrieval == "ivf":
+                self.knn_trees[features] = IVFIndex(points, n_probe=self.n_probe)
+            else:
+                self.knn_trees[features] = KDTree(points, leaf_size=40)
 
     def _build_tfidf_index(self):
         """Build TF-IDF index for semantic retrieval over agricultural docs."""
         documents = []
-        self.doc_records = []
 
         # Index agricultural dataset rows as documents
         if self.agricultural_df is not None:
@@ -149,7 +568,7 @@ class AgriKnowledgeBase:
                     f"ph {row.get('ph', '')}"
                 )
                 documents.append(doc)
-                self.doc_records.append(row.to_dict())
+            self.doc_index = self.agricultural_df.index.get_indexer(df.index)
 
         if documents:
             self.vectorizer = TfidfVectorizer(
@@ -162,40 +581,121 @@ class AgriKnowledgeBase:
 
     def query_similar_conditions(
         self, temperature: float, rainfall: float, ph: float,
-        nitrogen: float = 80, top_k: int = 20
+        nitrogen: float = 80, top_k: int = 20,
+        phosphorus: float = None, potassium: float = None,
     ) -> List[Dict]:
-        """Find records with most similar growing conditions via TF-IDF."""
-        if not HAS_SKLEARN or self.vectorizer is None:
-            return self._fallback_query(temperature, rainfall, ph, nitrogen, top_k)
-
-        query = (
-            f"temperature {temperature} rainfall {rainfall} "
-            f"ph {ph} nitrogen {nitrogen}"
+        """Find records with most similar growing conditions (exact k-NN).
+
+        P and K join the distance only when both are given.
+        """
+        return self.query_similar_conditions_batch(
+            [temperature], [rainfall], [ph], [nitrogen], top_k,
+            phosphorus=None if phosphorus is None else [phosphorus],
+            potassium=None if potassium is None else [potassium],
+        )[0]
+
+    def query_similar_conditions_batch(
+        self, temperature, rainfall, ph, nitrogen, top_k: int = 20,
+        chunk_size: int = 512, phosphorus=None, potassium=None,
+    ) -> List[List[Dict]]:
+        """Batched ``query_similar_conditions``.
+
+        ``phosphorus`` / ``potassium`` may be omitted, or contain NaN for
+        rows where they are unknown.
+        """
+        hits, similarity = self.query_similar_indices_batch(
+            temperature, rainfall, ph, nitrogen, top_k, chunk_size,
+            phosphorus=phosphorus, potassium=potassium,
         )
-        query_vec = self.vectorizer.transform([query])
-        similarities = cosine_similarity(query_vec, self.tfidf_matrix).flatten()
-        top_indices = similarities.argsort()[-top_k:][::-1]
-
         results = []
-        for idx in top_indices:
-            rec = self.doc_records[idx].copy()
-            rec["similarity_score"] = float(similarities[idx])
-            results.append(rec)
+        for row_hits, row_sim in zip(hits, similarity):
+            matches = []
+            for i, sim in zip(row_hits, row_sim):
+                rec = self.doc_records[i]
+                rec["similarity_score"] = float(sim)
+                matches.append(rec)
+            results.append(matches)
         return results
 
-    def _fallback_query(self, temperature, rainfall, ph, nitrogen, top_k):
-        """Euclidean distance fallback when sklearn TF-IDF is unavailable."""
-        if self.agricultural_df is None:
-            return []
-        df = self.agricultural_df.copy()
-        df["_dist"] = np.sqrt(
-            ((df["temperature_avg"] - temperature) / 10) ** 2
-            + ((df["rainfall_mm"] - rainfall) / 100) ** 2
-            + ((df["ph"] - ph) / 2) ** 2
-            + ((df["nitrogen"] - nitrogen) / 50) ** 2
-        )
-        top = df.nsmallest(top_k, "_dist")
-        return top.drop(columns=["_dist"]).to_dict("records")
+    def query_similar_indices_batch(
+        self, temperature, rainfall, ph, nitrogen, top_k: int = 20,
+        chunk_size: int = 512, phosphorus=None, potassium=None,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Top-k hits as (B, k) positions into ``doc_records`` + similarities."""
+        n_queries = len(temperature)
+        top_k = min(top_k, len(self.doc_records))
+        if top_k == 0:
+            return np.empty((n_queries, 0), dtype=np.int64), np.empty((n_queries, 0))
+        if self.knn_trees:
+            return self._knn_query(
+                temperature, rainfall, ph, nitrogen, phosphorus, potassium, top_k
+            )
+        if self.vectorizer is not None:
+            return self._tfidf_query(temperature, rainfall, ph, nitrogen, top_k, chunk_size)
+        return self._fallback_query(temperature, rainfall, ph, nitrogen, top_k)
+
+    def _tfidf_query(self, temperature, rainfall, ph, nitrogen, top_k, chunk_size):
+        queries = [
+            f"temperature {t} rainfall {r} ph {p} nitrogen {n}"
+            for t, r, p, n in zip(temperature, rainfall, ph, nitrogen)
+        ]
+        hits, similarity = [], []
+        for start in range(0, len(queries), chunk_size):
+            query_vecs = self.vectorizer.transform(queries[start:start + chunk_size])
+            sims = cosine_similarity(query_vecs, self.tfidf_matrix)
+            top = sims.argsort(axis=1)[:, -top_k:][:, ::-1]
+            hits.append(top)
+            similarity.append(np.take_along_axis(sims, top, axis=1))
+        return np.vstack(hits), np.vstack(similarity)
+
+    def _knn_query(self, temperature, rainfall, ph, nitrogen, phosphorus, potassium, top_k):
+        """Exact top-k over the KD-trees; similarity = 1 / (1 + z-distance)."""
+        n_queries = len(temperature)
+        raw = {
+            "temperature": temperature, "rainfall": rainfall, "ph": ph,
+            "nitrogen": nitrogen,
+            "phosphorus": [np.nan] * n_queries if phosphorus is None else phosphorus,
+            "potassium": [np.nan] * n_queries if potassium is None else potassium,
+        }
+        raw = {f: np.asarray(v, dtype=float) for f, v in raw.items()}
+        has_pk = ~(np.isnan(raw["phosphorus"]) | np.isnan(raw["potassium"]))
+
+        hits = np.empty((n_queries, top_k), dtype=np.int64)
+        similarity = np.empty((n_queries, top_k))
+        for features, rows in (
+            (tuple(KNN_FEATURES), np.flatnonzero(has_pk)),
+            (KNN_BASE_FEATURES, np.flatnonzero(~has_pk)),
+        ):
+            if len(rows) == 0:
+                continue
+            query = np.column_stack([
+                (raw[f][rows] - self.knn_mean[f]) / self.knn_std[f] for f in features
+            ])
+            dist, idx = self.knn_trees[features].query(query, k=top_k)
+            hits[rows] = idx
+            similarity[rows] = 1.0 / (1.0 + dist)
+        return hits, similarity
+
+    def _fallback_query(self, temperature, rainfall, ph, nitrogen, top_k, chunk_size=64):
+        """Brute-force scaled Euclidean search when no sklearn index is available."""
+        store = self.doc_records
+        columns = [
+            (np.asarray(q, dtype=float), store.column(col), scale)
+            for q, col, scale in (
+                (temperature, "temperature_avg", 10), (rainfall, "rainfall_mm", 100),
+                (ph, "ph", 2), (nitrogen, "nitrogen", 50),
+            )
+        ]
+        hits, similarity = [], []
+        for start in range(0, len(temperature), chunk_size):
+            dist = np.sqrt(sum(
+                ((values[None, :] - q[start:start + chunk_size, None]) / scale) ** 2
+                for q, values, scale in columns
+            ))
+            top = np.argsort(dist, axis=1, kind="stable")[:, :top_k]
+            hits.append(top)
+            similarity.append(1.0 / (1.0 + np.take_along_axis(dist, top, axis=1)))
+        return np.vstack(hits), np.vstack(similarity)
 
     def get_crop_statistics(self, crop_name: str) -> Optional[Dict]:
         """Get precomputed statistics for a specific crop."""
@@ -207,108 +707,189 @@ class AgriKnowledgeBase:
 
     def get_best_crops_for_conditions(
         self, temperature: float, rainfall: float, ph: float,
-        nitrogen: float = 80, top_k: int = 5
+        nitrogen: float = 80, top_k: int = 5,
+        phosphorus: float = None, potassium: float = None,
     ) -> List[Dict]:
         """Aggregate similar conditions to find which crops perform best."""
-        similar = self.query_similar_conditions(
-            temperature, rainfall, ph, nitrogen, top_k=50
+        return self.get_best_crops_for_conditions_batch(
+            [temperature], [rainfall], [ph], [nitrogen], top_k,
+            phosphorus=None if phosphorus is None else [phosphorus],
+            potassium=None if potassium is None else [potassium],
+        )[0]
+
+    def get_best_crops_for_conditions_batch(
+        self, temperature, rainfall, ph, nitrogen, top_k: int = 5,
+        phosphorus=None, potassium=None,
+    ) -> List[List[Dict]]:
+        """Batched ``get_best_crops_for_conditions`` for many plots at once."""
+        hits, similarity = self.query_similar_indices_batch(
+            temperature, rainfall, ph, nitrogen, top_k=50,
+            phosphorus=phosphorus, potassium=potassium,
+        )
+        return self._aggregate_by_crop(hits, similarity, top_k)
+
+    def _aggregate_by_crop(self, hits: np.ndarray, similarity: np.ndarray, top_k: int) -> List[List[Dict]]:
+        """Per-crop count / mean yield, price, similarity over (B, k) hits."""
+        n_queries, k = hits.shape
+        if k == 0:
+            return [[] for _ in range(n_queries)]
+        store = self.doc_records
+        labels = list(store.categories["crop"]) + ["unknown"]
+        n_crops = len(labels)
+        codes = store.take("crop", hits).astype(np.int64)
+        codes = np.where(codes < 0, n_crops - 1, codes)
+
+        # One bincount per measure over (query, crop) cells
+        cells = (codes + np.arange(n_queries)[:, None] * n_crops).ravel()
+        size = n_queries * n_crops
+
+        def per_crop(weights=None):
+            return np.bincount(cells, weights=weights, minlength=size).reshape(n_queries, n_crops)
+
+        count = per_crop()
+        yield_sum = per_crop(store.take("yield_tons_per_ha", hits).ravel())
+        price_sum = per_crop(store.take("price_per_ton", hits).ravel())
+        sim_sum = per_crop(similarity.ravel())
+        # Ties keep the order in which crops first appear among the hits
+        first_seen = np.full((n_queries, n_crops), k)
+        np.minimum.at(
+            first_seen,
+            (np.repeat(np.arange(n_queries), k), codes.ravel()),
+            np.tile(np.arange(k), n_queries),
         )
-        if not similar:
-            return []
-
-        # Aggregate by crop
-        crop_agg = defaultdict(lambda: {"yields": [], "prices": [], "count": 0, "sim_scores": []})
-        for rec in similar:
-            crop = rec.get("crop", "unknown")
-            crop_agg[crop]["yields"].append(rec.get("yield_tons_per_ha", 0))
-            crop_agg[crop]["prices"].append(rec.get("price_per_ton", 0))
-            crop_agg[crop]["count"] += 1
-            crop_agg[crop]["sim_scores"].append(rec.get("similarity_score", 0))
 
-        results = []
-        for crop, data in crop_agg.items():
-            results.append({
-                "crop": crop,
-                "avg_yield": np.mean(data["yields"]),
-                "avg_price": np.mean(data["prices"]),
-                "frequency": data["count"],
-                "avg_similarity": np.mean(data["sim_scores"]),
-                "confidence": min(100, data["count"] * 10),
-            })
+        with np.errstate(invalid="ignore", divide="ignore"):
+            avg_yield = yield_sum / count
+            avg_price = price_sum / count
+            avg_sim = sim_sum / count
+        # Crops appearing more often in similar conditions rank first;
+        # every query is ordered at once, crops without hits sort last
+        rank_key = np.where(count > 0, -(count * avg_sim), np.inf)
+        order = np.lexsort((first_seen, rank_key), axis=-1)[:, :top_k]
+        rows = np.arange(n_queries)[:, None]
+        n_found = np.minimum((count > 0).sum(axis=1), top_k).tolist()
+        columns = zip(
+            order.tolist(), avg_yield[rows, order].tolist(), avg_price[rows, order].tolist(),
+            count[rows, order].astype(np.int64).tolist(), avg_sim[rows, order].tolist(),
+        )
 
-        # Sort by frequency * similarity (crops appearing more often in similar conditions)
-        results.sort(key=lambda x: x["frequency"] * x["avg_similarity"], reverse=True)
-        return results[:top_k]
+        return [
+            [
+                {
+                    "crop": labels[c],
+                    "avg_yield": y,
+                    "avg_price": p,
+                    "frequency": n,
+                    "avg_similarity": sim,
+                    "confidence": min(100, n * 10),
+                }
+                for c, y, p, n, sim in zip(*cols)
+            ][:found]
+            for cols, found in zip(columns, n_found)
+        ]
 
     def get_historical_yield_trend(self, crop_name: str, region: str = None) -> Dict:
         """Get year-over-year yield trends for a crop."""
         if self.agricultural_df is None:
             return {"trend": "unknown", "data": []}
-
-        df = self.agricultural_df
-        mask = df["crop"].str.lower() == crop_name.lower()
-        if region:
-            mask &= df["region"].str.lower() == region.lower()
-        crop_data = df[mask]
-
-        if len(crop_data) < 5:
-            return {"trend": "insufficient_data", "data": []}
-
-        yearly = crop_data.groupby("year").agg({
-            "yield_tons_per_ha": "mean",
-            "price_per_ton": "mean",
-        }).reset_index()
-
-        if len(yearly) >= 2:
-            yield_change = (
-                yearly["yield_tons_per_ha"].iloc[-1]
-                - yearly["yield_tons_per_ha"].iloc[0]
-            )
-            if yield_change > 0.5:
-                trend = "increasing"
-            elif yield_change < -0.5:
-                trend = "decreasing"
-            else:
-                trend = "stable"
-        else:
-            trend = "stable"
-
-        return {
-            "trend": trend,
-            "years": yearly["year"].tolist(),
-            "yields": yearly["yield_tons_per_ha"].round(2).tolist(),
-            "prices": yearly["price_per_ton"].round(2).tolist(),
-        }
+        by_region = self.yield_trends.get(crop_name.lower(), {})
+        return by_region.get(
+            region.lower() if region else "",
+            {"trend": "insufficient_data", "data": []},
+        )
 
     def get_region_performance(self, crop_name: str) -> List[Dict]:
         """Which regions perform best for a given crop."""
-        if self.agricultural_df is None:
-            return []
-
-        df = self.agricultural_df
-        crop_data = df[df["crop"].str.lower() == crop_name.lower()]
-        if len(crop_data) == 0:
-            return []
-
-        by_region = crop_data.groupby("region").agg({
-            "yield_tons_per_ha": "mean",
-            "price_per_ton": "mean",
-            "temperature_avg": "mean",
-            "rainfall_mm": "mean",
-        }).reset_index()
-
-        results = []
-        for _, row in by_region.iterrows():
-            results.append({
-                "region": row["region"],
-                "avg_yield": round(float(row["yield_tons_per_ha"]), 2),
-                "avg_price": round(float(row["price_per_ton"]), 2),
-                "avg_temp": round(float(row["temperature_avg"]), 1),
-                "avg_rain": round(float(row["rainfall_mm"]), 1),
-            })
-        results.sort(key=lambda x: x["avg_yield"], reverse=True)
-        return results
+        return self.region_crop_stats.get(crop_name.lower(), [])
 
     @property
     def is_loaded(self) -> bool:
         return self._loaded
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# Worker memory check — how much private memory each extra worker costs
+# ═══════════════════════════════════════════════════════════════════════════════
+
+def _memory_kb() -> Dict[str, int]:
+    """Rss / Pss / private (USS) of this process in kB (Linux only)."""
+    fields = {}
+    with open("/proc/self/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == "kB":
+                fields[parts[0].rstrip(":")] = int(parts[1])
+    return {
+        "rss": fields.get("Rss", 0),
+        "pss": fields.get("Pss", 0),
+        "private": fields.get("Private_Clean", 0) + fields.get("Private_Dirty", 0),
+    }
+
+
+# A worker attached to the snapshot may cost at most this share of the
+# private memory a worker that parses its own copy of the datasets costs
+WORKER_MEMORY_MAX_SHARE = 0.2
+
+
+def _memory_worker(results, barrier, snapshot):
+    global SNAPSHOT_ENABLED
+    SNAPSHOT_ENABLED = snapshot
+    before = _memory_kb()
+    kb = AgriKnowledgeBase()
+    # Touch every array queries read, so shared pages are actually mapped
+    rng = np.random.default_rng(os.getpid())
+    kb.get_best_crops_for_conditions_batch(
+        rng.uniform(10, 38, 256), rng.uniform(20, 300, 256),
+        rng.uniform(4.5, 8.5, 256), rng.uniform(0, 140, 256),
+    )
+    if isinstance(kb.doc_records, _RecordStore):
+        for values in kb.doc_records.values.values():
+            np.asarray(values).sum()
+    after = _memory_kb()
+    results.put({k: after[k] - before[k] for k in after})
+    barrier.wait()          # stay alive until every worker has measured
+
+
+def measure_worker_memory(n_workers: int = 4, snapshot: bool = True) -> List[Dict[str, int]]:
+    """Start ``n_workers`` processes that each load the KB — attached to the
+    snapshot, or parsed from the CSVs with ``snapshot=False``; per-worker kB deltas."""
+    import multiprocessing as mp
+    ctx = mp.get_context("spawn")
+    results, barrier = ctx.Queue(), ctx.Barrier(n_workers)
+    workers = [ctx.Process(target=_memory_worker, args=(results, barrier, snapshot))
+               for _ in range(n_workers)]
+    for w in workers:
+        w.start()
+    deltas = [results.get() for _ in workers]
+    for w in workers:
+        w.join()
+    return deltas
+
+
+if __name__ == "__main__":
+    # Build step: python -m models.knowledge_base --build-snapshot
+    if "--build-snapshot" in sys.argv:
+        SNAPSHOT_ENABLED = False          # always rebuild from the CSVs
+        kb = AgriKnowledgeBase()
+        if not kb.is_loaded or kb.save_snapshot() is None:
+            sys.exit(1)
+    # Memory check: python -m models.knowledge_base --worker-memory 4
+    elif "--worker-memory" in sys.argv:
+        n_workers = int(sys.argv[sys.argv.index("--worker-memory") + 1])
+        SNAPSHOT_ENABLED = True
+        if not AgriKnowledgeBase().is_loaded:     # builds the snapshot the workers attach to
+            sys.exit(1)
+        runs = {"snapshot": measure_worker_memory(n_workers),
+                "no snapshot": measure_worker_memory(n_workers, snapshot=False)}
+        per_worker = {mode: {k: sum(d[k] for d in deltas) // n_workers for k in deltas[0]}
+                      for mode, deltas in runs.items()}
+        print(f"\n📊 KB memory added per worker ({n_workers} workers, mean kB)")
+        for mode, d in per_worker.items():
+            print(f"   {mode:<12}: rss +{d['rss']:,}  pss +{d['pss']:,}  private +{d['private']:,}")
+        share = per_worker["snapshot"]["private"] / max(per_worker["no snapshot"]["private"], 1)
+        ok = share <= WORKER_MEMORY_MAX_SHARE
+        print(f"   {'✅' if ok else '❌'} a snapshot worker adds {share:.0%} of the private memory "
+              f"of a worker with its own copy (limit {WORKER_MEMORY_MAX_SHARE:.0%})")
+        sys.exit(0 if ok else 1)
+    else:
+        print("usage: python -m models.knowledge_base --build-snapshot | --worker-memory N")
@@ -0,0 +1,244 @@
+"""
+llm_cache — Persistent content-addressed cache for LLM responses
+================================================================
+Sits inside ``llm_config.call_gemini`` so identical prompts (same district
+defaults, same crop + month) are answered from disk instead of Groq:
+
+  • Key = sha256 of (model, system prompt, user prompt, temperature, json_mode)
+  • SQLite backend (WAL) shared by threads and worker processes
+  • Per-agent TTLs — market answers age in hours, pest reference in days
+  • Size-bounded LRU eviction on last access time
+  • Hit / miss / eviction counters, overall and per agent
+
+Environment variables (optional):
+  AGRISMART_LLM_CACHE              — "0" disables the cache
+  AGRISMART_LLM_CACHE_PATH         — SQLite file (default database/llm_cache.sqlite)
+  AGRISMART_LLM_CACHE_MAX_ENTRIES  — LRU bound (default 5000)
+  AGRISMART_LLM_CACHE_TTL_<AGENT>  — TTL in seconds, e.g. ..._TTL_MARKET=7200
+
+Inspect / clear from the command line:
+    python -m models.llm_cache [--clear]
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# Configuration
+# ═══════════════════════════════════════════════════════════════════════════════
+
+HOUR = 3600
+DAY = 24 * HOUR
+
+CACHE_ENABLED = os.getenv("AGRISMART_LLM_CACHE", "1") != "0"
+CACHE_PATH = os.getenv(
+    "AGRISMART_LLM_CACHE_PATH",
+    os.path.join(os.path.dirname(__file__), "..", "database", "llm_cache.sqlite"),
+)
+CACHE_MAX_ENTRIES = int(os.getenv("AGRISMART_LLM_CACHE_MAX_ENTRIES", "5000"))
+
+# Seconds a cached answer stays valid, per calling agent
+AGENT_TTLS = {
+    "farmer": 6 * HOUR,
+    "market": 3 * HOUR,          # prices and demand move within a day
+    "weather": 1 * HOUR,
+    "sustainability": 7 * DAY,   # emission factors are static reference data
+    "pest": 3 * DAY,             # pest reference database
+    "synthesis": 6 * HOUR,
+    "panel": 1 * HOUR,           # fused specialists — as short as its weather section
+    "engine": 6 * HOUR,          # custom engine's plain-language advice
+}
+DEFAULT_TTL = 12 * HOUR
+
+for _agent in list(AGENT_TTLS):
+    _override = os.getenv(f"AGRISMART_LLM_CACHE_TTL_{_agent.upper()}")
+    if _override:
+        AGENT_TTLS[_agent] = int(_override)
+
+
+def ttl_for(agent: Optional[str]) -> int:
+    return AGENT_TTLS.get(agent or "", DEFAULT_TTL)
+
+
+def cache_key(model: str, system_prompt: str, user_prompt: str,
+              temperature: float, json_mode: bool) -> str:
+    """Content address of one completion request."""
+    payload = json.dumps(
+        [model, system_prompt, user_prompt, round(float(temperature), 4), bool(json_mode)],
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# SQLite-backed LRU cache
+# ═══════════════════════════════════════════════════════════════════════════════
+
+class LLMCache:
+    """Thread- and process-safe response cache (one connection per thread)."""
+
+    def __init__(self, path: str = CACHE_PATH, max_entries: int = CACHE_MAX_ENTRIES):
+        self.path = os.path.abspath(path)
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "expired": 0, "stores": 0,
+                       "evictions": 0, "bypassed": 0, "errors": 0}
+        self._agent_stats: Dict[str, Dict[str, int]] = {}
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS llm_cache (
+                    key          TEXT PRIMARY KEY,
+                    agent        TEXT,
+                    response     TEXT NOT NULL,
+                    created_at   REAL NOT NULL,
+                    expires_at   REAL NOT NULL,
+                    last_access  REAL NOT NULL
+                )""")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_access "
+                         "ON llm_cache(last_access)")
+            conn.commit()
+            self._local.conn = conn
+        return conn
+
+    def _count(self, event: str, agent: Optional[str]):
+        with self._lock:
+            self._stats[event] += 1
+            per_agent = self._agent_stats.setdefault(
+                agent or "other", {"hits": 0, "misses": 0})
+            if event in per_agent:
+                per_agent[event] += 1
+
+    # ── Lookup / store ────────────────────────────────────────────────
+
+    def get(self, key: str, agent: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """Cached response for ``key`` or None (miss or expired)."""
+        now = time.time()
+        try:
+            conn = self._conn()
+            row = conn.execute(
+                "SELECT response, expires_at FROM llm_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self._count("misses", agent)
+                return None
+            if row[1] <= now:
+                conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                conn.commit()
+                self._count("expired", agent)
+                self._count("misses", agent)
+                return None
+            conn.execute("UPDATE llm_cache SET last_access = ? WHERE key = ?", (now, key))
+            conn.commit()
+            self._count("hits", agent)
+            return json.loads(row[0])
+        except (sqlite3.Error, ValueError) as e:
+            print(f"⚠️ LLM cache read failed: {e}")
+            self._count("errors", agent)
+            return None
+
+    def put(self, key: str, response: Dict[str, Any], agent: Optional[str] = None,
+            ttl: Optional[int] = None):
+        """Store ``response`` under ``key`` and enforce the LRU bound."""
+        now = time.time()
+        ttl = ttl_for(agent) if ttl is None else ttl
+        try:
+            conn = self._conn()
+            conn.execute(
+                "INSERT OR REPLACE INTO llm_cache VALUES (?, ?, ?, ?, ?, ?)",
+                (key, agent, json.dumps(response, ensure_ascii=False),
+                 now, now + ttl, now),
+            )
+            # Drop expired rows, then everything past the newest max_entries
+            evicted = conn.execute(
+                "DELETE FROM llm_cache WHERE expires_at <= ?", (now,)).rowcount
+            evicted += conn.execute(
+                "DELETE FROM llm_cache WHERE key IN (SELECT key FROM llm_cache "
+                "ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            ).rowcount
+            conn.commit()
+            with self._lock:
+                self._stats["stores"] += 1
+                self._stats["evictions"] += evicted
+        except (sqlite3.Error, TypeError, ValueError) as e:
+            print(f"⚠️ LLM cache write failed: {e}")
+            self._count("errors", agent)
+
+    def note_bypass(self, agent: Optional[str] = None):
+        self._count("bypassed", agent)
+
+    def clear(self):
+        conn = self._conn()
+        conn.execute("DELETE FROM llm_cache")
+        conn.commit()
+
+    # ── Metrics ───────────────────────────────────────────────────────
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters for this process plus on-disk size."""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["by_agent"] = {a: dict(s) for a, s in self._agent_stats.items()}
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = round(stats["hits"] / lookups, 3) if lookups else 0.0
+        try:
+            stats["entries"] = self._conn().execute(
+                "SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+        except sqlite3.Error:
+            stats["entries"] = None
+        stats["max_entries"] = self.max_entries
+        stats["path"] = self.path
+        return stats
+
+    def reset_stats(self):
+        with self._lock:
+            for key in self._stats:
+                self._stats[key] = 0
+            self._agent_stats.clear()
+
+
+_cache: Optional[LLMCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_cache() -> Optional[LLMCache]:
+    """The process-wide cache, or None when AGRISMART_LLM_CACHE=0."""
+    global _cache
+    if not CACHE_ENABLED:
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = LLMCache()
+    return _cache
+
+
+if __name__ == "__main__":
+    import sys
+
+    cache = LLMCache()
+    if "--clear" in sys.argv:
+        cache.clear()
+        print(f"🗑️ Cleared {cache.path}")
+    rows = cache._conn().execute(
+        "SELECT agent, COUNT(*), MIN(expires_at) FROM llm_cache GROUP BY agent"
+    ).fetchall()
+    print(f"\n📦 LLM cache {cache.path} — {sum(r[1] for r in rows)} entries "
+          f"(max {cache.max_entries})")
+    for agent, count, soonest in rows:
+        print(f"   {agent or 'other':<15} {count:>6}  TTL {ttl_for(agent) / HOUR:.0f}h, "
+              f"next expiry in {max(0, soonest - time.time()) / 60:.0f} min")
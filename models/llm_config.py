@@ -6,20 +6,60 @@ All agents use this module to make LLM calls with:
   • OpenAI-compatible Groq REST API
   • Automatic JSON parsing
   • Retry with exponential back-off
-  • Rate-limit handling
+  • Proactive requests/min + tokens/min pacing (see models/rate_limiter.py)
   • Graceful fallback on failure
+  • One pooled keep-alive HTTP session shared by every agent
+  • asyncio-native variant (acall_gemini) over a pooled httpx.AsyncClient
+  • Streamed variant (astream_gemini) that yields each top-level JSON
+    member as soon as it is complete (see models/response_schema.py)
+  • Persistent response cache with per-agent TTLs (see models/llm_cache.py)
+  • Single-flight: identical concurrent requests share one upstream call
+  • Circuit breaker: fast-fail to agent fallbacks while Groq is down
+    (see models/circuit_breaker.py)
+  • Request deadlines: timeouts and retries clamped to the caller's
+    remaining budget (see models/deadline.py)
+  • Several OpenAI-compatible providers, routed by latency / error EWMA,
+    with optional hedged requests (see models/llm_router.py)
 
 Environment variables (optional):
-  GROQ_API_KEY  — override the default API key
-  GROQ_MODEL    — override the model (default: llama-3.3-70b-versatile)
+  GROQ_API_KEY        — override the default API key
+  GROQ_MODEL          — override the model (default: llama-3.3-70b-versatile)
+  GROQ_API_URL        — override the endpoint (e.g. a local stand-in server)
+  LLM_POOL_HOSTS      — number of per-host connection pools kept (default 4)
+  LLM_POOL_PER_HOST   — keep-alive connections per host (default 16)
+  LLM_SINGLE_FLIGHT   — "0" stops coalescing identical in-flight requests
+  LLM_PROVIDERS       — JSON list of providers to route across (see llm_router)
+  LLM_HEDGE           — "1" hedges slow requests to a second provider
 """
 
+import asyncio
+import contextvars
+import functools
+import hashlib
 import json
 import os
-import re
+import threading
 import time
 import requests
-from typing import Optional, Dict, Any
+from concurrent import futures
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from typing import Optional, Dict, Any, AsyncIterator, Tuple
+
+from models import deadline, request_scope
+from models.circuit_breaker import OPEN
+from models.llm_cache import cache_key, get_cache
+from models.llm_router import Provider, Router, get_router
+from models.rate_limiter import estimate_tokens
+from models.response_schema import ObjectStream, parse_json
+from models.single_flight import SingleFlight
+
+try:
+    import httpx
+    HAS_HTTPX = True
+except ImportError:
+    HAS_HTTPX = False
 
 
 # ═══════════════════════════════════════════════════════════════════════════════
@@ -28,7 +68,264 @@ from typing import Optional, Dict, Any
 
 GROQ_API_KEY = os.getenv("GROQ_API_KEY", "")
 GROQ_MODEL = os.getenv("GROQ_MODEL", "llama-3.3-70b-versatile")
-GROQ_API_URL = "https://api.groq.com/openai/v1/chat/completions"
+GROQ_API_URL = os.getenv("GROQ_API_URL", "https://api.groq.com/openai/v1/chat/completions")
+
+LLM_POOL_HOSTS = int(os.getenv("LLM_POOL_HOSTS", "4"))
+LLM_POOL_PER_HOST = int(os.getenv("LLM_POOL_PER_HOST", "16"))
+LLM_SINGLE_FLIGHT = os.getenv("LLM_SINGLE_FLIGHT", "1") != "0"
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# Pooled HTTP session + connection / latency counters
+# ═══════════════════════════════════════════════════════════════════════════════
+
+_stats_lock = threading.Lock()
+_http_stats = {"requests": 0, "connections_opened": 0, "errors": 0,
+               "total_latency_ms": 0.0, "max_latency_ms": 0.0}
+
+
+def _count_connection():
+    with _stats_lock:
+        _http_stats["connections_opened"] += 1
+
+
+class _CountingHTTPConnection(HTTPConnection):
+    def connect(self):
+        _count_connection()
+        super().connect()
+
+
+class _CountingHTTPSConnection(HTTPSConnection):
+    def connect(self):
+        _count_connection()         # TCP + TLS handshake
+        super().connect()
+
+
+class _CountingHTTPPool(HTTPConnectionPool):
+    ConnectionCls = _CountingHTTPConnection
+
+
+class _CountingHTTPSPool(HTTPSConnectionPool):
+    ConnectionCls = _CountingHTTPSConnection
+
+
+class _PooledAdapter(HTTPAdapter):
+    """HTTPAdapter whose pools count every new (handshaking) connection."""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _CountingHTTPPool, "https": _CountingHTTPSPool,
+        }
+
+
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+
+
+def configure_http_pool(pool_hosts: int = None, per_host: int = None) -> requests.Session:
+    """(Re)create the shared session with the given pool sizes."""
+    global _session, LLM_POOL_HOSTS, LLM_POOL_PER_HOST
+    with _session_lock:
+        LLM_POOL_HOSTS = pool_hosts or LLM_POOL_HOSTS
+        LLM_POOL_PER_HOST = per_host or LLM_POOL_PER_HOST
+        if _session is not None:
+            _session.close()
+        session = requests.Session()
+        adapter = _PooledAdapter(
+            pool_connections=LLM_POOL_HOSTS, pool_maxsize=LLM_POOL_PER_HOST,
+            max_retries=0,           # call_gemini owns retries
+        )
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        session.headers.update({"Content-Type": "application/json"})
+        _session = session
+        return session
+
+
+def get_session() -> requests.Session:
+    """The process-wide keep-alive session shared by all agents."""
+    return _session or configure_http_pool()
+
+
+def _record_request(elapsed_ms: float, error: bool = False):
+    with _stats_lock:
+        _http_stats["requests"] += 1
+        _http_stats["errors"] += int(error)
+        _http_stats["total_latency_ms"] += elapsed_ms
+        _http_stats["max_latency_ms"] = max(_http_stats["max_latency_ms"], elapsed_ms)
+
+
+def _upstream_error(resp) -> bool:
+    """A response that should steer traffic away from its provider."""
+    return resp is not None and (resp.status_code >= 500 or resp.status_code == 429)
+
+
+def post_completion(body: Dict[str, Any], timeout: float = 30,
+                    provider: Optional[Provider] = None) -> requests.Response:
+    """POST a chat-completion body to ``provider`` (default: the router's
+    pick) over the shared pool."""
+    provider = provider or _router().ranked()[0]
+    request_scope.count("llm_requests")
+    request_scope.count("prompt_tokens", _prompt_tokens(body))
+    start = time.perf_counter()
+    error, resp = False, None
+    provider.begin()
+    try:
+        resp = get_session().post(provider.url, headers=provider.headers(),
+                                  json={**body, "model": provider.model}, timeout=timeout)
+        return resp
+    except Exception:
+        error = True
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        _record_request(elapsed * 1000, error)
+        provider.end(elapsed, error or _upstream_error(resp))
+
+
+# ── Async client: one pooled httpx.AsyncClient per event loop ──────────
+# httpx connection pools are bound to the loop that created them, so a
+# loop-keyed map lets the FastAPI loop and ad-hoc asyncio.run() callers
+# each keep their own keep-alive pool.
+
+_async_clients: Dict[Any, Any] = {}
+
+
+async def _trace_connection(event_name: str, info: Dict):
+    if event_name == "connection.connect_tcp.started":
+        _count_connection()
+
+
+def get_async_client():
+    """The keep-alive httpx.AsyncClient for the running event loop."""
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None or client.is_closed:
+        pool_size = LLM_POOL_HOSTS * LLM_POOL_PER_HOST
+        client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=pool_size,
+                                max_keepalive_connections=pool_size),
+            headers={"Content-Type": "application/json"},
+        )
+        # Forget clients whose loops have gone away
+        for stale in [l for l in _async_clients if l.is_closed()]:
+            del _async_clients[stale]
+        _async_clients[loop] = client
+    return client
+
+
+async def aclose_async_clients():
+    """Close the running loop's async client (call on app shutdown)."""
+    client = _async_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+
+async def post_completion_async(body: Dict[str, Any], timeout: float = 30,
+                                provider: Optional[Provider] = None):
+    """Async POST of a chat-completion body over the loop's pooled client."""
+    provider = provider or _router().ranked()[0]
+    request_scope.count("llm_requests")
+    request_scope.count("prompt_tokens", _prompt_tokens(body))
+    start = time.perf_counter()
+    error, cancelled, resp = False, False, None
+    provider.begin()
+    try:
+        resp = await get_async_client().post(
+            provider.url, headers=provider.headers(), json={**body, "model": provider.model},
+            timeout=timeout, extensions={"trace": _trace_connection},
+        )
+        return resp
+    except asyncio.CancelledError:
+        cancelled = True           # a hedge lost the race — not a latency sample
+        raise
+    except Exception:
+        error = True
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        _record_request(elapsed * 1000, error)
+        provider.end(None if cancelled else elapsed, error or _upstream_error(resp))
+
+
+async def _stream_completion(body: Dict[str, Any], timeout: float, usage: Dict[str, Any],
+                             provider: Provider) -> AsyncIterator[str]:
+    """Content deltas of one streamed chat completion (SSE ``data:`` lines).
+
+    Provider-reported token usage, if the final chunk carries it, is
+    copied into ``usage``. A server that ignores ``stream`` and answers
+    with a plain completion yields its whole content at once.
+    """
+    request_scope.count("llm_requests")
+    request_scope.count("prompt_tokens", _prompt_tokens(body))
+    start = time.perf_counter()
+    error, cancelled = False, False
+    provider.begin()
+    try:
+        async with get_async_client().stream(
+            "POST", provider.url, headers=provider.headers(),
+            json={**body, "model": provider.model, "stream": True},
+            timeout=timeout, extensions={"trace": _trace_connection},
+        ) as resp:
+            resp.raise_for_status()
+            if "text/event-stream" not in resp.headers.get("content-type", ""):
+                data = json.loads(await resp.aread())
+                usage.update(data.get("usage") or {})
+                for choice in data.get("choices", [])[:1]:
+                    yield choice["message"]["content"]
+                return
+            async for line in resp.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                data = line[5:].strip()
+                if data == "[DONE]":
+                    break
+                chunk = json.loads(data)
+                usage.update(chunk.get("usage") or (chunk.get("x_groq") or {}).get("usage") or {})
+                for choice in chunk.get("choices", [])[:1]:
+                    text = (choice.get("delta") or {}).get("content")
+                    if text:
+                        yield text
+    except (asyncio.CancelledError, GeneratorExit):
+        cancelled = True           # the reader stopped early — not a latency sample
+        raise
+    except Exception:
+        error = True
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        _record_request(elapsed * 1000, error)
+        provider.end(None if cancelled else elapsed, error)
+
+
+def get_http_stats() -> Dict[str, float]:
+    """Snapshot of the LLM HTTP counters (handshakes, reuse, latency)."""
+    with _stats_lock:
+        stats = dict(_http_stats)
+    n = stats["requests"]
+    stats["avg_latency_ms"] = round(stats["total_latency_ms"] / n, 2) if n else 0.0
+    stats["connection_reuse_ratio"] = (
+        round(1 - stats["connections_opened"] / n, 3) if n else 0.0
+    )
+    stats["pool_hosts"] = LLM_POOL_HOSTS
+    stats["pool_per_host"] = LLM_POOL_PER_HOST
+    stats["single_flight"] = _llm_flight.stats()
+    stats["router"] = _router().stats()
+    stats["rate_limit"] = {p.name: p.limiter.stats() if p.limiter else {"enabled": False}
+                           for p in _router().providers}
+    return stats
+
+
+def reset_http_stats():
+    with _stats_lock:
+        for key in _http_stats:
+            _http_stats[key] = 0 if key in ("requests", "connections_opened", "errors") else 0.0
+    _llm_flight.reset_stats()
+    _router().reset_stats()
+    for provider in _router().providers:
+        if provider.limiter is not None:
+            provider.limiter.reset_stats()
 
 
 # ═══════════════════════════════════════════════════════════════════════════════
@@ -43,6 +340,8 @@ def call_gemini(
     json_mode: bool = True,
     max_retries: int = 2,
     timeout: int = 30,
+    use_cache: bool = True,
+    agent: Optional[str] = None,
 ) -> Optional[Dict[str, Any]]:
     """Call Groq API (Llama 3.3 70B) with system + user prompts.
 
@@ -56,132 +355,686 @@ def call_gemini(
         json_mode:     If True, requests JSON output and parses it.
         max_retries:   Number of retry attempts on transient failures.
         timeout:       HTTP request timeout in seconds.
+        use_cache:     If False, skip the response cache for this call.
+        agent:         Calling agent ("market", "pest", ...) — picks the cache TTL.
 
     Returns:
         Parsed dict on success, None on failure.
     """
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {GROQ_API_KEY}",
-    }
-
-    # Build messages array (OpenAI format)
-    messages = [
-        {"role": "system", "content": system_prompt},
-        {"role": "user", "content": user_prompt},
-    ]
+    cache, key, hit = _cache_lookup(
+        system_prompt, user_prompt, temperature, json_mode, use_cache, agent)
+    if hit is not None:
+        return hit
 
-    body = {
-        "model": GROQ_MODEL,
-        "messages": messages,
-        "temperature": temperature,
-        "max_tokens": max_tokens,
-    }
+    body = _completion_body(system_prompt, user_prompt, temperature, max_tokens, json_mode)
+    if LLM_SINGLE_FLIGHT:
+        # Identical concurrent requests share one upstream call
+        result = _llm_flight.do(_flight_key(body), _request_with_retries,
+                                body, json_mode, max_retries, timeout, agent)
+    else:
+        result = _request_with_retries(body, json_mode, max_retries, timeout, agent)
+    if result is not None and cache is not None:
+        cache.put(key, result, agent)
+    return result
 
-    # Groq supports JSON mode for structured output
-    if json_mode:
-        body["response_format"] = {"type": "json_object"}
 
+def _request_with_retries(body: Dict[str, Any], json_mode: bool, max_retries: int,
+                          timeout: float, agent: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    router, tried = _router(), []
     for attempt in range(max_retries + 1):
+        if deadline.expired():
+            return _cut_short(agent)
+        provider = _route(router, tried)
+        if provider is None:
+            return None                        # every circuit open — caller falls back
+        tried.append(provider)
+        breaker, limiter = provider.breaker, provider.limiter
+        reserved = _reserved_tokens(body, limiter)
         try:
-            resp = requests.post(
-                GROQ_API_URL, headers=headers,
-                json=body, timeout=timeout,
-            )
+            # paced before sending, not after a 429; give up if the queue outlasts the deadline
+            if limiter is not None and limiter.acquire(reserved, deadline.remaining()) is None:
+                return _cut_short(agent, breaker)
+            provider, resp = _post_hedged(router, provider, body, deadline.clamp_timeout(timeout),
+                                          reserved)
+            breaker = provider.breaker
             resp.raise_for_status()
-            result = resp.json()
-
-            # Extract text from OpenAI-format response
-            choices = result.get("choices", [])
-            if not choices:
-                print(f"[Groq] No choices in response (attempt {attempt + 1})")
-                if attempt < max_retries:
+            data = resp.json()
+            if breaker is not None:
+                breaker.record_success()
+            _settle_usage(provider.limiter, reserved, data)
+            result = _completion_result(data, json_mode, attempt)
+            if result is _NO_CHOICES:
+                if attempt < max_retries and deadline.fits(1):
                     time.sleep(1)
                     continue
                 return None
-
-            text = choices[0]["message"]["content"]
-
-            if json_mode:
-                return _parse_json(text)
-            else:
-                return {"text": text}
+            return result
 
         except requests.exceptions.Timeout:
             print(f"[Groq] Timeout (attempt {attempt + 1}/{max_retries + 1})")
+            if deadline.expired():             # our budget, not an upstream fault
+                return _cut_short(agent, breaker)
+            _record_failure(breaker, "timeout")
         except requests.exceptions.ConnectionError as e:
             print(f"[Groq] Connection error (attempt {attempt + 1}): {e}")
+            _record_failure(breaker, "connection error")
         except requests.exceptions.HTTPError as e:
-            status = e.response.status_code if e.response else 0
-            body_text = ""
-            try:
-                body_text = e.response.text[:300] if e.response else ""
-            except Exception:
-                pass
-            print(f"[Groq] HTTP {status} (attempt {attempt + 1}): {body_text}")
-            if status == 429:          # rate-limited
-                wait = min(2 ** (attempt + 1), 10)
-                print(f"   ⏳ Rate-limited — waiting {wait}s...")
-                time.sleep(wait)
-                continue
-            if status >= 500:          # server error — retry
-                time.sleep(1)
-                continue
-            # For unexpected status (including 0), retry once
-            if attempt < max_retries:
-                time.sleep(2)
-                continue
+            _record_http_error(breaker, e.response)
+            wait = _http_error_wait(e.response, attempt, max_retries)
+            if wait is None or router.all_open():
+                return None
+            wait = _backoff(router, tried, wait)
+            if not deadline.fits(wait):
+                return _cut_short(agent)
+            time.sleep(wait)
+            continue
+        except Exception as e:
+            print(f"[Groq] Error: {e}")
+            _record_failure(breaker, type(e).__name__)
+
+        if attempt < max_retries:
+            if router.all_open():
+                return None
+            wait = _backoff(router, tried, 2)
+            if not deadline.fits(wait):
+                return _cut_short(agent)
+            time.sleep(wait)
+
+    return None
+
+
+async def acall_gemini(
+    system_prompt: str,
+    user_prompt: str,
+    temperature: float = 0.3,
+    max_tokens: int = 2048,
+    json_mode: bool = True,
+    max_retries: int = 2,
+    timeout: int = 30,
+    use_cache: bool = True,
+    agent: Optional[str] = None,
+) -> Optional[Dict[str, Any]]:
+    """Async twin of call_gemini — same arguments, retries and return value.
+
+    Awaits the HTTP round-trip on the running event loop instead of
+    blocking a thread, so many concurrent recommendations can share one
+    loop. Without httpx installed it runs call_gemini in a worker thread.
+    """
+    if not HAS_HTTPX:
+        return await asyncio.to_thread(
+            call_gemini, system_prompt, user_prompt, temperature,
+            max_tokens, json_mode, max_retries, timeout, use_cache, agent,
+        )
+
+    cache, key, hit = await _acache_lookup(
+        system_prompt, user_prompt, temperature, json_mode, use_cache, agent)
+    if hit is not None:
+        return hit
+
+    body = _completion_body(system_prompt, user_prompt, temperature, max_tokens, json_mode)
+    if LLM_SINGLE_FLIGHT:
+        result = await _llm_flight.do_async(_flight_key(body), _arequest_with_retries,
+                                            body, json_mode, max_retries, timeout, agent)
+    else:
+        result = await _arequest_with_retries(body, json_mode, max_retries, timeout, agent)
+    if result is not None and cache is not None:
+        await asyncio.to_thread(cache.put, key, result, agent)
+    return result
+
+
+async def _arequest_with_retries(body: Dict[str, Any], json_mode: bool, max_retries: int,
+                                 timeout: float, agent: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    router, tried = _router(), []
+    for attempt in range(max_retries + 1):
+        if deadline.expired():
+            return _cut_short(agent)
+        provider = _route(router, tried)
+        if provider is None:
             return None
+        tried.append(provider)
+        breaker, limiter = provider.breaker, provider.limiter
+        reserved = _reserved_tokens(body, limiter)
+        try:
+            # give up if the queue outlasts the deadline
+            if limiter is not None and await limiter.acquire_async(reserved, deadline.remaining()) is None:
+                return _cut_short(agent, breaker)
+            provider, resp = await _apost_hedged(router, provider, body,
+                                                 deadline.clamp_timeout(timeout), reserved)
+            breaker = provider.breaker
+            resp.raise_for_status()
+            data = resp.json()
+            if breaker is not None:
+                breaker.record_success()
+            _settle_usage(provider.limiter, reserved, data)
+            result = _completion_result(data, json_mode, attempt)
+            if result is _NO_CHOICES:
+                if attempt < max_retries and deadline.fits(1):
+                    await asyncio.sleep(1)
+                    continue
+                return None
+            return result
+
+        except httpx.TimeoutException:
+            print(f"[Groq] Timeout (attempt {attempt + 1}/{max_retries + 1})")
+            if deadline.expired():             # our budget, not an upstream fault
+                return _cut_short(agent, breaker)
+            _record_failure(breaker, "timeout")
+        except httpx.TransportError as e:
+            print(f"[Groq] Connection error (attempt {attempt + 1}): {e}")
+            _record_failure(breaker, "connection error")
+        except httpx.HTTPStatusError as e:
+            _record_http_error(breaker, e.response)
+            wait = _http_error_wait(e.response, attempt, max_retries)
+            if wait is None or router.all_open():
+                return None
+            wait = _backoff(router, tried, wait)
+            if not deadline.fits(wait):
+                return _cut_short(agent)
+            await asyncio.sleep(wait)
+            continue
         except Exception as e:
             print(f"[Groq] Error: {e}")
+            _record_failure(breaker, type(e).__name__)
 
         if attempt < max_retries:
-            time.sleep(2)
+            if router.all_open():
+                return None
+            wait = _backoff(router, tried, 2)
+            if not deadline.fits(wait):
+                return _cut_short(agent)
+            await asyncio.sleep(wait)
 
     return None
 
 
+async def astream_gemini(
+    system_prompt: str,
+    user_prompt: str,
+    temperature: float = 0.3,
+    max_tokens: int = 2048,
+    timeout: int = 30,
+    use_cache: bool = True,
+    agent: Optional[str] = None,
+) -> AsyncIterator[Tuple[str, Any]]:
+    """Streamed JSON completion — yields ``(key, value)`` for each top-level
+    member of the reply object as soon as that member is complete.
+
+    Same cache, rate limit, circuit breaker and deadline handling as
+    acall_gemini. The stream is sent without JSON mode (Groq does not
+    stream it); prose or fences around the object are tolerated. If the
+    stream fails, the rest comes from acall_gemini (with its retries) —
+    members already yielded are not repeated. Yields nothing when the
+    LLM is unavailable, so callers fall back per missing member.
+    """
+    cache, key, hit = await _acache_lookup(system_prompt, user_prompt, temperature, True, use_cache, agent)
+    if hit is not None:
+        for member in hit.items():
+            yield member
+        return
+
+    yielded = set()
+    result = None
+    if HAS_HTTPX:
+        body = _completion_body(system_prompt, user_prompt, temperature, max_tokens, json_mode=False)
+        if deadline.expired():
+            _cut_short(agent)
+            return
+        provider = _route(_router(), ())
+        if provider is None:
+            return
+        breaker, limiter = provider.breaker, provider.limiter
+        reserved = _reserved_tokens(body, limiter)
+        if limiter is not None and await limiter.acquire_async(reserved, deadline.remaining()) is None:
+            _cut_short(agent, breaker)
+            return
+
+        stream, usage = ObjectStream(), {}
+        chunks = _stream_completion(body, deadline.clamp_timeout(timeout), usage, provider)
+        try:
+            async for text in chunks:
+                for name, value in stream.feed(text):
+                    yielded.add(name)
+                    yield name, value
+            if breaker is not None:
+                breaker.record_success()
+            _settle_usage(limiter, reserved, {"usage": usage})
+            result = stream.close()
+            if result is None:
+                print("[Groq] Streamed reply ended before its JSON object closed — retrying without streaming")
+        except (asyncio.CancelledError, GeneratorExit):
+            if breaker is not None:
+                breaker.release()
+            raise
+        except httpx.TimeoutException:
+            print("[Groq] Stream timed out")
+            if deadline.expired():
+                _cut_short(agent, breaker)
+                return
+            _record_failure(breaker, "timeout")
+        except httpx.TransportError as e:
+            print(f"[Groq] Stream connection error: {e}")
+            _record_failure(breaker, "connection error")
+        except httpx.HTTPStatusError as e:
+            print(f"[Groq] Stream HTTP {e.response.status_code}")
+            _record_http_error(breaker, e.response)
+        except Exception as e:
+            print(f"[Groq] Stream error: {e}")
+            _record_failure(breaker, type(e).__name__)
+        finally:
+            await chunks.aclose()         # the connection goes back to the pool
+
+    if result is None:
+        result = await acall_gemini(system_prompt, user_prompt, temperature, max_tokens,
+                                    timeout=timeout, use_cache=use_cache, agent=agent)
+    elif cache is not None:
+        await asyncio.to_thread(cache.put, key, result, agent)
+    for name, value in (result or {}).items():
+        if name not in yielded:
+            yield name, value
+
+
 def call_gemini_text(
     system_prompt: str,
     user_prompt: str,
     temperature: float = 0.5,
     timeout: int = 30,
+    use_cache: bool = True,
+    max_retries: int = 2,
+    agent: Optional[str] = None,
 ) -> str:
     """Convenience wrapper — returns plain text (empty string on failure)."""
     result = call_gemini(
         system_prompt, user_prompt,
-        temperature=temperature, json_mode=False, timeout=timeout,
+        temperature=temperature, json_mode=False, max_retries=max_retries,
+        timeout=timeout, use_cache=use_cache, agent=agent,
     )
     return result.get("text", "") if result else ""
 
 
 # ═══════════════════════════════════════════════════════════════════════════════
-# Helpers
+# Provider routing + hedged requests (see models/llm_router.py)
 # ═══════════════════════════════════════════════════════════════════════════════
 
-def _parse_json(text: str) -> Optional[Dict]:
-    """Robustly parse JSON from LLM output."""
-    # Direct parse
-    try:
-        return json.loads(text)
-    except json.JSONDecodeError:
-        pass
+def _router() -> Router:
+    """The provider router. Without LLM_PROVIDERS its one provider follows
+    GROQ_API_URL / GROQ_MODEL / GROQ_API_KEY (demos repoint them at runtime)."""
+    router = get_router()
+    if not router.configured:
+        router.use_default(GROQ_API_URL, GROQ_MODEL, GROQ_API_KEY)
+    return router
 
-    # Strip markdown fences: ```json ... ```
-    match = re.search(r"```(?:json)?\s*(.*?)\s*```", text, re.DOTALL)
-    if match:
-        try:
-            return json.loads(match.group(1))
-        except json.JSONDecodeError:
-            pass
 
-    # Last resort: find first { ... } block
-    match = re.search(r"\{.*\}", text, re.DOTALL)
-    if match:
+def _route(router: Router, tried) -> Optional[Provider]:
+    """Best provider whose circuit lets this attempt through (None: all open)."""
+    for provider in router.ranked(tried):
+        if _breaker_allows(provider):
+            return provider
+    return None
+
+
+def _backoff(router: Router, tried, seconds: float) -> float:
+    """Back-off before a retry — none when it can go to an untried provider."""
+    upcoming = router.ranked(tried)[0]
+    breaker = upcoming.breaker
+    if upcoming not in tried and (breaker is None or breaker.state != OPEN):
+        return 0.0
+    return seconds
+
+
+def _hedge_backup(router: Router, primary: Provider, reserved: int) -> Optional[Provider]:
+    """Second provider for a hedge, if the hedge budget, its circuit and
+    its rate limiter allow it now."""
+    if not router.spend_hedge():
+        return None
+    for backup in router.ranked([primary]):
+        if backup is primary or not _breaker_allows(backup):
+            continue
+        limiter = backup.limiter
+        if limiter is not None and limiter.acquire(reserved, max_wait=0) is None:
+            if backup.breaker is not None:
+                backup.breaker.release()
+            return None                  # no spare budget — keep waiting on the primary
+        backup.note("hedges")
+        return backup
+    return None
+
+
+def _answered(future) -> bool:
+    """Finished with a 2xx/3xx response (requests or httpx)."""
+    return (not future.cancelled() and future.exception() is None
+            and future.result().status_code < 400)
+
+
+def _settle_other(provider: Provider, reserved: int, future):
+    """Breaker outcome and token reservation of the request that did not
+    become the answer: settled with its usage if it answered, refunded
+    if it was cancelled or failed."""
+    limiter = provider.limiter
+    if limiter is not None and not _answered(future):
+        limiter.settle(reserved, 0)            # nothing came back — hand the tokens back
+    elif limiter is not None:
         try:
-            return json.loads(match.group(0))
-        except json.JSONDecodeError:
+            _settle_usage(limiter, reserved, future.result().json())
+        except ValueError:
             pass
+    breaker = provider.breaker
+    if breaker is None:
+        return
+    if future.cancelled():
+        breaker.release()
+    elif future.exception() is not None:
+        breaker.record_failure(type(future.exception()).__name__)
+    elif future.result().status_code < 400:
+        breaker.record_success()
+    else:
+        _record_http_error(breaker, future.result())
+
+
+_hedge_executor: Optional[futures.ThreadPoolExecutor] = None
+_hedge_lock = threading.Lock()
+
+
+def _hedge_pool() -> futures.ThreadPoolExecutor:
+    global _hedge_executor
+    if _hedge_executor is None:
+        with _hedge_lock:
+            if _hedge_executor is None:
+                _hedge_executor = futures.ThreadPoolExecutor(
+                    max_workers=LLM_POOL_HOSTS * LLM_POOL_PER_HOST, thread_name_prefix="llm-hedge")
+    return _hedge_executor
+
+
+def _post_hedged(router: Router, provider: Provider, body: Dict[str, Any], timeout: float,
+                 reserved: int):
+    """POST to ``provider``; past its p95 also to the next-best provider.
+
+    → (provider, response) of the first good answer — or the primary's
+    own outcome (response or exception) when neither answered well.
+    """
+    delay = router.hedge_delay(provider)
+    if delay is None or delay >= timeout:
+        return provider, post_completion(body, timeout, provider)
+
+    def submit(target: Provider):
+        return _hedge_pool().submit(contextvars.copy_context().run,
+                                    post_completion, body, timeout, target)
+
+    primary = submit(provider)
+    calls = {primary: provider}
+    chosen = None
+    try:
+        if not futures.wait([primary], timeout=delay).done:
+            backup = _hedge_backup(router, provider, reserved)
+            if backup is not None:
+                calls[submit(backup)] = backup
+        pending = set(calls)
+        while pending and chosen is None:
+            done, pending = futures.wait(pending, return_when=futures.FIRST_COMPLETED)
+            chosen = next((f for f in done if _answered(f)), None)
+        chosen = chosen or primary
+    finally:
+        for future, target in calls.items():
+            if target is not calls.get(chosen, provider):
+                future.add_done_callback(functools.partial(_settle_other, target, reserved))
+    if calls[chosen] is not provider:
+        calls[chosen].note("hedge_wins")
+    return calls[chosen], chosen.result()
+
+
+async def _apost_hedged(router: Router, provider: Provider, body: Dict[str, Any],
+                        timeout: float, reserved: int):
+    """Async _post_hedged; the losing request is cancelled."""
+    delay = router.hedge_delay(provider)
+    if delay is None or delay >= timeout:
+        return provider, await post_completion_async(body, timeout, provider)
+
+    primary = asyncio.ensure_future(post_completion_async(body, timeout, provider))
+    calls = {primary: provider}
+    chosen, pending = None, {primary}
+    try:
+        done, _ = await asyncio.wait([primary], timeout=delay)
+        if not done:
+            backup = _hedge_backup(router, provider, reserved)
+            if backup is not None:
+                calls[asyncio.ensure_future(post_completion_async(body, timeout, backup))] = backup
+        pending = set(calls)
+        while pending and chosen is None:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            chosen = next((t for t in done if _answered(t)), None)
+        chosen = chosen or primary
+    finally:
+        for task in pending:
+            task.cancel()
+        for task, target in calls.items():
+            if target is not calls.get(chosen, provider):
+                task.add_done_callback(functools.partial(_settle_other, target, reserved))
+    if calls[chosen] is not provider:
+        calls[chosen].note("hedge_wins")
+    return calls[chosen], chosen.result()
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# Helpers
+# ═══════════════════════════════════════════════════════════════════════════════
+
+_NO_CHOICES = object()      # sentinel: response had no choices — retryable
+
+
+_llm_flight = SingleFlight("llm")
+
+
+def _flight_key(body: Dict[str, Any]) -> str:
+    return hashlib.sha256(json.dumps(body, sort_keys=True).encode("utf-8")).hexdigest()
+
 
+def _cache_lookup(system_prompt: str, user_prompt: str, temperature: float,
+                  json_mode: bool, use_cache: bool, agent: Optional[str]):
+    """→ (cache, key, cached response); cache is None when disabled/bypassed."""
+    cache = get_cache()
+    if cache is None:
+        return None, None, None
+    if not use_cache:
+        cache.note_bypass(agent)
+        return None, None, None
+    key = cache_key(_router().model_key, system_prompt, user_prompt, temperature, json_mode)
+    hit = cache.get(key, agent)
+    if hit is not None:
+        request_scope.count("llm_cache_hits")
+    return cache, key, hit
+
+
+async def _acache_lookup(system_prompt: str, user_prompt: str, temperature: float,
+                         json_mode: bool, use_cache: bool, agent: Optional[str]):
+    """_cache_lookup in a worker thread: a SQLite read (and a hit's
+    UPDATE + COMMIT under WAL contention) must not stall the event loop."""
+    if get_cache() is None:
+        return None, None, None
+    return await asyncio.to_thread(_cache_lookup, system_prompt, user_prompt,
+                                   temperature, json_mode, use_cache, agent)
+
+
+def _completion_body(system_prompt: str, user_prompt: str, temperature: float,
+                     max_tokens: int, json_mode: bool) -> Dict[str, Any]:
+    """OpenAI-format chat-completion request body."""
+    body = {
+        "model": GROQ_MODEL,
+        "messages": [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt},
+        ],
+        "temperature": temperature,
+        "max_tokens": max_tokens,
+    }
+    # Groq supports JSON mode for structured output
+    if json_mode:
+        body["response_format"] = {"type": "json_object"}
+    return body
+
+
+def _breaker_allows(provider: Provider) -> bool:
+    """Gate one attempt; a missing key opens the circuit without a request."""
+    breaker = provider.breaker
+    if breaker is None:
+        return True
+    if not provider.api_key and provider.url.startswith("https://api.groq.com"):
+        breaker.trip(f"{provider.key_env or 'API key'} is not set")
+        return False
+    return breaker.allow()
+
+
+def _cut_short(agent: Optional[str], breaker=None) -> None:
+    """Give up because the request deadline is spent (not an upstream fault)."""
+    if breaker is not None:
+        breaker.release()
+    deadline.note_cut_short(agent)
+    print(f"[Groq] Deadline reached — {agent or 'call'} falls back")
+    return None
+
+
+def _record_failure(breaker, reason: str):
+    if breaker is not None:
+        breaker.record_failure(reason)
+
+
+def _record_http_error(breaker, response):
+    """Classify an HTTP error for the breaker."""
+    if breaker is None:
+        return
+    status = response.status_code if response is not None else 0
+    if status in (401, 403):
+        breaker.trip(f"HTTP {status} — check GROQ_API_KEY")
+    elif status >= 500 or status == 0:
+        breaker.record_failure(f"HTTP {status}")
+    else:
+        breaker.release()      # 429 / bad request say nothing about availability
+
+
+def _prompt_tokens(body: Dict[str, Any]) -> int:
+    return estimate_tokens(*(m["content"] for m in body.get("messages", [])))
+
+
+def _reserved_tokens(body: Dict[str, Any], limiter) -> int:
+    """Token-bucket reservation: prompt estimate + the expected completion
+    (the limiter's running mean, capped at ``max_tokens``)."""
+    if limiter is None:
+        return 0
+    return _prompt_tokens(body) + limiter.completion_estimate(body.get("max_tokens", 0))
+
+
+def _settle_usage(limiter, reserved: int, data: Dict):
+    """Reconcile the reservation with the provider-reported usage."""
+    if limiter is not None:
+        usage = data.get("usage") or {}
+        limiter.settle(reserved, usage.get("total_tokens"), usage.get("completion_tokens"))
+
+
+def _completion_result(result: Dict, json_mode: bool, attempt: int):
+    """Extract the reply from an OpenAI-format response (or _NO_CHOICES)."""
+    choices = result.get("choices", [])
+    if not choices:
+        print(f"[Groq] No choices in response (attempt {attempt + 1})")
+        return _NO_CHOICES
+
+    text = choices[0]["message"]["content"]
+    if json_mode:
+        return _parse_json(text)
+    return {"text": text}
+
+
+def _http_error_wait(response, attempt: int, max_retries: int) -> Optional[float]:
+    """Back-off in seconds before retrying an HTTP error, or None to give up."""
+    status = response.status_code if response is not None else 0
+    body_text = ""
+    try:
+        body_text = response.text[:300] if response is not None else ""
+    except Exception:
+        pass
+    print(f"[Groq] HTTP {status} (attempt {attempt + 1}): {body_text}")
+    if status == 429:          # rate-limited
+        wait = min(2 ** (attempt + 1), 10)
+        print(f"   ⏳ Rate-limited — waiting {wait}s...")
+        return wait
+    if status >= 500:          # server error — retry
+        return 1
+    # For unexpected status (including 0), retry once
+    if attempt < max_retries:
+        return 2
+    return None
+
+
+def _parse_json(text: str) -> Optional[Dict]:
+    """Robustly parse JSON from LLM output (bare, fenced or wrapped in prose)."""
+    result = parse_json(text)
+    if result is not None:
+        return result
     print(f"[Groq] Could not parse JSON from response: {text[:200]}...")
     return None
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# Connection-reuse benchmark against a local stand-in server
+#   python -m models.llm_config [n_calls]
+# ═══════════════════════════════════════════════════════════════════════════════
+
+if __name__ == "__main__":
+    import sys
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    from models import rate_limiter
+
+    class _StandIn(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"      # keep-alive
+        disable_nagle_algorithm = True
+        wbufsize = -1                      # one write per response
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            payload = json.dumps({"choices": [{"message": {"content": '{"ok": true}'}}]}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, *args):
+            pass
+
+    n_calls = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    rate_limiter.RATE_LIMIT_ENABLED = False    # the stand-in has no rate limit
+    ThreadingHTTPServer.request_queue_size = 1024     # accept concurrent connects
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _StandIn)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    GROQ_API_URL = f"http://127.0.0.1:{server.server_port}/v1/chat/completions"
+
+    # Old behaviour: a fresh connection per call
+    start = time.perf_counter()
+    for _ in range(n_calls):
+        requests.post(GROQ_API_URL, json={"messages": []}, timeout=5,
+                      headers={"Connection": "close"}).json()
+    fresh_ms = (time.perf_counter() - start) / n_calls * 1000
+
+    reset_http_stats()
+    for _ in range(n_calls):
+        call_gemini("system", "user", use_cache=False)
+    stats = get_http_stats()
+
+    # Async client: all calls in flight at once on a single event loop
+    async def _concurrent():
+        await asyncio.gather(*(acall_gemini("system", f"user {i}", use_cache=False)
+                               for i in range(n_calls)))
+        await aclose_async_clients()
+
+    reset_http_stats()
+    start = time.perf_counter()
+    asyncio.run(_concurrent())
+    async_wall_ms = (time.perf_counter() - start) * 1000
+    async_stats = get_http_stats()
+    server.shutdown()
+
+    print(f"\n📊 {n_calls} calls to a local stand-in server")
+    print(f"   fresh connection per call : {fresh_ms:.2f} ms/call, {n_calls} handshakes")
+    print(f"   pooled session            : {stats['avg_latency_ms']:.2f} ms/call, "
+          f"{stats['connections_opened']} handshakes "
+          f"(reuse ratio {stats['connection_reuse_ratio']})")
+    if HAS_HTTPX:
+        print(f"   async, all concurrent     : {async_wall_ms:.1f} ms wall, "
+              f"{async_stats['connections_opened']} handshakes on one event loop")
@@ -0,0 +1,452 @@
+"""
+llm_router — Latency-aware routing across OpenAI-compatible LLM providers
+=========================================================================
+By default every LLM call goes to one endpoint: GROQ_API_URL with
+GROQ_MODEL. ``LLM_PROVIDERS`` lists several OpenAI-compatible
+chat-completion endpoints instead (Groq, a second Groq key, a hosted
+Llama, a local vLLM...) and llm_config spreads the calls over them:
+
+  • Each provider keeps an EWMA of its latency and of its error rate
+    (5xx, 429, timeouts, connection errors). Both decay while a provider
+    is idle, so a provider that was slow once gets tried again later.
+  • A call goes to the cheaper of two providers drawn by weight
+    ("power of two choices"):
+        cost = (latency EWMA + error rate × ERROR_COST) × (in flight + 1) / weight
+    A provider that has not answered yet costs nothing, so it is tried first.
+  • Retries of a failed call go to a provider not tried yet.
+  • Each provider has its own circuit breaker (models/circuit_breaker.py);
+    agents fall back only when every provider's circuit is open.
+  • Hedging (LLM_HEDGE=1): if the chosen provider has not answered by
+    its own p95 latency, the same request also goes to the next-best
+    provider, and the first good answer wins. That costs about 5% extra
+    requests and cuts the tail. The async path cancels the losing
+    request. A hedge is sent only if the backup's rate limiter has room
+    right away and the hedge budget allows it; the loser's reservation
+    is settled with its reported usage, or refunded if it was cancelled
+    or failed. When every provider is slow, the budget (LLM_HEDGE_BUDGET
+    hedges per request) stops hedging from doubling the load.
+  • Each provider has its own requests/min + tokens/min limiter
+    (models/rate_limiter.py), "rpm" / "tpm" in LLM_PROVIDERS (default
+    LLM_RATE_RPM / LLM_RATE_TPM, 0 = unlimited).
+
+Environment variables (optional):
+  LLM_PROVIDERS           — JSON list of providers, e.g.
+        [{"name": "groq", "url": "https://api.groq.com/openai/v1/chat/completions",
+          "model": "llama-3.3-70b-versatile", "api_key_env": "GROQ_API_KEY", "weight": 3},
+         {"name": "local", "url": "http://10.0.0.5:8000/v1/chat/completions",
+          "model": "meta-llama/Llama-3.1-8B-Instruct", "weight": 1, "rpm": 0, "tpm": 0}]
+        ("api_key" may be given inline instead of "api_key_env")
+  LLM_ROUTER_EWMA_ALPHA   — weight of the newest latency / error sample (default 0.2)
+  LLM_ROUTER_ERROR_COST   — seconds one failure is worth in the cost (default 5)
+  LLM_HEDGE               — "1" sends a hedged request past the p95 latency
+  LLM_HEDGE_QUANTILE      — latency quantile that triggers the hedge (default 0.95)
+  LLM_HEDGE_MIN_SAMPLES   — answers a provider needs before it is hedged (default 20)
+  LLM_HEDGE_BUDGET        — most hedges per routed request, over time (default 0.1)
+
+Two stand-in providers with different latency profiles, with and without hedging:
+    python -m models.llm_router [n_calls]
+"""
+
+import json
+import math
+import os
+import random
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, Iterable, List, Optional
+
+from models import circuit_breaker, rate_limiter
+from models.circuit_breaker import OPEN, CircuitBreaker, get_breaker
+from models.rate_limiter import TokenBucketLimiter, get_limiter
+
+
+ROUTER_EWMA_ALPHA = float(os.getenv("LLM_ROUTER_EWMA_ALPHA", "0.2"))
+ROUTER_ERROR_COST = float(os.getenv("LLM_ROUTER_ERROR_COST", "5"))
+HEDGE_ENABLED = os.getenv("LLM_HEDGE", "0") == "1"
+HEDGE_QUANTILE = float(os.getenv("LLM_HEDGE_QUANTILE", "0.95"))
+HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+HEDGE_BUDGET = float(os.getenv("LLM_HEDGE_BUDGET", "0.1"))
+HEDGE_BURST = 10             # hedge credit that can build up while all is well
+
+IDLE_HALF_LIFE = 60.0        # seconds for an idle provider's numbers to halve
+LATENCY_WINDOW = 200         # recent answer latencies kept for the hedge quantile
+
+
+class Provider:
+    """One OpenAI-compatible chat-completions endpoint and its live numbers."""
+
+    def __init__(self, name: str, url: str, model: str, api_key: str = "",
+                 key_env: str = "", weight: float = 1.0, default: bool = False,
+                 rpm: Optional[float] = None, tpm: Optional[float] = None):
+        self.name = name
+        self.url = url
+        self.model = model
+        self.api_key = api_key
+        self.key_env = key_env          # where the key came from (for messages)
+        self.weight = max(float(weight), 1e-6)
+        self.default = default          # follows GROQ_* and uses the global breaker + limiter
+        self.rpm, self.tpm = rpm, tpm   # None: LLM_RATE_RPM / LLM_RATE_TPM
+        self._lock = threading.Lock()
+        self._latency: Optional[float] = None    # EWMA, seconds
+        self._errors = 0.0                        # EWMA of the failure indicator
+        self._updated = time.monotonic()
+        self._recent = deque(maxlen=LATENCY_WINDOW)
+        self._pending = 0
+        self._breaker: Optional[CircuitBreaker] = None
+        self._limiter: Optional[TokenBucketLimiter] = None
+        self._stats = {"requests": 0, "errors": 0, "hedges": 0, "hedge_wins": 0}
+
+    def headers(self) -> Dict[str, str]:
+        # h11 (httpx) rejects the bare "Bearer " an empty key would produce
+        return {"Authorization": f"Bearer {self.api_key}"} if self.api_key else {}
+
+    @property
+    def breaker(self) -> Optional[CircuitBreaker]:
+        if self.default:
+            return get_breaker()
+        if not circuit_breaker.BREAKER_ENABLED:
+            return None
+        if self._breaker is None:
+            with self._lock:
+                if self._breaker is None:
+                    self._breaker = CircuitBreaker(f"llm:{self.name}")
+        return self._breaker
+
+    @property
+    def limiter(self) -> Optional[TokenBucketLimiter]:
+        if self.default:
+            return get_limiter()
+        if not rate_limiter.RATE_LIMIT_ENABLED:
+            return None
+        if self._limiter is None:
+            with self._lock:
+                if self._limiter is None:
+                    self._limiter = TokenBucketLimiter(
+                        rpm=rate_limiter.RATE_RPM if self.rpm is None else self.rpm,
+                        tpm=rate_limiter.RATE_TPM if self.tpm is None else self.tpm,
+                        name=self.name)
+        return self._limiter
+
+    # ── Live numbers ──────────────────────────────────────────────────
+
+    def _decay(self, now: float) -> float:
+        """Idle decay factor since the last update (caller holds the lock)."""
+        return 0.5 ** ((now - self._updated) / IDLE_HALF_LIFE)
+
+    def begin(self):
+        with self._lock:
+            self._pending += 1
+
+    def end(self, seconds: Optional[float], error: bool):
+        """A request finished; ``seconds`` None = cancelled (no sample)."""
+        with self._lock:
+            self._pending -= 1
+            if seconds is None:
+                return
+            now = time.monotonic()
+            decay = self._decay(now)
+            self._updated = now
+            self._stats["requests"] += 1
+            self._stats["errors"] += int(error)
+            self._errors = self._errors * decay
+            self._errors += ROUTER_EWMA_ALPHA * (float(error) - self._errors)
+            if error:
+                return
+            self._recent.append(seconds)
+            if self._latency is None:
+                self._latency = seconds
+            else:
+                self._latency *= decay
+                self._latency += ROUTER_EWMA_ALPHA * (seconds - self._latency)
+
+    def cost(self) -> float:
+        with self._lock:
+            decay = self._decay(time.monotonic())
+            latency = (self._latency or 0.0) * decay
+            errors = self._errors * decay
+            return (latency + errors * ROUTER_ERROR_COST) * (self._pending + 1) / self.weight
+
+    def latency_quantile(self, q: float) -> Optional[float]:
+        """``q`` quantile of recent answer latencies (None below HEDGE_MIN_SAMPLES)."""
+        with self._lock:
+            if len(self._recent) < HEDGE_MIN_SAMPLES:
+                return None
+            ordered = sorted(self._recent)
+        return ordered[min(len(ordered) - 1, math.ceil(q * len(ordered)) - 1)]
+
+    def note(self, counter: str):
+        with self._lock:
+            self._stats[counter] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            decay = self._decay(time.monotonic())
+            stats.update({
+                "model": self.model,
+                "weight": self.weight,
+                "in_flight": self._pending,
+                "latency_ewma_ms": round((self._latency or 0.0) * decay * 1000, 1),
+                "error_rate_ewma": round(self._errors * decay, 3),
+            })
+        p = self.latency_quantile(HEDGE_QUANTILE)
+        stats["hedge_after_ms"] = round(p * 1000, 1) if p is not None else None
+        breaker = self.breaker
+        stats["circuit"] = breaker.state if breaker else "disabled"
+        return stats
+
+    def reset_stats(self):
+        with self._lock:
+            for key in self._stats:
+                self._stats[key] = 0
+
+
+class Router:
+    """Picks a provider per call from their EWMAs; decides when to hedge."""
+
+    def __init__(self, providers: Optional[List[Provider]] = None):
+        self.configured = bool(providers)
+        self.default = Provider("groq", "", "", key_env="GROQ_API_KEY", default=True)
+        self.providers: List[Provider] = list(providers) if providers else [self.default]
+        self._rng = random.Random()
+        self._lock = threading.Lock()
+        self._hedge_credit = float(HEDGE_BURST)
+        self._hedges_denied = 0
+
+    def use_default(self, url: str, model: str, api_key: str):
+        """Point the built-in provider at the current GROQ_* settings."""
+        self.default.url, self.default.model, self.default.api_key = url, model, api_key
+
+    @property
+    def model_key(self) -> str:
+        """Model name for the response cache key."""
+        return "+".join(sorted({p.model for p in self.providers}))
+
+    def _draw(self, providers: List[Provider]) -> Provider:
+        return self._rng.choices(providers, weights=[p.weight for p in providers])[0]
+
+    def _order(self, providers: List[Provider]) -> List[Provider]:
+        if len(providers) < 2:
+            return providers
+        first = self._draw(providers)
+        second = self._draw([p for p in providers if p is not first])
+        best = min((first, second), key=Provider.cost)
+        return [best] + sorted((p for p in providers if p is not best), key=Provider.cost)
+
+    def ranked(self, tried: Iterable[Provider] = ()) -> List[Provider]:
+        """Providers in the order to try them: untried first, open circuits
+        last. The head is the cheaper of two weighted draws."""
+        tried = set(tried)
+
+        def usable(p: Provider) -> bool:
+            breaker = p.breaker
+            return p not in tried and (breaker is None or breaker.state != OPEN)
+
+        fresh = [p for p in self.providers if usable(p)]
+        return self._order(fresh) + sorted((p for p in self.providers if not usable(p)),
+                                           key=Provider.cost)
+
+    def all_open(self) -> bool:
+        """Every provider's circuit is open — callers should fall back."""
+        return all(p.breaker is not None and p.breaker.state == OPEN for p in self.providers)
+
+    def hedge_delay(self, provider: Provider) -> Optional[float]:
+        """Seconds to wait on ``provider`` before hedging, or None not to hedge.
+        Each call asked about earns HEDGE_BUDGET of hedge credit."""
+        if not HEDGE_ENABLED or len(self.providers) < 2:
+            return None
+        with self._lock:
+            self._hedge_credit = min(HEDGE_BURST, self._hedge_credit + HEDGE_BUDGET)
+        return provider.latency_quantile(HEDGE_QUANTILE)
+
+    def spend_hedge(self) -> bool:
+        """Take one hedge from the budget (False: over budget, don't hedge)."""
+        with self._lock:
+            if self._hedge_credit < 1:
+                self._hedges_denied += 1
+                return False
+            self._hedge_credit -= 1
+            return True
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "providers": {p.name: p.stats() for p in self.providers},
+            "hedging": HEDGE_ENABLED,
+            "hedge_quantile": HEDGE_QUANTILE,
+            "hedge_credit": round(self._hedge_credit, 2),
+            "hedges_over_budget": self._hedges_denied,
+        }
+
+    def reset_stats(self):
+        for p in self.providers:
+            p.reset_stats()
+        with self._lock:
+            self._hedges_denied = 0
+
+
+def load_providers(spec: str) -> List[Provider]:
+    """Providers from the LLM_PROVIDERS JSON list."""
+    providers = []
+    for n, item in enumerate(json.loads(spec) if spec.strip() else []):
+        if not item.get("url") or not item.get("model"):
+            raise ValueError(f"LLM_PROVIDERS[{n}] needs a 'url' and a 'model'")
+        key_env = item.get("api_key_env", "")
+        providers.append(Provider(
+            name=item.get("name") or f"provider{n}",
+            url=item["url"],
+            model=item["model"],
+            api_key=item.get("api_key") or (os.getenv(key_env, "") if key_env else ""),
+            key_env=key_env,
+            weight=item.get("weight", 1.0),
+            rpm=item.get("rpm"),
+            tpm=item.get("tpm"),
+        ))
+    return providers
+
+
+_router: Optional[Router] = None
+_router_lock = threading.Lock()
+
+
+def configure_router(providers: Optional[List[Provider]] = None) -> Router:
+    """(Re)create the process-wide router; no providers = GROQ_* only."""
+    global _router
+    with _router_lock:
+        _router = Router(providers)
+        return _router
+
+
+def get_router() -> Router:
+    """The process-wide router (from LLM_PROVIDERS on first use)."""
+    global _router
+    if _router is None:
+        try:
+            providers = load_providers(os.getenv("LLM_PROVIDERS", ""))
+        except (ValueError, TypeError, AttributeError) as e:
+            print(f"⚠️ LLM_PROVIDERS ignored ({e}) — using GROQ_API_URL only")
+            providers = []
+        with _router_lock:
+            if _router is None:
+                _router = Router(providers)
+    return _router
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# Two stand-in providers with different latency profiles
+#   python -m models.llm_router [n_calls]
+# ═══════════════════════════════════════════════════════════════════════════════
+
+if __name__ == "__main__":
+    import contextlib
+    import io
+    import sys
+    from concurrent.futures import ThreadPoolExecutor
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    from pathlib import Path
+    sys.path.insert(0, str(Path(__file__).parent.parent))
+
+    import models.llm_router as llm_router
+    from models import llm_cache, llm_config
+
+    n_calls = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    down = set()
+    rng = random.Random(11)
+
+    def stand_in(name: str, latency) -> ThreadingHTTPServer:
+        class _StandIn(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+            wbufsize = -1                  # one write per response
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                time.sleep(latency())
+                status, reply = 200, {"choices": [{"message": {"content": json.dumps({"by": name})}}],
+                                      "usage": {"completion_tokens": 5, "total_tokens": 15}}
+                if name in down:
+                    status, reply = 503, {"error": "overloaded"}
+                payload = json.dumps(reply).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer(("127.0.0.1", 0), _StandIn)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+    # "fast" answers in 15-30 ms, except 2% of calls that take 400 ms; "steady" takes 60-90 ms.
+    # Each has its own limiter, roomy enough never to delay a call; every reply uses 15 tokens.
+    fast = stand_in("fast", lambda: 0.4 if rng.random() < 0.02 else rng.uniform(0.015, 0.03))
+    steady = stand_in("steady", lambda: rng.uniform(0.06, 0.09))
+    router = llm_router.configure_router([
+        llm_router.Provider("fast", f"http://127.0.0.1:{fast.server_port}/v1/chat/completions",
+                            "stand-in-a", rpm=10 ** 6, tpm=10 ** 8),
+        llm_router.Provider("steady", f"http://127.0.0.1:{steady.server_port}/v1/chat/completions",
+                            "stand-in-b", rpm=10 ** 6, tpm=10 ** 8),
+    ])
+    llm_cache.CACHE_ENABLED = False            # every call reaches a stand-in
+    rate_limiter.RATE_LIMIT_ENABLED = True
+
+    def phase(label: str, hedge: bool) -> Dict[str, Any]:
+        llm_router.HEDGE_ENABLED = hedge
+        router.reset_stats()
+        for p in router.providers:
+            p.limiter.reset_stats()
+
+        def one(i: int):
+            start = time.perf_counter()
+            result = llm_config.call_gemini("system", f"{label} {i}")
+            return time.perf_counter() - start, result
+
+        with contextlib.redirect_stdout(io.StringIO()), ThreadPoolExecutor(4) as pool:
+            runs = list(pool.map(one, range(n_calls)))
+        llm_config._hedge_pool().shutdown(wait=True)    # losing hedges finish and settle
+        llm_config._hedge_executor = None
+        latencies = sorted(seconds for seconds, _ in runs)
+        stats = router.stats()["providers"]
+        return {
+            "label": label,
+            **{f"p{q}": latencies[min(len(latencies) - 1, int(q / 100 * len(latencies)))] * 1000
+               for q in (50, 95, 99)},
+            "answered": {name: sum(1 for _, r in runs if r and r.get("by") == name)
+                         for name in stats},
+            "hedges": sum(s["hedges"] for s in stats.values()),
+            "hedge_wins": sum(s["hedge_wins"] for s in stats.values()),
+            "failed": sum(1 for _, r in runs if r is None),
+            # tokens still held once every request has settled: 15 per reply, none for failures
+            "held": sum(p.limiter.stats()["tokens_reserved"] - p.limiter.stats()["tokens_refunded"]
+                        for p in router.providers),
+            "replies": sum(s["requests"] - s["errors"] for s in stats.values()),
+        }
+
+    results = [phase("routed", hedge=False), phase("hedged", hedge=True)]
+    down.add("fast")
+    results.append(phase("fast down", hedge=False))
+    fast.shutdown()
+    steady.shutdown()
+
+    print(f"\n📊 {n_calls} calls, 4 at a time, over two stand-in providers")
+    print("   fast: 15-30 ms, 2% take 400 ms   steady: 60-90 ms")
+    print(f"   {'phase':10s} {'p50':>7s} {'p95':>7s} {'p99':>7s}   answered by fast/steady   hedges (won)   failed")
+    for r in results:
+        print(f"   {r['label']:10s} {r['p50']:5.0f}ms {r['p95']:5.0f}ms {r['p99']:5.0f}ms   "
+              f"{r['answered']['fast']:>10d} / {r['answered']['steady']:<10d}   "
+              f"{r['hedges']:>5d} ({r['hedge_wins']})      {r['failed']}")
+    routed, hedged, outage = results
+    fast_stats = router.stats()["providers"]["fast"]
+    print(f"   during the outage 'fast' got {fast_stats['requests']} request(s) before its error "
+          f"EWMA ({fast_stats['error_rate_ewma']}) routed everything to 'steady'")
+    print(f"   hedged phase: {hedged['held']} tokens held by the rate limiters after settling "
+          f"{hedged['replies']} replies of 15 tokens (losing hedges included)")
+    ok = (hedged["p99"] < routed["p99"] and outage["failed"] == 0
+          and hedged["held"] == 15 * hedged["replies"])
+    print(f"   {'✅' if ok else '❌'} hedging cuts p99 {routed['p99']:.0f} → {hedged['p99']:.0f} ms; "
+          f"no call failed while 'fast' was down; every hedge reservation settled")
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,232 @@
+"""
+local_scoring — Deterministic-first scores for the specialist agents
+====================================================================
+SustainabilityExpert, WeatherAnalyst and MarketResearcher score a farm
+with vectorized formulas over their own reference data: the emission
+factors and water footprints, the crop weather ranges, and the MSP and
+market table. In deterministic mode their offline fallbacks use the same
+formulas; with the flag off the fallbacks keep their original rules.
+
+In deterministic mode every number in those agents' results comes from
+the formulas. The LLM gets the computed scores and writes only the
+short prose fields (reasoning, advice, ...) with a small ``max_tokens``.
+Scores are then reproducible and cacheable on the bucketed inputs, and
+most output tokens — the slowest part of a completion — are never
+generated. A smaller ``max_tokens`` also reserves less of the tokens/min
+budget in the rate limiter.
+
+The formulas are written with the helpers below, so they take numpy
+arrays of farms when numpy is installed and plain scalars without it.
+
+Environment variables (optional):
+  AGRISMART_DETERMINISTIC_SCORES  — "1" computes scores locally, LLM writes prose only
+  AGRISMART_NARRATIVE_MAX_TOKENS  — response cap for those prose-only calls (default 400)
+
+Batch scoring benchmark + determinism check against a local stand-in model:
+    python -m models.local_scoring [n_farms]
+"""
+
+import math
+import os
+import re
+from typing import Any, Dict, List, Mapping, Sequence, Tuple
+
+try:
+    import numpy as np
+    HAS_NUMPY = True
+except ImportError:
+    np = None
+    HAS_NUMPY = False
+
+
+DETERMINISTIC = os.getenv("AGRISMART_DETERMINISTIC_SCORES", "0") == "1"
+NARRATIVE_MAX_TOKENS = int(os.getenv("AGRISMART_NARRATIVE_MAX_TOKENS", "400"))
+
+
+# ── Formula helpers (numpy arrays, or scalars without numpy) ─────────
+
+def values(x):
+    return np.asarray(x, dtype=float) if HAS_NUMPY else float(x)
+
+
+def where(condition, a, b):
+    return np.where(condition, a, b) if HAS_NUMPY else (a if condition else b)
+
+
+def clip(x, lo, hi):
+    return np.clip(x, lo, hi) if HAS_NUMPY else min(max(x, lo), hi)
+
+
+def log(x):
+    return np.log(x) if HAS_NUMPY else math.log(x)
+
+
+def lookup(table: Mapping[str, float], crops, default: float):
+    """Per-crop value for one crop name or an array of them."""
+    if not HAS_NUMPY:
+        return float(table.get(str(crops).strip().title(), default))
+    keys = np.asarray(crops, dtype=object)
+    return np.vectorize(lambda c: table.get(str(c).strip().title(), default),
+                        otypes=[float])(keys)
+
+
+def scalars(scores: Dict[str, Any]) -> Dict[str, Any]:
+    """One farm's formula output as plain floats / bools."""
+    return {k: bool(v) if getattr(v, "dtype", None) == bool or isinstance(v, bool)
+            else float(v) for k, v in scores.items()}
+
+
+def band(score: float, bands: Sequence[Tuple[float, str]], lowest: str) -> str:
+    """First label whose threshold ``score`` exceeds, else ``lowest``."""
+    for threshold, label in bands:
+        if score > threshold:
+            return label
+    return lowest
+
+
+# ── Prose-only LLM call ──────────────────────────────────────────────
+
+def narrative_system_prompt(system_prompt: str, fields: Mapping[str, Any]) -> str:
+    """An agent's system prompt cut down to the prose ``fields`` of its schema."""
+    persona, schema = system_prompt.split("Respond with a JSON object:", 1)
+    lines = []
+    for name in fields:
+        match = re.search(rf'^\s*"{name}": (.+?),?$', schema, re.MULTILINE)
+        lines.append(f'  "{name}": {match.group(1) if match else "short text"}')
+    return (
+        persona.rstrip()
+        + "\n\nThe scores in the request were computed from the farm data with fixed "
+          "formulas. Do not recompute or contradict them — explain them. "
+          "Keep every field brief.\n\nRespond with a JSON object:\n{\n"
+        + ",\n".join(lines) + "\n}"
+    )
+
+
+def scores_block(scores: Dict[str, Any]) -> str:
+    """The computed scores, appended to the agent's usual user prompt."""
+    lines = [f"- {k}: {v}" for k, v in scores.items()
+             if not isinstance(v, dict) and v not in ("", [], None)]
+    return ("\n\nCOMPUTED SCORES (fixed — use them as given):\n" + "\n".join(lines)
+            + "\n\nWrite only the requested prose fields.")
+
+
+def narrative_fields(resp: Dict, fields: Mapping[str, Any]) -> Dict[str, Any]:
+    """Prose fields from the LLM response, coerced to each field's default type."""
+    out = {}
+    for name, default in fields.items():
+        value = resp.get(name, default)
+        if isinstance(default, list):
+            out[name] = value if isinstance(value, list) else [str(value)] if value else []
+        else:
+            out[name] = str(value)
+    return out
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# Batch scoring benchmark + determinism check
+#   python -m models.local_scoring [n_farms]
+# ═══════════════════════════════════════════════════════════════════════════════
+
+if __name__ == "__main__":
+    import contextlib
+    import io
+    import json
+    import random
+    import sys
+    import threading
+    import time
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    from pathlib import Path
+    sys.path.insert(0, str(Path(__file__).parent.parent))
+
+    import models.local_scoring as local_scoring
+    from models import llm_cache, llm_config, rate_limiter
+    from models.market_Researcher import CROP_MARKET_DATA, MarketResearcher, score_market
+    from models.sustainability_Expert import SustainabilityExpert, score_sustainability
+    from models.weather_Analyst import WeatherAnalyst, score_weather
+
+    if not HAS_NUMPY:
+        sys.exit("numpy is needed for the batch benchmark")
+    n_farms = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+    rng = np.random.default_rng(7)
+    crops = rng.choice(list(CROP_MARKET_DATA), n_farms)
+    farm = dict(temperature=rng.uniform(5, 42, n_farms), rainfall=rng.uniform(10, 500, n_farms),
+                humidity=rng.uniform(30, 95, n_farms), fertilizer=rng.uniform(20, 300, n_farms),
+                pesticide=rng.uniform(0, 200, n_farms), ph=rng.uniform(4.5, 9.0, n_farms))
+
+    def batch():
+        score_weather(farm["temperature"], farm["rainfall"], farm["humidity"], crops)
+        score_sustainability(farm["fertilizer"], 1.0, farm["ph"], farm["fertilizer"],
+                             farm["pesticide"], crops)
+        score_market(crops)
+
+    def one_by_one():
+        for i in range(n_farms):
+            score_weather(farm["temperature"][i], farm["rainfall"][i], farm["humidity"][i], crops[i])
+            score_sustainability(farm["fertilizer"][i], 1.0, farm["ph"][i], farm["fertilizer"][i],
+                                 farm["pesticide"][i], crops[i])
+            score_market(crops[i])
+
+    timings = {}
+    for label, fn in (("vectorized", batch), ("per farm", one_by_one)):
+        start = time.perf_counter()
+        fn()
+        timings[label] = time.perf_counter() - start
+
+    # Stand-in model: random scores, fixed prose; records each request's max_tokens
+    max_tokens: List[int] = []
+    random_scores = random.Random(3)
+
+    class _StandIn(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            max_tokens.append(body["max_tokens"])
+            score = round(random_scores.uniform(2, 9), 1)
+            reply = {key: score for key in ("market_score", "weather_score", "sustainability_score",
+                                            "carbon_footprint", "water_score")}
+            reply.update(reasoning="Stand-in reasoning.", advice="Stand-in advice.",
+                         insights="Stand-in insights.", recommendations="Stand-in tips.")
+            payload = json.dumps({"choices": [{"message": {"content": json.dumps(reply)}}]}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _StandIn)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    llm_config.GROQ_API_URL = f"http://127.0.0.1:{server.server_port}/v1/chat/completions"
+    llm_cache.CACHE_ENABLED = False            # every call reaches the stand-in
+    rate_limiter.RATE_LIMIT_ENABLED = False
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        market, weather, sustainability = MarketResearcher(), WeatherAnalyst(), SustainabilityExpert()
+
+    def scores() -> Tuple[float, ...]:
+        with contextlib.redirect_stdout(io.StringIO()):
+            return (market.forecast_market_trends("Wheat")["market_score"],
+                    weather.analyze_weather_impact(18, 70, 55, "Wheat")["weather_score"],
+                    sustainability.assess_sustainability(crop="Wheat")["sustainability_score"])
+
+    runs = {}
+    for mode in (False, True):
+        local_scoring.DETERMINISTIC = mode
+        max_tokens.clear()
+        runs[mode] = {"scores": {scores() for _ in range(3)}, "max_tokens": sorted(set(max_tokens))}
+    server.shutdown()
+
+    print(f"\n⏱️  Local scoring of {n_farms} farms (weather + sustainability + market)")
+    print(f"   vectorized {timings['vectorized'] * 1000:8.1f} ms")
+    print(f"   per farm   {timings['per farm'] * 1000:8.1f} ms  "
+          f"({timings['per farm'] / timings['vectorized']:.0f}× slower)")
+    print("\n🔁 Three runs against a stand-in that returns random scores")
+    for mode, label in ((False, "LLM scores   "), (True, "deterministic")):
+        run = runs[mode]
+        print(f"   {label}: {len(run['scores'])} distinct (market, weather, sustainability) "
+              f"result(s), max_tokens {run['max_tokens']}")
@@ -9,13 +9,20 @@ Architecture:
   2. Gemini analyses the specific crop + conditions with real economic reasoning
   3. Returns nuanced market scores, price forecasts, and strategic insights
   4. Falls back to rule-based scoring when the LLM is unavailable
+  5. Deterministic mode (see local_scoring): score, price and trend always
+     come from the market table, the LLM only writes reasoning and insights
 """
 
 import os
 from datetime import datetime
 from typing import Dict, List, Optional
 
-from models.llm_config import call_gemini
+from models.llm_config import acall_gemini, call_gemini
+from models.request_scope import memoized
+from models.prompt_reference import ReferenceBlock
+from models.input_quantizer import quantize_inputs, with_inputs
+from models.response_schema import Choice, Number, Schema, Score, Text, TextList
+from models import local_scoring
 
 
 # ═══════════════════════════════════════════════════════════════════════════════
@@ -51,6 +58,52 @@ CROP_MARKET_DATA = {
 }
 
 
+def _market_line(name: str, data: Dict) -> str:
+    msp_str = f"₹{data['msp']}/q" if data['msp'] else "No MSP"
+    return (
+        f"  {name}: MSP {msp_str}, Market ₹{data['avg_market']}/q, "
+        f"Export {data['export_demand']}, Season {data['season']}, "
+        f"Shelf-life {data['shelf_life']}, Volatility {data['volatility']}, "
+        f"Trend {data['trend']}"
+    )
+
+
+# Rendered once; prompts carry the target crop + the engine's candidates
+MARKET_REFERENCE = ReferenceBlock.table(
+    {name: _market_line(name, data) for name, data in CROP_MARKET_DATA.items()})
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# Local scoring — vectorized over CROP_MARKET_DATA
+# ═══════════════════════════════════════════════════════════════════════════════
+
+EXPORT_BONUS = {"high": 1.5, "medium": 0.8, "low": 0.0}
+DEMAND_FORECAST = {"high": "strong", "medium": "moderate", "low": "weak"}
+PROFIT_BANDS = ((7.5, "high"), (5.5, "medium"))
+
+# Crops missing from the table
+_UNLISTED = {"msp": 2000, "avg_market": 2500, "export_demand": "medium", "trend": "stable"}
+
+# field → {crop: value}; a crop without MSP has its floor at 85% of market
+MARKET_COLUMNS = {
+    "avg_market": {c: d["avg_market"] for c, d in CROP_MARKET_DATA.items()},
+    "msp": {c: d["msp"] or d["avg_market"] * 0.85 for c, d in CROP_MARKET_DATA.items()},
+    "export_bonus": {c: EXPORT_BONUS[d["export_demand"]] for c, d in CROP_MARKET_DATA.items()},
+    "growing": {c: float(d["trend"] == "growing") for c, d in CROP_MARKET_DATA.items()},
+}
+_UNLISTED_COLUMNS = {"avg_market": _UNLISTED["avg_market"], "msp": _UNLISTED["msp"],
+                     "export_bonus": EXPORT_BONUS[_UNLISTED["export_demand"]], "growing": 0.0}
+
+
+def score_market(crop) -> Dict:
+    """Market score, predicted price and growth flag; one crop or an array."""
+    c = {field: local_scoring.lookup(MARKET_COLUMNS[field], crop, _UNLISTED_COLUMNS[field])
+         for field in MARKET_COLUMNS}
+    score = 5.0 + c["export_bonus"] + c["growing"] + 1.0 * (c["avg_market"] > c["msp"] * 1.1)
+    return {"score": local_scoring.clip(score, 0.0, 10.0), "predicted_price": c["avg_market"] * 1.05,
+            "growing": c["growing"] > 0}
+
+
 # ═══════════════════════════════════════════════════════════════════════════════
 # Agent System Prompt
 # ═══════════════════════════════════════════════════════════════════════════════
@@ -87,6 +140,21 @@ Respond with a JSON object:
   "risks": ["Market risks to be aware of"]
 }"""
 
+RESPONSE_SCHEMA = Schema("MarketResearcher", {
+    "market_score": Score(),
+    "price_trend": Choice(("rising", "stable", "falling"), "stable", lower=True),
+    "demand_forecast": Text("moderate", lower=True),
+    "predicted_price": Number(0.0, ndigits=2),
+    "profit_potential": Text("medium"),
+    "reasoning": Text(),
+    "insights": Text(),
+    "risks": TextList(),
+})
+
+# Deterministic mode: the LLM writes only these (field → default)
+NARRATIVE_FIELDS = {"reasoning": "", "insights": "", "risks": []}
+NARRATIVE_SYSTEM_PROMPT = local_scoring.narrative_system_prompt(SYSTEM_PROMPT, NARRATIVE_FIELDS)
+
 
 # ═══════════════════════════════════════════════════════════════════════════════
 # MarketResearcher Agent
@@ -101,14 +169,20 @@ class MarketResearcher:
 
     # ── Public API ───────────────────────────────────────────────────
 
+    @memoized("market")
     def forecast_market_trends(self, crop: str, area: float = 1.0,
                                production: float = 3.0,
-                               year: int = None) -> Dict:
-        """Primary market analysis method."""
+                               year: int = None,
+                               candidates: Optional[List[str]] = None) -> Dict:
+        """Primary market analysis method.
+
+        ``candidates`` (the engine's shortlist) are the crops the reference
+        table is compared against; None sends every crop.
+        """
         year = year or datetime.now().year
 
         # Try LLM first
-        llm_result = self._llm_analyse(crop, area, production, year)
+        llm_result = self._llm_analyse(crop, area, production, year, candidates)
         if llm_result:
             return llm_result
 
@@ -116,6 +190,21 @@ class MarketResearcher:
         print("⚠️ MarketResearcher: LLM unavailable, using fallback scoring")
         return self._fallback_analyse(crop, area, production)
 
+    @memoized("market")
+    async def forecast_market_trends_async(self, crop: str, area: float = 1.0,
+                                           production: float = 3.0,
+                                           year: int = None,
+                                           candidates: Optional[List[str]] = None) -> Dict:
+        """Async forecast_market_trends — awaits the LLM without holding a thread."""
+        year = year or datetime.now().year
+
+        llm_result = await self._llm_analyse_async(crop, area, production, year, candidates)
+        if llm_result:
+            return llm_result
+
+        print("⚠️ MarketResearcher: LLM unavailable, using fallback scoring")
+        return self._fallback_analyse(crop, area, production)
+
     def forecast(self, crop, features=None) -> list:
         """Backward-compatible alias used by agent_setup.py.
         Returns [predicted_price]."""
@@ -133,9 +222,9 @@ class MarketResearcher:
 
     # ── LLM Path ─────────────────────────────────────────────────────
 
-    def _llm_analyse(self, crop: str, area: float, production: float,
-                     year: int) -> Optional[Dict]:
-        """Call Gemini for intelligent market analysis."""
+    def _analyse_prompt(self, crop: str, area: float, production: float,
+                        year: int, candidates: Optional[List[str]] = None) -> str:
+        """Build the market-analysis user prompt."""
 
         now = datetime.now()
         month_name = now.strftime("%B")
@@ -144,16 +233,7 @@ class MarketResearcher:
         crop_key = crop.strip().title()
         specific_data = CROP_MARKET_DATA.get(crop_key, {})
 
-        ref_lines = []
-        for name, data in CROP_MARKET_DATA.items():
-            msp_str = f"₹{data['msp']}/q" if data['msp'] else "No MSP"
-            ref_lines.append(
-                f"  {name}: MSP {msp_str}, Market ₹{data['avg_market']}/q, "
-                f"Export {data['export_demand']}, Season {data['season']}, "
-                f"Shelf-life {data['shelf_life']}, Volatility {data['volatility']}, "
-                f"Trend {data['trend']}"
-            )
-        market_ref = "\n".join(ref_lines)
+        market_ref = MARKET_REFERENCE.select([crop, *candidates] if candidates else None)
 
         user_prompt = f"""Analyse the market conditions for this crop:
 
@@ -172,49 +252,80 @@ MARKET REFERENCE DATA (Indian agricultural prices, ₹/quintal):
 
 Provide a comprehensive market analysis for {crop}. Consider seasonal timing, current demand trends, price stability, and practical selling strategy for the farmer."""
 
-        response = call_gemini(SYSTEM_PROMPT, user_prompt, temperature=0.3)
+        return user_prompt
+
+    def _llm_request(self, inputs: Dict, candidates: Optional[List[str]] = None):
+        """(system prompt, user prompt, max_tokens, local scores or None)."""
+        user_prompt = self._analyse_prompt(**inputs, candidates=candidates)
+        if not local_scoring.DETERMINISTIC:
+            return SYSTEM_PROMPT, user_prompt, 2048, None
+        scores = self._local_analyse(**inputs)
+        return (NARRATIVE_SYSTEM_PROMPT, user_prompt + local_scoring.scores_block(scores),
+                local_scoring.NARRATIVE_MAX_TOKENS, scores)
+
+    def _llm_result(self, response: Dict, crop: str, scores: Optional[Dict]) -> Optional[Dict]:
+        if scores is None:
+            return self._validate_response(response, crop)
+        return {**scores, **local_scoring.narrative_fields(response, NARRATIVE_FIELDS)}
+
+    def _llm_analyse(self, crop: str, area: float, production: float,
+                     year: int, candidates: Optional[List[str]] = None) -> Optional[Dict]:
+        """Call Gemini for intelligent market analysis."""
+        raw = dict(crop=crop, area=area, production=production, year=year)
+        inputs = quantize_inputs("market", raw)
+        system_prompt, user_prompt, max_tokens, scores = self._llm_request(inputs, candidates)
+        response = call_gemini(system_prompt, user_prompt, temperature=0.3,
+                               max_tokens=max_tokens, agent="market")
+        if not response:
+            return None
+
+        return with_inputs(self._llm_result(response, crop, scores), raw, inputs)
+
+    async def _llm_analyse_async(self, crop: str, area: float, production: float,
+                                 year: int, candidates: Optional[List[str]] = None) -> Optional[Dict]:
+        raw = dict(crop=crop, area=area, production=production, year=year)
+        inputs = quantize_inputs("market", raw)
+        system_prompt, user_prompt, max_tokens, scores = self._llm_request(inputs, candidates)
+        response = await acall_gemini(system_prompt, user_prompt, temperature=0.3,
+                                      max_tokens=max_tokens, agent="market")
         if not response:
             return None
 
-        return self._validate_response(response, crop)
+        return with_inputs(self._llm_result(response, crop, scores), raw, inputs)
 
     def _validate_response(self, resp: Dict, crop: str) -> Optional[Dict]:
         """Validate and normalise the LLM response."""
-        try:
-            market_score = float(resp.get("market_score", 5.0))
-            market_score = max(0.0, min(10.0, market_score))
-
-            price_trend = str(resp.get("price_trend", "stable")).lower()
-            if price_trend not in ("rising", "stable", "falling"):
-                price_trend = "stable"
-
-            demand = str(resp.get("demand_forecast", "moderate")).lower()
-            predicted_price = float(resp.get("predicted_price", 0))
-            insights = str(resp.get("insights", ""))
-            reasoning = str(resp.get("reasoning", ""))
-            risks = resp.get("risks", [])
-            if isinstance(risks, str):
-                risks = [risks]
+        return RESPONSE_SCHEMA.validate(resp)
 
-            return {
-                "market_score": round(market_score, 1),
-                "price_trend": price_trend,
-                "demand_forecast": demand,
-                "predicted_price": round(predicted_price, 2),
-                "profit_potential": str(resp.get("profit_potential", "medium")),
-                "reasoning": reasoning,
-                "insights": insights,
-                "risks": risks,
-            }
-        except Exception as e:
-            print(f"⚠️ MarketResearcher: LLM response validation failed: {e}")
-            return None
+    # ── Local Scores / Fallback Path ─────────────────────────────────
 
-    # ── Fallback Path ────────────────────────────────────────────────
+    def _local_analyse(self, crop: str, area: float = 1.0,
+                       production: float = 3.0, year: int = None) -> Dict:
+        """Score, price, trend, demand and profit band from score_market."""
+        s = local_scoring.scalars(score_market(crop))
+        export = CROP_MARKET_DATA.get(crop.strip().title(), _UNLISTED)["export_demand"]
+        return {
+            "market_score": round(s["score"], 1),
+            "price_trend": "rising" if s["growing"] else "stable",
+            "demand_forecast": DEMAND_FORECAST[export],
+            "predicted_price": round(s["predicted_price"], 2),
+            "profit_potential": local_scoring.band(s["score"], PROFIT_BANDS, "low"),
+        }
 
     def _fallback_analyse(self, crop: str, area: float,
                           production: float) -> Dict:
-        """Rule-based fallback when LLM is unavailable."""
+        """Rule-based fallback when LLM is unavailable.
+
+        Deterministic mode uses the local scores; otherwise the original
+        rules below, unchanged."""
+        if local_scoring.DETERMINISTIC:
+            return {
+                **self._local_analyse(crop, area, production),
+                "reasoning": "Fallback analysis (LLM unavailable) — using basic market data.",
+                "insights": f"Consider selling {crop} at government MSP centres for price protection.",
+                "risks": ["AI agent offline — limited market analysis"],
+            }
+
         data = CROP_MARKET_DATA.get(crop.strip().title(), {})
         if not data:
             data = {"msp": 2000, "avg_market": 2500, "export_demand": "medium",
@@ -16,7 +16,12 @@ import os
 from datetime import datetime
 from typing import Dict, List, Optional
 
-from models.llm_config import call_gemini
+from models.llm_config import acall_gemini, call_gemini
+from models.request_scope import memoized
+from models.prompt_reference import ReferenceBlock
+from models.farmer_advisor import CROP_PROFILES
+from models.input_quantizer import quantize_inputs, with_inputs
+from models.response_schema import Choice, Number, Records, Schema, Score, Text
 
 
 # ═══════════════════════════════════════════════════════════════════════════════
@@ -59,6 +64,9 @@ NEMATODES:
 - Root Knot Nematode: Tomato, okra, carrot, tobacco. All seasons. Root galls, stunting. Bio: Purpureocillium lilacinum. Chemical: Carbofuran. Prevention: marigold intercrop.
 """
 
+# Parsed once; prompts carry only the entries that name the target crop
+PEST_BLOCK = ReferenceBlock.from_text(PEST_REFERENCE, CROP_PROFILES)
+
 
 # ═══════════════════════════════════════════════════════════════════════════════
 # Agent System Prompt
@@ -108,6 +116,27 @@ Respond with a JSON object:
   "summary": "1-2 sentence overview for the farmer"
 }"""
 
+THREAT_SCHEMA = Schema("PestDiseasePredictor", {
+    "name": Text(),
+    "type": Text("unknown"),
+    "probability": Number(50, lo=0, hi=100, cast=int),
+    "severity": Text("medium"),
+    "symptoms": Text(),
+    "bio_control": Text(),
+    "chemical_control": Text(),
+    "prevention": Text(),
+})
+
+RESPONSE_SCHEMA = Schema("PestDiseasePredictor", {
+    "overall_risk": Choice(("Low", "Moderate", "High", "Critical"), "Moderate"),
+    "risk_score": Score(),
+    # Most probable first
+    "threats": Records(THREAT_SCHEMA, key="name", sort_key=lambda t: -t["probability"]),
+    "reasoning": Text(),
+    "ipm_plan": Text(),
+    "summary": Text(),
+})
+
 
 # ═══════════════════════════════════════════════════════════════════════════════
 # PestDiseasePredictor Agent
@@ -129,7 +158,20 @@ class PestDiseasePredictor:
         result = self.predict_detailed(
             crop_type, soil_ph, soil_moisture, temperature, rainfall,
         )
-        # Build summary string
+        return self._summary_text(result, crop_type)
+
+    async def predict_async(self, crop_type: str = "Rice", soil_ph: float = 6.5,
+                            soil_moisture: float = 60, temperature: float = 25,
+                            rainfall: float = 100) -> str:
+        """Async predict — awaits the LLM without holding a thread."""
+        result = await self.predict_detailed_async(
+            crop_type, soil_ph, soil_moisture, temperature, rainfall,
+        )
+        return self._summary_text(result, crop_type)
+
+    @staticmethod
+    def _summary_text(result: Dict, crop_type: str) -> str:
+        """Build the backward-compatible summary string."""
         threats = result.get("threats", [])
         if not threats:
             return f"Low pest/disease risk for {crop_type} under current conditions."
@@ -145,6 +187,7 @@ class PestDiseasePredictor:
             lines.append(f"  IPM Plan: {result['ipm_plan'][:200]}")
         return "\n".join(lines)
 
+    @memoized("pest")
     def predict_detailed(self, crop_type: str = "Rice",
                          soil_ph: float = 6.5,
                          soil_moisture: float = 60,
@@ -165,11 +208,29 @@ class PestDiseasePredictor:
             crop_type, soil_ph, soil_moisture, temperature, rainfall,
         )
 
+    @memoized("pest")
+    async def predict_detailed_async(self, crop_type: str = "Rice",
+                                     soil_ph: float = 6.5,
+                                     soil_moisture: float = 60,
+                                     temperature: float = 25,
+                                     rainfall: float = 100) -> Dict:
+        """Async predict_detailed — awaits the LLM without holding a thread."""
+        llm_result = await self._llm_predict_async(
+            crop_type, soil_ph, soil_moisture, temperature, rainfall,
+        )
+        if llm_result:
+            return llm_result
+
+        print("⚠️ PestDiseasePredictor: LLM unavailable, using fallback")
+        return self._fallback_predict(
+            crop_type, soil_ph, soil_moisture, temperature, rainfall,
+        )
+
     # ── LLM Path ─────────────────────────────────────────────────────
 
-    def _llm_predict(self, crop_type, soil_ph, soil_moisture,
-                     temperature, rainfall) -> Optional[Dict]:
-        """Call Gemini for intelligent pest/disease analysis."""
+    def _predict_prompt(self, crop_type, soil_ph, soil_moisture,
+                        temperature, rainfall) -> str:
+        """Build the pest/disease user prompt."""
 
         now = datetime.now()
         month_name = now.strftime("%B")
@@ -194,54 +255,40 @@ CURRENT CONDITIONS:
 - Season: {season}
 
 PEST & DISEASE REFERENCE DATABASE:
-{PEST_REFERENCE}
+{PEST_BLOCK.select([crop_type])}
 
 Based on the crop, current conditions, and the reference database, identify ALL relevant pest and disease threats. Rank them by probability under these specific conditions. Provide practical IPM recommendations."""
 
-        response = call_gemini(SYSTEM_PROMPT, user_prompt, temperature=0.3)
+        return user_prompt
+
+    def _llm_predict(self, crop_type, soil_ph, soil_moisture,
+                     temperature, rainfall) -> Optional[Dict]:
+        """Call Gemini for intelligent pest/disease analysis."""
+        raw = dict(crop_type=crop_type, soil_ph=soil_ph, soil_moisture=soil_moisture,
+                   temperature=temperature, rainfall=rainfall)
+        inputs = quantize_inputs("pest", raw)
+        user_prompt = self._predict_prompt(**inputs)
+        response = call_gemini(SYSTEM_PROMPT, user_prompt, temperature=0.3, agent="pest")
+        if not response:
+            return None
+
+        return with_inputs(self._validate_response(response), raw, inputs)
+
+    async def _llm_predict_async(self, crop_type, soil_ph, soil_moisture,
+                                 temperature, rainfall) -> Optional[Dict]:
+        raw = dict(crop_type=crop_type, soil_ph=soil_ph, soil_moisture=soil_moisture,
+                   temperature=temperature, rainfall=rainfall)
+        inputs = quantize_inputs("pest", raw)
+        user_prompt = self._predict_prompt(**inputs)
+        response = await acall_gemini(SYSTEM_PROMPT, user_prompt, temperature=0.3, agent="pest")
         if not response:
             return None
 
-        return self._validate_response(response)
+        return with_inputs(self._validate_response(response), raw, inputs)
 
     def _validate_response(self, resp: Dict) -> Optional[Dict]:
         """Validate LLM response."""
-        try:
-            overall_risk = str(resp.get("overall_risk", "Moderate"))
-            if overall_risk not in ("Low", "Moderate", "High", "Critical"):
-                overall_risk = "Moderate"
-
-            risk_score = float(resp.get("risk_score", 5.0))
-            risk_score = max(0.0, min(10.0, risk_score))
-
-            threats = []
-            for t in resp.get("threats", []):
-                if isinstance(t, dict) and "name" in t:
-                    threats.append({
-                        "name": str(t.get("name", "")),
-                        "type": str(t.get("type", "unknown")),
-                        "probability": min(100, max(0, int(t.get("probability", 50)))),
-                        "severity": str(t.get("severity", "medium")),
-                        "symptoms": str(t.get("symptoms", "")),
-                        "bio_control": str(t.get("bio_control", "")),
-                        "chemical_control": str(t.get("chemical_control", "")),
-                        "prevention": str(t.get("prevention", "")),
-                    })
-
-            # Sort by probability descending
-            threats.sort(key=lambda x: -x["probability"])
-
-            return {
-                "overall_risk": overall_risk,
-                "risk_score": round(risk_score, 1),
-                "threats": threats,
-                "reasoning": str(resp.get("reasoning", "")),
-                "ipm_plan": str(resp.get("ipm_plan", "")),
-                "summary": str(resp.get("summary", "")),
-            }
-        except Exception as e:
-            print(f"⚠️ PestDiseasePredictor: LLM response validation failed: {e}")
-            return None
+        return RESPONSE_SCHEMA.validate(resp)
 
     # ── Fallback Path ────────────────────────────────────────────────
 
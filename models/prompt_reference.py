@@ -0,0 +1,241 @@
+"""
+prompt_reference — Precompiled, relevance-pruned reference blocks for agent prompts
+===================================================================================
+FarmerAdvisor, MarketResearcher and PestDiseasePredictor ground the LLM
+with reference tables (CROP_PROFILES, CROP_MARKET_DATA, PEST_REFERENCE)
+that used to be re-rendered in full on every call. Input tokens dominate
+Groq latency, so each agent now renders its table once at import as a
+``ReferenceBlock`` and sends only the rows relevant to the request:
+
+  • FarmerAdvisor     — the engine's pick plus its top-k runners-up
+  • MarketResearcher  — the target crop plus the engine's top-k
+  • PestDiseasePredictor — the pests/diseases that name the target crop
+
+With no candidates (engine unavailable) or no matching row the full
+block is sent, so pruning never leaves the LLM without reference data.
+
+Environment variables (optional):
+  AGRISMART_PROMPT_PRUNING  — "0" always sends the full reference blocks
+  AGRISMART_PROMPT_TOP_K    — engine runners-up kept besides its pick (default 4)
+
+Token report + quality-regression harness against a local stand-in model:
+    python -m models.prompt_reference [n_farms]
+"""
+
+import functools
+import os
+import re
+from typing import Dict, FrozenSet, Iterable, List, NamedTuple, Optional
+
+
+PRUNING_ENABLED = os.getenv("AGRISMART_PROMPT_PRUNING", "1") != "0"
+TOP_K = int(os.getenv("AGRISMART_PROMPT_TOP_K", "4"))
+
+# Names the reference tables use for the same crop
+CROP_ALIASES = {"corn": ("maize",), "maize": ("corn",)}
+
+
+def crop_key(name: str) -> str:
+    """'Pigeon Pea' / 'pigeon pea' / 'PigeonPea' → 'pigeonpea'."""
+    return re.sub(r"[^a-z]", "", str(name).lower())
+
+
+def _wanted(crops: Iterable[str]) -> FrozenSet[str]:
+    keys = set()
+    for crop in crops:
+        key = crop_key(crop)
+        keys.add(key)
+        keys.update(CROP_ALIASES.get(key, ()))
+    keys.discard("")
+    return frozenset(keys)
+
+
+class _Entry(NamedTuple):
+    section: str                          # "" for flat tables
+    crops: FrozenSet[str]                 # crop keys this entry is about
+    text: str
+
+
+class ReferenceBlock:
+    """A reference table rendered once; ``select`` keeps the relevant rows."""
+
+    def __init__(self, entries: List[_Entry], preamble: str = "", full: str = None):
+        self.entries = entries
+        self.preamble = preamble
+        self.full = full if full is not None else self._render(entries)
+
+    @classmethod
+    def table(cls, rows: Dict[str, str]) -> "ReferenceBlock":
+        """One pre-rendered line per crop, keyed by crop name."""
+        return cls([_Entry("", _wanted([name]), line) for name, line in rows.items()])
+
+    @classmethod
+    def from_text(cls, text: str, vocabulary: Iterable[str]) -> "ReferenceBlock":
+        """Parse a ``SECTION:`` / ``- entry`` text block; an entry is about
+        every crop in ``vocabulary`` it mentions by name."""
+        patterns = {crop_key(v): re.compile(rf"\b{re.escape(v)}\b", re.IGNORECASE)
+                    for v in vocabulary}
+        entries, preamble, section = [], [], ""
+        for line in text.strip().splitlines():
+            stripped = line.strip()
+            if stripped.startswith("- "):
+                crops = _wanted(k for k, p in patterns.items() if p.search(stripped))
+                entries.append(_Entry(section, crops, stripped))
+            elif stripped.endswith(":") and stripped.isupper():
+                section = stripped
+            elif stripped:
+                preamble.append(stripped)
+        return cls(entries, "\n".join(preamble), full=text)
+
+    def _render(self, entries: List[_Entry]) -> str:
+        if not any(e.section for e in entries):
+            return "\n".join(e.text for e in entries)
+        parts, section = [self.preamble] if self.preamble else [], None
+        for entry in entries:
+            if entry.section != section:
+                section = entry.section
+                parts.append(f"\n{section}")
+            parts.append(entry.text)
+        return "\n".join(parts)
+
+    @functools.lru_cache(maxsize=512)
+    def _select(self, wanted: FrozenSet[str]) -> str:
+        keep = [e for e in self.entries if e.crops & wanted]
+        return self._render(keep) if keep else self.full
+
+    def select(self, crops: Optional[Iterable[str]]) -> str:
+        """Rows about any of ``crops`` (full block when pruning is off,
+        ``crops`` is empty, or nothing matches)."""
+        if not PRUNING_ENABLED or not crops:
+            return self.full
+        return self._select(_wanted(crops))
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# Token report + quality-regression harness
+#   python -m models.prompt_reference [n_farms]
+#
+# The stand-in "model" answers from the reference data in the prompt:
+# FarmerAdvisor's pick is the listed crop whose optimal pH / temperature /
+# rainfall windows fit the farm best, MarketResearcher's price is the
+# target's listed market price, PestDiseasePredictor's threats are the
+# listed entries naming the crop. Pruned and full prompts are compared on
+# those answers.
+# ═══════════════════════════════════════════════════════════════════════════════
+
+if __name__ == "__main__":
+    import json
+    import random
+    import sys
+    import threading
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    from pathlib import Path
+    sys.path.insert(0, str(Path(__file__).parent.parent))
+
+    def _fits(text: str, label: str, value: float) -> bool:
+        match = re.search(rf"{label} [^,]*?\(opt ([\d.]+)-([\d.]+)", text)
+        return bool(match) and float(match.group(1)) <= value <= float(match.group(2))
+
+    def _condition(prompt: str, label: str) -> float:
+        return float(re.search(rf"- {label}: ([\d.]+)", prompt).group(1))
+
+    def _stand_in_answer(prompt: str) -> Dict:
+        if "recommend the best crop" in prompt:
+            ph, temp, rain = (_condition(prompt, l) for l in ("Soil pH", "Temperature", "Rainfall"))
+            rows = re.findall(r"^  ([A-Za-z ]+): (pH .*)$", prompt, re.MULTILINE)
+            ranked = sorted(rows, key=lambda r: -(_fits(r[1], "pH", ph) + _fits(r[1], "Temp", temp)
+                                                 + _fits(r[1], "Rain", rain)))
+            return {"crop": ranked[0][0], "score": 7, "confidence": 70,
+                    "alternatives": [{"crop": r[0], "score": 6} for r in ranked[1:4]]}
+        if "Analyse the market conditions" in prompt:
+            target = re.search(r"TARGET CROP: (.+)", prompt).group(1).strip()
+            row = re.search(rf"^  {re.escape(target)}: .*Market ₹(\d+)", prompt, re.MULTILINE)
+            return {"market_score": 6, "predicted_price": int(row.group(1)) if row else 0}
+        target = re.search(r"TARGET CROP: (.+)", prompt).group(1).strip()
+        names = re.findall(r"^- ([^:]+):(.*)$", prompt, re.MULTILINE)
+        threats = [{"name": n, "type": "insect", "probability": 50} for n, rest in names
+                   if re.search(rf"\b{re.escape(target)}\b", rest, re.IGNORECASE)]
+        return {"overall_risk": "Moderate", "risk_score": 6, "threats": threats}
+
+    class _StandIn(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            answer = _stand_in_answer(body["messages"][-1]["content"])
+            payload = json.dumps({"choices": [{"message": {"content": json.dumps(answer)}}]}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _StandIn)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    import contextlib
+    import io
+    import models.prompt_reference as prompt_reference
+    from models import llm_cache, llm_config, rate_limiter, request_scope
+    llm_config.GROQ_API_URL = f"http://127.0.0.1:{server.server_port}/v1/chat/completions"
+    llm_cache.CACHE_ENABLED = False            # every call reaches the stand-in
+    rate_limiter.RATE_LIMIT_ENABLED = False
+    with contextlib.redirect_stdout(io.StringIO()):
+        from models.central_coordinator import CentralCoordinator
+        coordinator = CentralCoordinator()
+
+    n_farms = int(sys.argv[1]) if len(sys.argv) > 1 else 40
+    rng = random.Random(7)
+    farms = [dict(ph=round(rng.uniform(5.0, 8.0), 1), temperature=round(rng.uniform(10, 38)),
+                  rainfall=round(rng.uniform(30, 300)), humidity=round(rng.uniform(40, 90)))
+             for _ in range(n_farms)]
+
+    def run_agents(farm: Dict, pruned: bool) -> Dict:
+        prompt_reference.PRUNING_ENABLED = pruned
+        with contextlib.redirect_stdout(io.StringIO()):
+            engine = coordinator._run_engine(farm["ph"], farm["temperature"], farm["rainfall"],
+                                             80, farm["humidity"], 1.0, None)
+            candidates = CentralCoordinator._candidates(engine)
+            crop = engine[1] or "Rice"
+            out, tokens = {}, {}
+            for agent, call in (
+                    ("farmer", lambda: coordinator.farmer_advisor.recommend_detailed(
+                        **farm, candidates=candidates)),
+                    ("market", lambda: coordinator.market_researcher.forecast_market_trends(
+                        crop, candidates=candidates)),
+                    ("pest", lambda: coordinator.pest_predictor.predict_detailed(
+                        crop, farm["ph"], farm["humidity"], farm["temperature"], farm["rainfall"]))):
+                with request_scope.request_scope() as scope:
+                    out[agent] = call()
+                tokens[agent] = scope.stats()["prompt_tokens"]
+        return {"out": out, "tokens": tokens, "candidates": candidates or []}
+
+    full = [run_agents(f, pruned=False) for f in farms]
+    pruned = [run_agents(f, pruned=True) for f in farms]
+    server.shutdown()
+
+    def avg(runs, agent):
+        return sum(r["tokens"][agent] for r in runs) / len(runs)
+
+    def same(agent, field):
+        return sum(f["out"][agent].get(field) == p["out"][agent].get(field)
+                   for f, p in zip(full, pruned)) / len(farms)
+
+    def threats(run):
+        return sorted(t["name"] for t in run["out"]["pest"].get("threats", []))
+
+    print(f"\n📊 Prompt tokens per call (estimated, system + user) over {n_farms} farms")
+    for agent in ("farmer", "market", "pest"):
+        before, after = avg(full, agent), avg(pruned, agent)
+        print(f"   {agent:7s} full {before:6.0f} → pruned {after:6.0f}  ({1 - after / before:.0%} fewer)")
+    in_shortlist = sum(f["out"]["farmer"]["crop"] in p["candidates"] for f, p in zip(full, pruned))
+    print("\n🔍 Stand-in answers, pruned vs full prompt")
+    print(f"   FarmerAdvisor same pick        : {same('farmer', 'crop'):.0%} "
+          f"(full-table pick inside engine shortlist: {in_shortlist / n_farms:.0%})")
+    print(f"   MarketResearcher same price    : {same('market', 'predicted_price'):.0%}")
+    print(f"   PestPredictor same threat list : "
+          f"{sum(threats(f) == threats(p) for f, p in zip(full, pruned)) / n_farms:.0%}")
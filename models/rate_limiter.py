@@ -0,0 +1,313 @@
+"""
+rate_limiter — Shared token-bucket pacing for Groq calls
+========================================================
+Every LLM request reserves one request and an estimate of its tokens
+from two buckets (requests/min and tokens/min) *before* it is sent. A
+caller that would overdraw a bucket sleeps just long enough for the
+bucket to refill, instead of firing and reacting to a 429 afterwards.
+Reservations are FIFO: each caller takes its place in the debt and waits
+for exactly its own share.
+
+A request reserves its prompt estimate plus the *expected* completion,
+not its whole ``max_tokens``: a running mean (EWMA) of the completion
+tokens providers actually report, capped at the request's
+``max_tokens``. Reserving the full cap would make one recommendation
+(6 calls, ~5k prompt tokens, 2048-4096 max_tokens each) overdraw the
+default 12k tokens/min on its own and push agents to their fallbacks;
+with the expected completion it reserves ~8k. Each reservation is
+reconciled with the provider's reported usage after the response
+(``settle``), so over- and under-estimates are refunded or charged.
+
+Each provider in the router (models/llm_router.py) has its own bucket
+pair, so a second Groq key or a local vLLM is not paced by the default
+provider's quota. ``get_limiter`` is the default (GROQ_*) provider's.
+
+Backends:
+  • in-process (default) — one bucket pair per worker process
+  • SQLite (``shared_path``) — one bucket pair per provider shared by
+    every worker process on the host, updated inside an IMMEDIATE transaction
+
+Environment variables (optional):
+  LLM_RATE_LIMIT        — "0" disables pacing
+  LLM_RATE_RPM          — requests per minute (default 30)
+  LLM_RATE_TPM          — tokens per minute (default 12000, 0 = unlimited)
+  LLM_RATE_SHARED_PATH  — SQLite file to share the buckets across processes
+  LLM_RATE_COMPLETION_TOKENS — expected completion before any usage is reported (default 512)
+
+Pacing demo + one recommendation with the limiter on at the defaults:
+    python -m models.rate_limiter [n_calls]
+"""
+
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+
+RATE_LIMIT_ENABLED = os.getenv("LLM_RATE_LIMIT", "1") != "0"
+RATE_RPM = float(os.getenv("LLM_RATE_RPM", "30"))
+RATE_TPM = float(os.getenv("LLM_RATE_TPM", "12000"))
+RATE_SHARED_PATH = os.getenv("LLM_RATE_SHARED_PATH", "")
+RATE_COMPLETION_TOKENS = float(os.getenv("LLM_RATE_COMPLETION_TOKENS", "512"))
+COMPLETION_EWMA_ALPHA = 0.2      # weight of the newest reported completion
+
+
+def estimate_tokens(*texts: str, completion: int = 0) -> int:
+    """Rough token count (~4 characters per token) plus the completion budget."""
+    return sum(len(t) for t in texts) // 4 + completion
+
+
+class TokenBucketLimiter:
+    """Requests/min + tokens/min buckets with debt-based FIFO reservation."""
+
+    def __init__(self, rpm: float = RATE_RPM, tpm: float = RATE_TPM,
+                 shared_path: str = RATE_SHARED_PATH,
+                 completion_tokens: float = RATE_COMPLETION_TOKENS, name: str = "groq"):
+        self.name = name                # bucket row in the shared SQLite table
+        self.rpm = rpm
+        self.tpm = tpm
+        self.shared_path = os.path.abspath(shared_path) if shared_path else ""
+        self._lock = threading.Lock()
+        # Buckets start full: (request level, token level, last refill time)
+        self._state = (rpm, tpm, time.time())
+        self._completion = float(completion_tokens)      # EWMA of reported completions
+        self._local = threading.local()
+        self._stats = {"acquired": 0, "delayed": 0, "total_wait_ms": 0.0,
+                       "max_wait_ms": 0.0, "tokens_reserved": 0, "tokens_refunded": 0,
+                       "abandoned": 0}
+        if self.shared_path:
+            self._shared_conn()
+
+    # ── Bucket arithmetic ─────────────────────────────────────────────
+
+    def _refill(self, req: float, tok: float, then: float, now: float) -> Tuple[float, float]:
+        elapsed = max(0.0, now - then)
+        req = min(self.rpm, req + elapsed * self.rpm / 60)
+        if self.tpm:
+            tok = min(self.tpm, tok + elapsed * self.tpm / 60)
+        return req, tok
+
+    def _reserve(self, req: float, tok: float, tokens: int) -> Tuple[float, float, float]:
+        """Take 1 request + ``tokens``; → (req, tok, seconds until covered)."""
+        req -= 1
+        wait = max(0.0, -req * 60 / self.rpm) if self.rpm else 0.0
+        if self.tpm:
+            tok -= tokens
+            wait = max(wait, -tok * 60 / self.tpm)
+        return req, tok, wait
+
+    # ── Backends ──────────────────────────────────────────────────────
+
+    def _shared_conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            os.makedirs(os.path.dirname(self.shared_path), exist_ok=True)
+            conn = sqlite3.connect(self.shared_path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS rate_buckets ("
+                         "name TEXT PRIMARY KEY, req REAL, tok REAL, updated REAL)")
+            conn.execute("INSERT OR IGNORE INTO rate_buckets VALUES (?, ?, ?, ?)",
+                         (self.name, self.rpm, self.tpm, time.time()))
+            self._local.conn = conn
+        return conn
+
+    def _update(self, fn) -> float:
+        """Apply ``fn(req, tok) -> (req, tok, result)`` atomically."""
+        now = time.time()
+        if not self.shared_path:
+            with self._lock:
+                req, tok = self._refill(*self._state, now)
+                req, tok, result = fn(req, tok)
+                self._state = (req, tok, now)
+            return result
+
+        conn = self._shared_conn()
+        conn.execute("BEGIN IMMEDIATE")          # cross-process write lock
+        try:
+            row = conn.execute(
+                "SELECT req, tok, updated FROM rate_buckets WHERE name = ?", (self.name,)).fetchone()
+            req, tok = self._refill(*row, now)
+            req, tok, result = fn(req, tok)
+            conn.execute("UPDATE rate_buckets SET req = ?, tok = ?, updated = ? "
+                         "WHERE name = ?", (req, tok, now, self.name))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return result
+
+    # ── Public API ────────────────────────────────────────────────────
+
+    def reserve(self, tokens: int = 0) -> float:
+        """Reserve capacity now; → seconds the caller must wait before sending."""
+        wait = self._update(lambda req, tok: self._reserve(req, tok, tokens))
+        with self._lock:
+            self._stats["acquired"] += 1
+            self._stats["tokens_reserved"] += tokens
+            if wait > 0:
+                wait_ms = wait * 1000
+                self._stats["delayed"] += 1
+                self._stats["total_wait_ms"] += wait_ms
+                self._stats["max_wait_ms"] = max(self._stats["max_wait_ms"], wait_ms)
+        return wait
+
+    def acquire(self, tokens: int = 0, max_wait: Optional[float] = None) -> Optional[float]:
+        """Blocking reserve + sleep; → queueing delay in seconds.
+
+        Returns None (and hands the reservation back) instead of sleeping
+        when the wait would exceed ``max_wait``, e.g. a request deadline.
+        """
+        wait = self._reserve_within(tokens, max_wait)
+        if wait:
+            time.sleep(wait)
+        return wait
+
+    async def acquire_async(self, tokens: int = 0,
+                            max_wait: Optional[float] = None) -> Optional[float]:
+        """Event-loop friendly acquire."""
+        wait = self._reserve_within(tokens, max_wait)
+        if wait:
+            await asyncio.sleep(wait)
+        return wait
+
+    def _reserve_within(self, tokens: int, max_wait: Optional[float]) -> Optional[float]:
+        wait = self.reserve(tokens)
+        if max_wait is not None and wait > max_wait:
+            self._update(lambda req, tok: (req + 1, tok + tokens if self.tpm else tok, None))
+            with self._lock:
+                self._stats["abandoned"] += 1
+            return None
+        return wait
+
+    def completion_estimate(self, max_tokens: int = 0) -> int:
+        """Completion tokens to reserve for a request capped at ``max_tokens``."""
+        with self._lock:
+            expected = round(self._completion)
+        return min(max_tokens, expected) if max_tokens else expected
+
+    def settle(self, reserved: int, actual: Optional[int], completion: Optional[int] = None):
+        """Refund (or charge) the difference once real usage is known;
+        ``completion`` (reported completion tokens) updates the estimate."""
+        if completion is not None:
+            with self._lock:
+                self._completion += COMPLETION_EWMA_ALPHA * (completion - self._completion)
+        if not self.tpm or actual is None or actual == reserved:
+            return
+        delta = reserved - actual
+        self._update(lambda req, tok: (req, min(self.tpm, tok + delta), None))
+        with self._lock:
+            self._stats["tokens_refunded"] += delta
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            stats = dict(self._stats)
+        n = stats["acquired"]
+        stats["avg_queue_delay_ms"] = round(stats["total_wait_ms"] / n, 2) if n else 0.0
+        stats["rpm"] = self.rpm
+        stats["tpm"] = self.tpm
+        stats["completion_estimate"] = self.completion_estimate()
+        stats["shared"] = bool(self.shared_path)
+        return stats
+
+    def reset_stats(self):
+        with self._lock:
+            for key in self._stats:
+                self._stats[key] = 0.0 if key.endswith("_ms") else 0
+
+
+_limiter: Optional[TokenBucketLimiter] = None
+_limiter_lock = threading.Lock()
+
+
+def get_limiter() -> Optional[TokenBucketLimiter]:
+    """The default provider's process-wide limiter (None when disabled)."""
+    global _limiter
+    if not RATE_LIMIT_ENABLED:
+        return None
+    if _limiter is None:
+        with _limiter_lock:
+            if _limiter is None:
+                _limiter = TokenBucketLimiter()
+    return _limiter
+
+
+if __name__ == "__main__":
+    import contextlib
+    import io
+    import json
+    import sys
+    from concurrent.futures import ThreadPoolExecutor
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    from pathlib import Path
+    sys.path.insert(0, str(Path(__file__).parent.parent))
+
+    # Pace 20 back-to-back calls at 120 req/min (2/s) after a 5-call burst
+    n_calls = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    limiter = TokenBucketLimiter(rpm=120, tpm=0)
+    limiter._state = (5, 0, time.time())
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=n_calls) as pool:
+        sent = list(pool.map(lambda _: (limiter.acquire(), time.perf_counter() - start)[1],
+                             range(n_calls)))
+    stats = limiter.stats()
+    print(f"\n📊 {n_calls} concurrent calls at 120 req/min, burst 5")
+    print(f"   last call sent after {max(sent):.2f}s "
+          f"(ideal {(n_calls - 5) / 2:.2f}s), {stats['delayed']} delayed, "
+          f"avg queue delay {stats['avg_queue_delay_ms']:.0f} ms, "
+          f"max {stats['max_wait_ms']:.0f} ms")
+
+    # One recommendation with the limiter on at the default rpm/tpm, against
+    # a stand-in that answers in 1 s and reports 300 completion tokens per reply
+    class _StandIn(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            time.sleep(1.0)
+            reply = {"crop": "Rice", "score": 7, "confidence": 80, "threats": [],
+                     "overall_risk": "Low", "risk_score": 3}
+            prompt = estimate_tokens(*(m["content"] for m in body["messages"]))
+            usage = {"prompt_tokens": prompt, "completion_tokens": 300, "total_tokens": prompt + 300}
+            payload = json.dumps({"choices": [{"message": {"content": json.dumps(reply)}}],
+                                  "usage": usage}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _StandIn)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    import models.rate_limiter as rate_limiter
+    from models import llm_cache, llm_config
+    from models.central_coordinator import CentralCoordinator
+    from models.deadline import DEFAULT_DEADLINE_S
+    llm_config.GROQ_API_URL = f"http://127.0.0.1:{server.server_port}/v1/chat/completions"
+    llm_cache.CACHE_ENABLED = False
+    coordinator = CentralCoordinator()
+
+    runs = {}
+    # full max_tokens reserved (the estimate never drops below the cap) vs the default estimate
+    for label, completion in (("full max_tokens", 10 ** 6), ("expected completion", RATE_COMPLETION_TOKENS)):
+        rate_limiter._limiter = TokenBucketLimiter(completion_tokens=completion)
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = coordinator.generate_recommendation(crop_preference="Rice",
+                                                         deadline_s=DEFAULT_DEADLINE_S)
+        runs[label] = (result["Deadline"]["cut_short"], rate_limiter._limiter.stats())
+    server.shutdown()
+
+    print(f"\n📊 One recommendation, limiter on ({RATE_RPM:.0f} req/min, {RATE_TPM:.0f} tokens/min)")
+    for label, (cut_short, stats) in runs.items():
+        print(f"   {label:<20}: {stats['acquired'] - stats['abandoned']} sent, "
+              f"{stats['tokens_reserved']} tokens reserved, {stats['tokens_refunded']} refunded, "
+              f"fallbacks {cut_short or 'none'}")
+    ok = not runs["expected completion"][0]
+    print(f"   {'✅' if ok else '❌'} a default-config recommendation fits the bucket")
+    sys.exit(0 if ok else 1)
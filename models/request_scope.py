@@ -0,0 +1,227 @@
+"""
+request_scope — Per-recommendation memo of agent results + upstream counters
+============================================================================
+Inside one recommendation the same agent analysis can be asked for more
+than once — by the coordinator and by a backward-compatible wrapper
+(``predict``, ``recommend``, ``forecast``, ``evaluate``) that rebuilds
+the detailed result. Agents' primary methods are wrapped with
+``@memoized(agent)``: within a ``request_scope()`` the first call for a
+given agent + arguments computes the result and every later (or
+concurrent) call gets a copy of it. Outside a scope nothing is memoized.
+
+The scope also counts what actually left the process, so a regression
+that adds an LLM round trip shows up as a number:
+
+    with request_scope() as scope:
+        coordinator.generate_recommendation(...)
+    scope.stats()  # {"llm_requests": 6, "prompt_tokens": 4922, "memo_hits": 0, ...}
+
+Check the per-recommendation budget against a local stand-in server:
+    python -m models.request_scope
+"""
+
+import contextvars
+import copy
+import functools
+import inspect
+import json
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, Optional
+
+from models.single_flight import SingleFlight
+
+
+class RequestScope:
+    """Results memo + upstream-call counters for one request."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._results: Dict[str, Any] = {}
+        self._flight = SingleFlight("request_memo")
+        self._counters: Dict[str, int] = {
+            "llm_requests": 0,       # HTTP requests sent to the LLM (incl. retries)
+            "prompt_tokens": 0,      # ... and their estimated input tokens
+            "llm_cache_hits": 0,     # answered from the persistent LLM cache
+            "agent_calls": 0,        # agent analyses actually computed
+            "memo_hits": 0,          # ... and served from this scope instead
+        }
+
+    def count(self, name: str, n: int = 1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + n
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            stats = dict(self._counters)
+        stats["memo_hits"] += self._flight.stats()["coalesced"]   # joined a call in flight
+        return stats
+
+    # ── Memo ──────────────────────────────────────────────────────────
+
+    def _cached(self, key: str):
+        with self._lock:
+            if key in self._results:
+                self._counters["memo_hits"] += 1
+                return True, copy.deepcopy(self._results[key])
+        return False, None
+
+    def _store(self, key: str, result: Any) -> Any:
+        with self._lock:
+            self._results[key] = copy.deepcopy(result)    # callers may mutate theirs
+        return result
+
+    def remember(self, key: str, result: Any):
+        """Record a result computed outside the memoized method (e.g. the
+        fused specialist panel) so the method's callers reuse it."""
+        self._store(key, result)
+
+    def get_or_compute(self, key: str, fn: Callable, *args, **kwargs) -> Any:
+        hit, result = self._cached(key)
+        if hit:
+            return result
+
+        def compute():
+            self.count("agent_calls")
+            return self._store(key, fn(*args, **kwargs))
+        return self._flight.do(key, compute)
+
+    async def get_or_compute_async(self, key: str, fn: Callable, *args, **kwargs) -> Any:
+        hit, result = self._cached(key)
+        if hit:
+            return result
+
+        async def compute():
+            self.count("agent_calls")
+            return self._store(key, await fn(*args, **kwargs))
+        return await self._flight.do_async(key, compute)
+
+
+_current: contextvars.ContextVar[Optional[RequestScope]] = contextvars.ContextVar(
+    "agrismart_request_scope", default=None)
+
+
+def current_scope() -> Optional[RequestScope]:
+    return _current.get()
+
+
+@contextmanager
+def request_scope() -> Iterator[RequestScope]:
+    """Open a scope (or join the enclosing one) for the body."""
+    scope = _current.get()
+    if scope is not None:
+        yield scope
+        return
+    scope = RequestScope()
+    token = _current.set(scope)
+    try:
+        yield scope
+    finally:
+        _current.reset(token)
+
+
+def count(name: str, n: int = 1):
+    """Bump a counter on the active scope (no-op outside one)."""
+    scope = _current.get()
+    if scope is not None:
+        scope.count(name, n)
+
+
+def memoized(agent: str):
+    """Memoize an agent method per request scope, keyed on its arguments.
+
+    The sync and ``*_async`` twins of a method share one key, so either
+    can reuse the other's result. ``method.memo_key(self, *args, **kwargs)``
+    gives the key for ``RequestScope.remember``.
+    """
+    def decorate(method: Callable) -> Callable:
+        signature = inspect.signature(method)
+        name = method.__name__[:-len("_async")] if method.__name__.endswith("_async") else method.__name__
+
+        def key_for(args, kwargs) -> str:
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            arguments = {k: v for k, v in bound.arguments.items() if k != "self"}
+            return json.dumps([agent, name, sorted(arguments.items())], default=str)
+
+        if inspect.iscoroutinefunction(method):
+            @functools.wraps(method)
+            async def async_wrapper(*args, **kwargs):
+                scope = _current.get()
+                if scope is None:
+                    return await method(*args, **kwargs)
+                return await scope.get_or_compute_async(
+                    key_for(args, kwargs), method, *args, **kwargs)
+            async_wrapper.memo_key = lambda *args, **kwargs: key_for(args, kwargs)
+            return async_wrapper
+
+        @functools.wraps(method)
+        def wrapper(*args, **kwargs):
+            scope = _current.get()
+            if scope is None:
+                return method(*args, **kwargs)
+            return scope.get_or_compute(key_for(args, kwargs), method, *args, **kwargs)
+        wrapper.memo_key = lambda *args, **kwargs: key_for(args, kwargs)
+        return wrapper
+    return decorate
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# Upstream-call budget of one recommendation against a local stand-in server
+#   python -m models.request_scope
+# ═══════════════════════════════════════════════════════════════════════════════
+
+if __name__ == "__main__":
+    import sys
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    from pathlib import Path
+    sys.path.insert(0, str(Path(__file__).parent.parent))
+
+    # farmer + 4 specialists + synthesis; the pest summary text is not a call
+    EXPECTED_LLM_REQUESTS = 6
+
+    class _StandIn(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            reply = {"crop": "Rice", "score": 7, "confidence": 80, "threats": [],
+                     "overall_risk": "Low", "risk_score": 3}
+            payload = json.dumps({"choices": [{"message": {"content": json.dumps(reply)}}]}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _StandIn)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    from models import llm_cache, llm_config, rate_limiter
+    import models.request_scope as request_scope_module
+    llm_config.GROQ_API_URL = f"http://127.0.0.1:{server.server_port}/v1/chat/completions"
+    llm_cache.CACHE_ENABLED = False            # count real round trips only
+    rate_limiter.RATE_LIMIT_ENABLED = False    # the stand-in has no rate limit
+    from models.central_coordinator import CentralCoordinator
+
+    coordinator = CentralCoordinator()
+    result = coordinator.generate_recommendation(crop_preference="Rice")
+    stats = result["Upstream Calls"]
+
+    # A compatibility wrapper inside the same scope reuses the detailed result
+    with request_scope_module.request_scope() as scope:
+        coordinator.pest_predictor.predict_detailed("Rice")
+        coordinator.pest_predictor.predict("Rice")
+    wrapper = scope.stats()
+    server.shutdown()
+
+    print(f"\n📊 Upstream calls for one recommendation: {stats}")
+    print(f"   pest predict_detailed + predict in one scope: {wrapper}")
+    ok = (stats["llm_requests"] == EXPECTED_LLM_REQUESTS
+          and wrapper["llm_requests"] == 1 and wrapper["memo_hits"] == 1)
+    print(f"   {'✅' if ok else '❌'} budget: {EXPECTED_LLM_REQUESTS} LLM requests per recommendation")
+    sys.exit(0 if ok else 1)
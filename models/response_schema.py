@@ -0,0 +1,393 @@
+"""
+response_schema — Declarative, one-pass parsing of LLM JSON responses
+=====================================================================
+Each agent declares its response as a ``Schema`` of typed fields instead
+of walking the dict by hand with ``float()`` / ``str()`` coercions. The
+schema is compiled once into a flat list of per-field coercers, and
+``validate`` builds the normalised result in a single pass. A value that
+cannot be coerced rejects the whole response, and the agent falls back,
+as before.
+
+    MARKET_SCHEMA = Schema("MarketResearcher", {
+        "market_score": Score(),
+        "price_trend": Choice(("rising", "stable", "falling"), "stable", lower=True),
+        "risks": TextList(),
+    })
+    MARKET_SCHEMA.validate(resp)   # normalised dict, or None
+
+``parse_json`` replaces the json.loads → fence regex → greedy ``{.*}``
+cascade with one scan that decodes the first complete JSON object in the
+text. Fences, leading prose and trailing prose cost nothing extra.
+``ObjectStream`` decodes a response while it streams in, and returns
+each top-level member as soon as its value is complete. The specialist
+panel uses it to hand out sections before the closing brace arrives.
+
+Microbenchmark on recorded responses:
+    python -m models.response_schema [iterations]
+"""
+
+import json
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+# Non-strict: LLMs put raw newlines / tabs inside strings
+_decoder = json.JSONDecoder(strict=False)
+_WHITESPACE = " \t\n\r"
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# Parsing
+# ═══════════════════════════════════════════════════════════════════════════════
+
+def parse_json(text: str) -> Optional[Dict]:
+    """The first complete JSON object in ``text`` (fenced, prefixed or not)."""
+    start = text.find("{")
+    while start != -1:
+        try:
+            value, _ = _decoder.raw_decode(text, start)
+            if isinstance(value, dict):
+                return value
+        except json.JSONDecodeError:
+            pass
+        start = text.find("{", start + 1)
+    return None
+
+
+def _skip(text: str, i: int) -> int:
+    while i < len(text) and text[i] in _WHITESPACE:
+        i += 1
+    return i
+
+
+class ObjectStream:
+    """Incremental decoder for one streamed JSON object.
+
+        stream = ObjectStream()
+        for chunk in chunks:
+            for key, value in stream.feed(chunk):   # members completed so far
+                ...
+        response = stream.close()                  # the whole object, or None
+
+    A member is returned once the ``,`` or ``}`` after its value has
+    arrived, so a number cut off mid-chunk is never returned early.
+    """
+
+    def __init__(self):
+        self._buf = ""
+        self._pos: Optional[int] = None      # start of the next member
+        self.done = False
+        self.members: Dict[str, Any] = {}
+
+    def feed(self, chunk: str) -> List[Tuple[str, Any]]:
+        self._buf += chunk
+        if self._pos is None:
+            start = self._buf.find("{")
+            if start == -1:
+                return []
+            self._pos = start + 1
+        elif "," not in chunk and "}" not in chunk:
+            return []            # nothing can have completed without a delimiter
+        completed = []
+        while not self.done:
+            member = self._next_member()
+            if member is None:
+                break
+            completed.append(member)
+        return completed
+
+    def _next_member(self) -> Optional[Tuple[str, Any]]:
+        buf = self._buf
+        i = _skip(buf, self._pos)
+        if i < len(buf) and buf[i] == "}":
+            self.done = True
+            return None
+        try:
+            key, i = _decoder.raw_decode(buf, i)
+            i = _skip(buf, i)
+            if i >= len(buf) or buf[i] != ":":
+                return None
+            value, i = _decoder.raw_decode(buf, _skip(buf, i + 1))
+        except json.JSONDecodeError:
+            return None          # incomplete so far (or malformed — see close)
+        i = _skip(buf, i)
+        if i >= len(buf) or buf[i] not in ",}":
+            return None
+        self.done = buf[i] == "}"
+        self._pos = i + 1
+        self.members[key] = value
+        return key, value
+
+    def close(self) -> Optional[Dict]:
+        """The complete object, or None if the text ended before it closed
+        (a truncated reply — re-parsing it would find an inner object)."""
+        return self.members if self.done else None
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# Fields
+# ═══════════════════════════════════════════════════════════════════════════════
+
+class Field:
+    """A response field: missing → ``default``, present → ``coerce(value)``."""
+
+    def __init__(self, default: Any = None, required: bool = False):
+        self.default = default
+        self.required = required        # empty value rejects the response
+
+    def coerce(self, value: Any) -> Any:
+        return value
+
+
+class Text(Field):
+    def __init__(self, default: str = "", lower: bool = False,
+                 strip: bool = False, required: bool = False):
+        super().__init__(default, required)
+        self.lower, self.strip = lower, strip
+
+    def coerce(self, value: Any) -> str:
+        text = str(value)
+        if self.strip:
+            text = text.strip()
+        return text.lower() if self.lower else text
+
+
+class Number(Field):
+    def __init__(self, default: float = 0.0, lo: float = None, hi: float = None,
+                 ndigits: int = None, cast: Callable = float, falsy_default: bool = False):
+        super().__init__(default)
+        self.lo, self.hi, self.ndigits, self.cast = lo, hi, ndigits, cast
+        self.falsy_default = falsy_default      # None / 0 / "" → default
+
+    def coerce(self, value: Any) -> float:
+        number = self.cast((value or self.default) if self.falsy_default else value)
+        if self.lo is not None:
+            number = max(self.lo, number)
+        if self.hi is not None:
+            number = min(self.hi, number)
+        return round(number, self.ndigits) if self.ndigits is not None else number
+
+
+def Score(default: float = 5.0, falsy_default: bool = False) -> Number:
+    """A 0-10 score rounded to one decimal."""
+    return Number(default, 0.0, 10.0, ndigits=1, falsy_default=falsy_default)
+
+
+class Choice(Field):
+    def __init__(self, options: Sequence[str], default: str, lower: bool = False):
+        super().__init__(default)
+        self.options, self.lower = frozenset(options), lower
+
+    def coerce(self, value: Any) -> str:
+        text = str(value).lower() if self.lower else str(value)
+        return text if text in self.options else self.default
+
+
+class TextList(Field):
+    """A list; a bare string becomes a one-item list."""
+
+    def __init__(self):
+        super().__init__(default=[])
+
+    def coerce(self, value: Any) -> List:
+        return [value] if isinstance(value, str) else value
+
+
+class Records(Field):
+    """A list of objects: entries without ``key`` are dropped, the rest go
+    through ``schema``; optionally sorted and truncated."""
+
+    def __init__(self, schema: "Schema", key: str, limit: int = None,
+                 sort_key: Callable = None):
+        super().__init__(default=[])
+        self.schema, self.key, self.limit, self.sort_key = schema, key, limit, sort_key
+
+    def coerce(self, value: Any) -> List[Dict]:
+        records = [self.schema.coerce(item) for item in value
+                   if isinstance(item, dict) and self.key in item]
+        if self.sort_key is not None:
+            records.sort(key=self.sort_key)
+        return records[:self.limit] if self.limit is not None else records
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# Schema
+# ═══════════════════════════════════════════════════════════════════════════════
+
+class Schema:
+    """An agent's response fields, compiled into one coercion pass."""
+
+    def __init__(self, agent: str, fields: Dict[str, Field]):
+        self.agent = agent
+        self.fields = fields
+        self._steps = tuple((name, f.coerce, f.default, f.required)
+                            for name, f in fields.items())
+
+    def coerce(self, resp: Dict) -> Optional[Dict]:
+        """Normalised copy of ``resp``; raises on an uncoercible value."""
+        out = {}
+        get = resp.get
+        for name, coerce, default, required in self._steps:
+            value = get(name, _MISSING)
+            if value is _MISSING:
+                out[name] = list(default) if type(default) is list else default
+            else:
+                out[name] = coerce(value)
+            if required and not out[name]:
+                return None
+        return out
+
+    def validate(self, resp: Dict) -> Optional[Dict]:
+        """``coerce``, or None (logged) if the response is malformed."""
+        try:
+            return self.coerce(resp)
+        except Exception as e:
+            print(f"⚠️ {self.agent}: LLM response validation failed: {e}")
+            return None
+
+
+_MISSING = object()
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# Microbenchmark on recorded responses
+#   python -m models.response_schema [iterations]
+#
+# Legacy = the old llm_config._parse_json cascade + MarketResearcher's
+# hand-written validator; new = parse_json + the compiled schema.
+# Responses recorded in the LLM cache are added when the cache file exists.
+# ═══════════════════════════════════════════════════════════════════════════════
+
+if __name__ == "__main__":
+    import contextlib
+    import io
+    import re
+    import sys
+    import time
+    from pathlib import Path
+    sys.path.insert(0, str(Path(__file__).parent.parent))
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        from models.market_Researcher import RESPONSE_SCHEMA as MARKET_SCHEMA
+        from models.specialist_panel import SECTIONS
+
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+
+    MARKET = {
+        "market_score": 7.4, "price_trend": "Rising", "demand_forecast": "Strong",
+        "predicted_price": 2712.5, "profit_potential": "high",
+        "reasoning": "MSP ₹2203 gives a floor; mandi prices sit 18% above it with steady export pull.",
+        "insights": "Store for 6-8 weeks after harvest and sell through the e-NAM platform.",
+        "risks": ["Monsoon delay", "Export policy changes"],
+    }
+    PANEL = {
+        "market": MARKET,
+        "weather": {"weather_score": 8.1, "risk_level": "Low", "forecast": "Warm, humid kharif.",
+                    "predicted_yield_impact": "+4%", "risks": ["Waterlogging in late August"],
+                    "reasoning": "Temperature and rainfall inside the optimal window.",
+                    "advice": "Keep field channels open; plan a drainage pass."},
+        "sustainability": {"sustainability_score": 6.2, "environmental_impact": "Medium",
+                           "carbon_footprint": 5.3, "water_score": 4.0, "soil_health_score": 7.0,
+                           "biodiversity_score": 6.5, "nutrient_efficiency_score": 6.0,
+                           "recommendations": "Switch 30% of urea to FYM; alternate wetting and drying.",
+                           "reasoning": "Water footprint dominates.", "carbon_kg_estimate": 474.0,
+                           "improvement_potential": "About 1.5 points."},
+        "pest": {"overall_risk": "Moderate", "risk_score": 5.5,
+                 "threats": [{"name": "Brown Plant Hopper", "type": "insect", "probability": 60,
+                              "severity": "high", "symptoms": "Hopper burn",
+                              "bio_control": "Conserve spiders", "chemical_control": "Pymetrozine",
+                              "prevention": "Avoid excess N"}],
+                 "reasoning": "Humid, warm.", "ipm_plan": "Light traps weekly.", "summary": "Moderate."},
+    }
+    body = json.dumps(MARKET, ensure_ascii=False, indent=2)
+    recorded = {
+        "plain": body,
+        "fenced": f"```json\n{body}\n```",
+        "prose around": f"Here is the analysis you asked for:\n{body}\nLet me know if {{more}} is needed.",
+    }
+
+    cache_path = Path(__file__).parent.parent / "database" / "llm_cache.sqlite"
+    if cache_path.exists():
+        import sqlite3
+        try:
+            rows = sqlite3.connect(cache_path).execute(
+                "SELECT response FROM llm_cache LIMIT 200").fetchall()
+            for n, (response,) in enumerate(rows):
+                recorded[f"cache #{n}"] = response
+        except sqlite3.Error:
+            pass
+
+    def legacy_parse(text):
+        try:
+            return json.loads(text)
+        except json.JSONDecodeError:
+            pass
+        match = re.search(r"```(?:json)?\s*(.*?)\s*```", text, re.DOTALL)
+        if match:
+            try:
+                return json.loads(match.group(1))
+            except json.JSONDecodeError:
+                pass
+        match = re.search(r"\{.*\}", text, re.DOTALL)
+        if match:
+            try:
+                return json.loads(match.group(0))
+            except json.JSONDecodeError:
+                pass
+        return None
+
+    def legacy_validate(resp):
+        try:
+            market_score = max(0.0, min(10.0, float(resp.get("market_score", 5.0))))
+            price_trend = str(resp.get("price_trend", "stable")).lower()
+            if price_trend not in ("rising", "stable", "falling"):
+                price_trend = "stable"
+            risks = resp.get("risks", [])
+            if isinstance(risks, str):
+                risks = [risks]
+            return {
+                "market_score": round(market_score, 1), "price_trend": price_trend,
+                "demand_forecast": str(resp.get("demand_forecast", "moderate")).lower(),
+                "predicted_price": round(float(resp.get("predicted_price", 0)), 2),
+                "profit_potential": str(resp.get("profit_potential", "medium")),
+                "reasoning": str(resp.get("reasoning", "")), "insights": str(resp.get("insights", "")),
+                "risks": risks,
+            }
+        except Exception:
+            return None
+
+    def timed(fn, text) -> float:
+        start = time.perf_counter()
+        for _ in range(iterations):
+            fn(text)
+        return (time.perf_counter() - start) / iterations * 1e6
+
+    print(f"\n⏱️  Parse + validate, µs per response ({iterations} iterations)")
+    print(f"   {'response':14s} {'legacy':>8s} {'schema':>8s}  parsed")
+    for label, text in list(recorded.items())[:8]:
+        old = timed(lambda t: (lambda r: r and legacy_validate(r))(legacy_parse(t)), text)
+        new = timed(lambda t: (lambda r: r and MARKET_SCHEMA.coerce(r))(parse_json(t)), text)
+        legacy_ok = legacy_parse(text) is not None
+        print(f"   {label:14s} {old:8.1f} {new:8.1f}  legacy {'✅' if legacy_ok else '❌'} "
+              f"new {'✅' if parse_json(text) is not None else '❌'}")
+    same = legacy_validate(MARKET) == MARKET_SCHEMA.coerce(MARKET)
+    print(f"   schema output == hand-written validator: {same}")
+
+    # Streamed panel response in 16-character chunks
+    panel_text = json.dumps(PANEL, ensure_ascii=False)
+    chunks = [panel_text[i:i + 16] for i in range(0, len(panel_text), 16)]
+    stream, seen = ObjectStream(), 0
+    arrivals = {}
+    for chunk in chunks:
+        seen += len(chunk)
+        for key, _ in stream.feed(chunk):
+            arrivals[key] = seen
+    start = time.perf_counter()
+    for _ in range(iterations // 10 or 1):
+        s = ObjectStream()
+        for chunk in chunks:
+            s.feed(chunk)
+    per_stream = (time.perf_counter() - start) / (iterations // 10 or 1) * 1e6
+    print(f"\n📡 Streamed panel response: {len(panel_text)} chars in {len(chunks)} chunks, "
+          f"{per_stream:.0f} µs to decode")
+    for key in SECTIONS:
+        print(f"   {key:15s} available after {arrivals[key] / len(panel_text):5.0%} of the text")
+    print(f"   close() == json.loads: {stream.close() == json.loads(panel_text)}")
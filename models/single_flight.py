@@ -0,0 +1,244 @@
+"""
+single_flight — Coalesce identical in-flight upstream calls
+===========================================================
+When a burst of farmers from one village asks at the same moment, N
+identical LLM or Open-Meteo requests would leave before the first one
+returns. ``SingleFlight`` lets the first caller for a key (the leader)
+make the upstream call while every concurrent caller with the same key
+waits for it and shares its result — or its exception.
+
+Works from threads (``do``) and from asyncio (``do_async``), and across
+the two: an async caller can join a flight led by a thread and vice
+versa. Async flights run as their own task, so cancelling one waiter
+never cancels the shared upstream call.
+
+Demo against a slow local stand-in server (proves one upstream request):
+    python -m models.single_flight
+"""
+
+import asyncio
+import copy
+import threading
+from typing import Any, Callable, Dict, Hashable, List, Tuple
+
+
+class _Call:
+    __slots__ = ("done", "result", "error", "followers", "waiters")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.followers = 0
+        self.waiters: List[Tuple[asyncio.AbstractEventLoop, asyncio.Future]] = []
+
+
+def _resolve(future: asyncio.Future, call: _Call):
+    if future.done():
+        return
+    if call.error is not None:
+        future.set_exception(call.error)
+    else:
+        future.set_result(call.result)
+
+
+class SingleFlight:
+    """Per-key de-duplication of concurrent calls.
+
+    Once a flight had followers, every caller receives its own deep copy
+    of the result (``share``) so no caller can mutate another's response.
+    """
+
+    def __init__(self, name: str = "flight", share: Callable[[Any], Any] = copy.deepcopy):
+        self.name = name
+        self._share = share
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+        self._stats = {"calls": 0, "leaders": 0, "coalesced": 0}
+
+    def _join(self, key: Hashable) -> Tuple[_Call, bool]:
+        """→ (call, is_leader); caller must hold self._lock."""
+        self._stats["calls"] += 1
+        call = self._calls.get(key)
+        if call is not None:
+            self._stats["coalesced"] += 1
+            call.followers += 1
+            return call, False
+        call = _Call()
+        self._calls[key] = call
+        self._stats["leaders"] += 1
+        return call, True
+
+    def _finish(self, key: Hashable, call: _Call):
+        with self._lock:
+            self._calls.pop(key, None)
+            waiters, call.waiters = call.waiters, []
+            call.done.set()
+        for loop, future in waiters:
+            try:
+                loop.call_soon_threadsafe(_resolve, future, call)
+            except RuntimeError:        # waiter's loop already closed
+                pass
+
+    # ── Threads ───────────────────────────────────────────────────────
+
+    def do(self, key: Hashable, fn: Callable, *args, **kwargs) -> Any:
+        """Run ``fn(*args, **kwargs)`` once per concurrent ``key``."""
+        with self._lock:
+            call, leader = self._join(key)
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return self._share(call.result)
+
+        try:
+            call.result = fn(*args, **kwargs)
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            self._finish(key, call)
+        return self._share(call.result) if call.followers else call.result
+
+    # ── asyncio ───────────────────────────────────────────────────────
+
+    async def do_async(self, key: Hashable, fn: Callable, *args, **kwargs) -> Any:
+        """Await ``fn(*args, **kwargs)`` (a coroutine function) once per key."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        with self._lock:
+            call, leader = self._join(key)
+            call.waiters.append((loop, future))
+
+        if leader:
+            task = loop.create_task(fn(*args, **kwargs))
+
+            def _done(t: asyncio.Task):
+                if t.cancelled():
+                    call.error = asyncio.CancelledError()
+                elif t.exception() is not None:
+                    call.error = t.exception()
+                else:
+                    call.result = t.result()
+                self._finish(key, call)
+
+            task.add_done_callback(_done)
+
+        result = await future
+        # followers is final here: the flight left the table before resolving
+        return self._share(result) if call.followers else result
+
+    # ── Metrics ───────────────────────────────────────────────────────
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["in_flight"] = len(self._calls)
+        return stats
+
+    def reset_stats(self):
+        with self._lock:
+            for key in self._stats:
+                self._stats[key] = 0
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# Demo: N concurrent identical calls → 1 upstream request
+#   python -m models.single_flight [n_callers]
+# ═══════════════════════════════════════════════════════════════════════════════
+
+if __name__ == "__main__":
+    import json
+    import sys
+    import time
+    from concurrent.futures import ThreadPoolExecutor
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    from pathlib import Path
+    sys.path.insert(0, str(Path(__file__).parent.parent))
+
+    upstream = {"requests": 0}
+
+    class _SlowStandIn(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+        wbufsize = -1
+
+        def _reply(self, payload: dict):
+            upstream["requests"] += 1
+            time.sleep(0.5)                    # slow upstream
+            body = json.dumps(payload).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_POST(self):                     # LLM chat completion
+            self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            self._reply({"choices": [{"message": {"content": '{"ok": true}'}}]})
+
+        def do_GET(self):                      # Open-Meteo geocode + forecast
+            if "search" in self.path:
+                self._reply({"results": [{"latitude": 18.5, "longitude": 73.9, "name": "Pune"}]})
+            else:
+                self._reply({"current": {"temperature_2m": 31.0, "weather_code": 1}})
+
+        def log_message(self, *args):
+            pass
+
+    n_callers = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    ThreadingHTTPServer.request_queue_size = 1024
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _SlowStandIn)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_port}"
+
+    from models import llm_config, weather_Analyst
+    llm_config.GROQ_API_URL = f"{base}/v1/chat/completions"
+    weather_Analyst.OPEN_METEO_GEOCODE = f"{base}/v1/search"
+    weather_Analyst.OPEN_METEO_BASE = f"{base}/v1"
+    analyst = weather_Analyst.WeatherAnalyst()
+
+    def burst(label: str, fn):
+        upstream["requests"] = 0
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=n_callers) as pool:
+            results = list(pool.map(lambda _: fn(), range(n_callers)))
+        elapsed = time.perf_counter() - start
+        same = all(r == results[0] for r in results)
+        print(f"   {label:<34} {n_callers} callers → {upstream['requests']} upstream "
+              f"request(s), {elapsed:.2f}s, identical results: {same}")
+        return upstream["requests"], same
+
+    async def async_burst():
+        upstream["requests"] = 0
+        start = time.perf_counter()
+        results = await asyncio.gather(*(
+            llm_config.acall_gemini("system", "async prompt", use_cache=False)
+            for _ in range(n_callers)))
+        await llm_config.aclose_async_clients()
+        elapsed = time.perf_counter() - start
+        same = all(r == results[0] for r in results)
+        print(f"   {'acall_gemini (asyncio)':<34} {n_callers} callers → {upstream['requests']} "
+              f"upstream request(s), {elapsed:.2f}s, identical results: {same}")
+        return upstream["requests"], same
+
+    print("\n📊 Single-flight against a 0.5 s stand-in server")
+    runs = [
+        (1, burst("call_gemini (threads)",
+                  lambda: llm_config.call_gemini("system", "thread prompt", use_cache=False))),
+        (1, asyncio.run(async_burst())),
+        # one live-weather fetch = geocode + forecast = 2 upstream requests
+        (2, burst("WeatherAnalyst.get_live_weather", lambda: analyst.get_live_weather("Pune"))),
+    ]
+    server.shutdown()
+    ok = all(sent == expected and same for expected, (sent, same) in runs)
+    print(f"   {'✅' if ok else '❌'} every burst coalesced to its expected upstream requests "
+          f"with identical results")
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,306 @@
+"""
+specialist_panel — One fused LLM call for the four specialist agents
+====================================================================
+Market, weather, sustainability and pest normally send four requests
+that repeat the same farm conditions. In panel mode the coordinator sends
+a single structured request whose JSON holds one section per specialist,
+in each specialist's own schema. Every section is then run through that
+agent's ``_validate_response``; a missing or malformed section falls back
+to that agent's rule-based ``_fallback_*`` answer on its own, so one bad
+section never costs the other three. In deterministic mode
+(``local_scoring``) the numeric fields of the market, weather and
+sustainability sections are replaced by the local formulas' values.
+
+A recommendation then makes three LLM requests (farmer, panel, synthesis)
+instead of six, with two round trips on the critical path — useful when
+Groq's requests/min or tokens/min limit is the bottleneck. The answers
+are also recorded in the request scope, so a compatibility wrapper
+(``PestDiseasePredictor.predict`` ...) in the same request reuses them.
+
+On the async path the reply is streamed (``astream_gemini``): each
+section is validated and handed to the coordinator the moment its JSON
+object is complete, so the first specialist's card can be shown while
+the model is still writing the last one.
+
+Environment variables (optional):
+  AGRISMART_PANEL_MODE    — "1" makes the coordinator use the panel by default
+  AGRISMART_PANEL_STREAM  — "0" waits for the whole panel reply (async path)
+
+Compare both modes against a local stand-in server:
+    python -m models.specialist_panel
+"""
+
+import os
+from datetime import datetime
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from models.llm_config import acall_gemini, astream_gemini, call_gemini
+from models.input_quantizer import quantize_inputs, with_inputs
+from models import market_Researcher, weather_Analyst, sustainability_Expert, pest_disease_predictor
+from models import local_scoring, request_scope
+
+
+PANEL_ENABLED = os.getenv("AGRISMART_PANEL_MODE", "0") == "1"
+PANEL_STREAM = os.getenv("AGRISMART_PANEL_STREAM", "1") == "1"
+
+SECTIONS = ("market", "weather", "sustainability", "pest")
+
+_ROLES = {
+    "market": ("MarketResearcher", market_Researcher.SYSTEM_PROMPT,
+               "Indian crop economics — MSP vs mandi price, demand, volatility, shelf-life, selling strategy"),
+    "weather": ("WeatherAnalyst", weather_Analyst.SYSTEM_PROMPT,
+                "crop-weather fit — optimal vs stress ranges, drought/flood/frost risk, yield impact, adaptation"),
+    "sustainability": ("SustainabilityExpert", sustainability_Expert.SYSTEM_PROMPT,
+                       "carbon (use the emission factors), water, soil health, biodiversity, nutrient balance"),
+    "pest": ("PestDiseasePredictor", pest_disease_predictor.SYSTEM_PROMPT,
+             "pest/disease threats ranked by probability, IPM with biological before chemical control"),
+}
+
+
+def _schema(system_prompt: str) -> str:
+    """The JSON schema an agent's system prompt asks for."""
+    return system_prompt.split("Respond with a JSON object:", 1)[1].strip()
+
+
+PANEL_SYSTEM_PROMPT = (
+    "You are a panel of four expert agricultural AI agents assessing ONE farm. "
+    "Each specialist reasons independently from the shared farm data and its own reference data:\n"
+    + "\n".join(f'- "{key}": **{name}** — {focus}' for key, (name, _, focus) in _ROLES.items())
+    + "\n\nRespond with ONE JSON object with exactly the keys "
+    + ", ".join(f'"{key}"' for key in SECTIONS)
+    + ", each holding that specialist's JSON object:\n\n"
+    + "\n\n".join(f'"{key}" ({name}):\n{_schema(prompt)}'
+                  for key, (name, prompt, _) in _ROLES.items())
+)
+
+
+class SpecialistPanel:
+    """Runs the four specialists as one LLM request with per-section fallback."""
+
+    def __init__(self, market_researcher, weather_analyst,
+                 sustainability_expert, pest_predictor):
+        self.market = market_researcher
+        self.weather = weather_analyst
+        self.sustainability = sustainability_expert
+        self.pest = pest_predictor
+        self._local_scores = {
+            "market": market_researcher._local_analyse,
+            "weather": weather_analyst._local_analyse,
+            "sustainability": sustainability_expert._local_assess,
+        }
+
+    # ── Prompt ───────────────────────────────────────────────────────
+
+    def _inputs(self, calls: Dict[str, Tuple]) -> Tuple[Dict, Dict]:
+        """Raw and bucketed inputs per section, as each agent would use them."""
+        raw = {name: {k: v for k, v in calls[name][2].items() if k != "candidates"}
+               for name in SECTIONS}
+        return raw, {name: quantize_inputs(name, raw[name]) for name in SECTIONS}
+
+    def _prompt(self, inputs: Dict[str, Dict], candidates) -> str:
+        market, weather = inputs["market"], inputs["weather"]
+        sust, pest = inputs["sustainability"], inputs["pest"]
+        crop = market["crop"]
+        month_name = datetime.now().strftime("%B")
+        market_ref = market_Researcher.MARKET_REFERENCE.select(
+            [crop, *candidates] if candidates else None)
+        weather_ref = weather_Analyst.WEATHER_REFERENCE.select([crop])
+        pest_ref = pest_disease_predictor.PEST_BLOCK.select([crop])
+
+        return f"""Assess this farm — one section per specialist:
+
+TARGET CROP: {crop}
+FARM: {sust['land_size']} hectares, expected production {market['production']} tonnes, year {market['year']}, current month {month_name}
+
+CONDITIONS:
+- Soil pH: {sust['ph']}
+- Temperature: {weather['temperature']}°C
+- Rainfall: {weather['rainfall']} mm/season
+- Humidity: {weather['humidity']}%, soil moisture: {pest['soil_moisture']}%
+- Fertiliser: {sust['fertilizer_usage']} kg/ha (N {sust['nitrogen']}, P {sust['phosphorus']} kg/ha)
+- Pesticide usage: {sust['pesticide_usage']} kg/ha
+- Soil organic matter: {sust['organic_matter']}%
+
+MARKET REFERENCE DATA (Indian agricultural prices, ₹/quintal):
+{market_ref}
+
+WEATHER REFERENCE DATA:
+{weather_ref}
+
+ENVIRONMENTAL REFERENCE DATA:
+{sustainability_Expert.EMISSION_FACTORS}
+PEST & DISEASE REFERENCE DATABASE:
+{pest_ref}
+
+Give each specialist's assessment of {crop} under these conditions."""
+
+    # ── Split ────────────────────────────────────────────────────────
+
+    def _section_handlers(self, raw: Dict[str, Dict]) -> Dict[str, Tuple[Callable, Callable]]:
+        """section → (validate(resp), fallback())."""
+        market, weather = raw["market"], raw["weather"]
+        return {
+            "market": (lambda resp: self.market._validate_response(resp, market["crop"]),
+                       lambda: self.market._fallback_analyse(
+                           market["crop"], market["area"], market["production"])),
+            "weather": (self.weather._validate_response,
+                        lambda: self.weather._fallback_analyse(
+                            weather["temperature"], weather["rainfall"],
+                            weather["humidity"], weather["crop"])),
+            "sustainability": (self.sustainability._validate_response,
+                               lambda: self.sustainability._fallback_assess(**raw["sustainability"])),
+            "pest": (self.pest._validate_response,
+                     lambda: self.pest._fallback_predict(**raw["pest"])),
+        }
+
+    def _section(self, name: str, section: Any, handler: Tuple[Callable, Callable],
+                 raw: Dict[str, Dict], inputs: Dict[str, Dict], answered: bool = True) -> Dict:
+        """One validated section, or that agent's fallback."""
+        validate, fallback = handler
+        result = validate(section) if isinstance(section, dict) and section else None
+        if result is None:
+            if answered:
+                print(f"⚠️ Specialist panel: '{name}' section malformed, using fallback")
+            return fallback()
+        if local_scoring.DETERMINISTIC and name in self._local_scores:
+            result.update(self._local_scores[name](**inputs[name]))
+        return with_inputs(result, raw[name], inputs[name])
+
+    def _split(self, response: Optional[Dict], calls: Dict[str, Tuple],
+               raw: Dict[str, Dict], inputs: Dict[str, Dict],
+               results: Optional[Dict[str, Dict]] = None,
+               on_section: Optional[Callable[[str, Dict], None]] = None) -> Dict[str, Dict]:
+        """Fill in the sections not in ``results`` yet (streamed ones are)."""
+        results = dict(results or {})
+        for name, handler in self._section_handlers(raw).items():
+            if name in results:
+                continue
+            results[name] = self._section(name, (response or {}).get(name), handler,
+                                          raw, inputs, answered=response is not None)
+            if on_section is not None:
+                on_section(name, results[name])
+        if response is None:
+            print("⚠️ Specialist panel: LLM unavailable, all four specialists use fallbacks")
+        self._remember(calls, results)
+        return {name: results[name] for name in SECTIONS}
+
+    @staticmethod
+    def _remember(calls: Dict[str, Tuple], results: Dict[str, Dict]):
+        """Seed the request scope as if each agent method had run."""
+        scope = request_scope.current_scope()
+        if scope is None:
+            return
+        for name, (fn, afn, kwargs) in calls.items():
+            key = fn.memo_key(fn.__self__, **kwargs)
+            scope.remember(key, results[name])
+
+    # ── Public API ───────────────────────────────────────────────────
+
+    def run(self, calls: Dict[str, Tuple]) -> Dict[str, Dict]:
+        """``calls``: the coordinator's name → (method, async method, kwargs)."""
+        raw, inputs = self._inputs(calls)
+        user_prompt = self._prompt(inputs, calls["market"][2].get("candidates"))
+        response = call_gemini(PANEL_SYSTEM_PROMPT, user_prompt, temperature=0.3,
+                               max_tokens=4096, timeout=45, agent="panel")
+        return self._split(response, calls, raw, inputs)
+
+    async def run_async(self, calls: Dict[str, Tuple],
+                        on_section: Optional[Callable[[str, Dict], None]] = None) -> Dict[str, Dict]:
+        """Async run — awaits the LLM without holding a thread.
+
+        ``on_section(name, result)`` is called once per specialist; with
+        PANEL_STREAM each call comes as soon as that section has streamed in.
+        """
+        raw, inputs = self._inputs(calls)
+        user_prompt = self._prompt(inputs, calls["market"][2].get("candidates"))
+        if on_section is None or not PANEL_STREAM:
+            response = await acall_gemini(PANEL_SYSTEM_PROMPT, user_prompt, temperature=0.3,
+                                          max_tokens=4096, timeout=45, agent="panel")
+            return self._split(response, calls, raw, inputs, on_section=on_section)
+
+        handlers = self._section_handlers(raw)
+        response, results = {}, {}
+        async for name, section in astream_gemini(PANEL_SYSTEM_PROMPT, user_prompt, temperature=0.3,
+                                                  max_tokens=4096, timeout=45, agent="panel"):
+            response[name] = section
+            if name in handlers and name not in results:
+                results[name] = self._section(name, section, handlers[name], raw, inputs)
+                on_section(name, results[name])
+        return self._split(response or None, calls, raw, inputs, results, on_section)
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# Per-agent vs panel mode against a local stand-in server
+#   python -m models.specialist_panel
+# ═══════════════════════════════════════════════════════════════════════════════
+
+if __name__ == "__main__":
+    import json
+    import sys
+    import threading
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    from pathlib import Path
+    sys.path.insert(0, str(Path(__file__).parent.parent))
+
+    SECTION_REPLIES = {
+        "market": {"market_score": 7.2, "price_trend": "rising", "predicted_price": 2700},
+        "weather": {"weather_score": 8.1, "risk_level": "Low", "risks": []},
+        "sustainability": {"sustainability_score": 6.4, "environmental_impact": "Medium"},
+        "pest": {"overall_risk": "Moderate", "risk_score": 6, "threats": []},
+    }
+
+    class _StandIn(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            system = body["messages"][0]["content"]
+            if system.startswith("You are a panel"):
+                # One malformed section to show the per-section fallback
+                reply = {**SECTION_REPLIES, "pest": "Moderate risk"}
+            else:
+                reply = {"crop": "Rice", "score": 7, "confidence": 80, "final_recommendation": "ok"}
+                for section, (name, _, _) in _ROLES.items():
+                    if f"**{name}**" in system:
+                        reply = SECTION_REPLIES[section]
+            payload = json.dumps({"choices": [{"message": {"content": json.dumps(reply)}}]}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _StandIn)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    import contextlib
+    import io
+    from models import llm_cache, llm_config, rate_limiter
+    llm_config.GROQ_API_URL = f"http://127.0.0.1:{server.server_port}/v1/chat/completions"
+    llm_cache.CACHE_ENABLED = False
+    rate_limiter.RATE_LIMIT_ENABLED = False
+    from models.central_coordinator import CentralCoordinator
+
+    runs = {}
+    for mode in (False, True):
+        with contextlib.redirect_stdout(io.StringIO()) as log:
+            coordinator = CentralCoordinator(panel_mode=mode)
+            runs[mode] = coordinator.generate_recommendation(crop_preference="Rice")
+        runs[mode]["log"] = log.getvalue()
+    server.shutdown()
+
+    print("\n📊 One recommendation, per-agent vs specialist panel")
+    for mode, label in ((False, "per-agent"), (True, "panel")):
+        calls = runs[mode]["Upstream Calls"]
+        print(f"   {label:9s}: {calls['llm_requests']} LLM requests, "
+              f"~{calls['prompt_tokens']} prompt tokens")
+    panel = runs[True]
+    print(f"   panel scores: market {panel['Market Score']}, weather {panel['Weather Suitability Score']}, "
+          f"sustainability {panel['Sustainability Score']}")
+    fell_back = "'pest' section malformed" in panel["log"]
+    print(f"   malformed pest section → fallback used: {fell_back} "
+          f"(risk {panel['Agent Scores']['pest']}/10 from the rule-based predictor)")
@@ -0,0 +1,146 @@
+"""
+stage_graph — Tiny dependency-graph executor for the agent pipeline
+===================================================================
+Each ``Stage`` names the stages whose results it needs (``inputs``) and
+starts as soon as those have *settled* — finished, failed or timed out —
+so independent agents run concurrently and only true dependencies wait.
+A stage receives its inputs as keyword arguments (None for an input that
+failed or timed out).
+
+Stages with a ``share`` run under ``deadline.stage(share)`` and are
+abandoned once that sub-budget (plus a short grace) has passed; their
+dependents then proceed without them.
+
+    graph = StageGraph([
+        Stage("engine", run_engine),
+        Stage("market", lambda engine: market(engine), inputs=("engine",)),
+        Stage("synthesis", synthesise, inputs=("engine", "market")),
+    ])
+    results, errors, timed_out = graph.run()            # threads
+    results, errors, timed_out = await graph.run_async()  # asyncio
+
+Both accept ``on_settle(name, result)``, called as each stage settles
+(``result`` None if it failed or timed out) — for streaming partial results.
+"""
+
+import asyncio
+import contextlib
+import contextvars
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from models import deadline
+
+OnSettle = Callable[[str, Any], None]
+
+
+class Stage(NamedTuple):
+    name: str
+    fn: Callable                                 # sync callable
+    inputs: Tuple[str, ...] = ()
+    afn: Optional[Callable] = None               # coroutine function (asyncio runs)
+    share: Optional[float] = None                # fraction of the remaining deadline
+
+
+class StageGraph:
+    """Runs stages in dependency order with maximal concurrency."""
+
+    def __init__(self, stages: List[Stage], grace: float = 0.25):
+        self.stages = {s.name: s for s in stages}
+        self.grace = grace
+        for stage in stages:
+            missing = [i for i in stage.inputs if i not in self.stages]
+            if missing:
+                raise ValueError(f"Stage '{stage.name}' depends on unknown {missing}")
+        ready, left = set(), dict(self.stages)
+        while left:
+            runnable = [n for n, s in left.items() if ready.issuperset(s.inputs)]
+            if not runnable:
+                raise ValueError(f"Dependency cycle among stages {sorted(left)}")
+            for name in runnable:
+                del left[name]
+                ready.add(name)
+
+    def _budget(self, stage: Stage):
+        return deadline.stage(stage.share) if stage.share else contextlib.nullcontext()
+
+    # ── Threads ───────────────────────────────────────────────────────
+
+    def run(self, on_settle: Optional[OnSettle] = None
+            ) -> Tuple[Dict[str, Any], Dict[str, Exception], List[str]]:
+        """→ (results, errors, timed_out) once every stage has settled."""
+        results: Dict[str, Any] = {}
+        errors: Dict[str, Exception] = {}
+        timed_out: List[str] = []
+        pending = dict(self.stages)
+        running: Dict[Any, Tuple[str, Optional[float]]] = {}
+        settled = set()
+
+        executor = ThreadPoolExecutor(max_workers=len(self.stages) or 1)
+        try:
+            while pending or running:
+                for name in [n for n, s in pending.items() if settled.issuperset(s.inputs)]:
+                    stage = pending.pop(name)
+                    with self._budget(stage) as budget:
+                        ctx = contextvars.copy_context()    # carries the stage deadline
+                    kwargs = {i: results.get(i) for i in stage.inputs}
+                    expires = budget.expires_at + self.grace if budget else None
+                    running[executor.submit(ctx.run, stage.fn, **kwargs)] = (name, expires)
+
+                expiries = [e for _, e in running.values() if e is not None]
+                timeout = max(0.0, min(expiries) - time.monotonic()) if expiries else None
+                done, _ = wait(running, timeout=timeout, return_when=FIRST_COMPLETED)
+
+                for future in done:
+                    name, _ = running.pop(future)
+                    settled.add(name)
+                    try:
+                        results[name] = future.result()
+                    except Exception as e:
+                        errors[name] = e
+                    if on_settle:
+                        on_settle(name, results.get(name))
+                now = time.monotonic()
+                for future, (name, expires) in list(running.items()):
+                    if expires is not None and now >= expires:
+                        running.pop(future)
+                        settled.add(name)
+                        timed_out.append(name)
+                        if on_settle:
+                            on_settle(name, None)
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+        return results, errors, timed_out
+
+    # ── asyncio ───────────────────────────────────────────────────────
+
+    async def run_async(self, on_settle: Optional[OnSettle] = None
+                        ) -> Tuple[Dict[str, Any], Dict[str, Exception], List[str]]:
+        """Same as ``run`` on the event loop; stages without ``afn`` go to a thread."""
+        results: Dict[str, Any] = {}
+        errors: Dict[str, Exception] = {}
+        timed_out: List[str] = []
+        tasks: Dict[str, asyncio.Task] = {}
+
+        async def run_stage(stage: Stage):
+            if stage.inputs:
+                await asyncio.wait([tasks[i] for i in stage.inputs])
+            kwargs = {i: results.get(i) for i in stage.inputs}
+            with self._budget(stage) as budget:
+                timeout = budget.remaining() + self.grace if budget else None
+                call = (stage.afn(**kwargs) if stage.afn
+                        else asyncio.to_thread(stage.fn, **kwargs))
+                try:
+                    results[stage.name] = await asyncio.wait_for(call, timeout)
+                except asyncio.TimeoutError:
+                    timed_out.append(stage.name)
+                except Exception as e:
+                    errors[stage.name] = e
+            if on_settle:
+                on_settle(stage.name, results.get(stage.name))
+
+        for stage in self.stages.values():
+            tasks[stage.name] = asyncio.ensure_future(run_stage(stage))
+        await asyncio.gather(*tasks.values())
+        return results, errors, timed_out
@@ -10,12 +10,18 @@ Architecture:
   2. Gemini reasons about the full environmental picture holistically
   3. Returns actionable sustainability improvements, not just scores
   4. Falls back to formula-based scoring when the LLM is unavailable
+  5. Deterministic mode (see local_scoring): scores always come from the
+     formulas, the LLM only writes recommendations and reasoning
 """
 
 import os
 from typing import Dict, List, Optional
 
-from models.llm_config import call_gemini
+from models.llm_config import acall_gemini, call_gemini
+from models.request_scope import memoized
+from models.input_quantizer import quantize_inputs, with_inputs
+from models.response_schema import Choice, Number, Schema, Score, Text
+from models import local_scoring
 
 
 # ═══════════════════════════════════════════════════════════════════════════════
@@ -51,6 +57,53 @@ BIODIVERSITY BENCHMARKS:
 """
 
 
+# ═══════════════════════════════════════════════════════════════════════════════
+# Local scoring — vectorized formulas over the figures above
+# ═══════════════════════════════════════════════════════════════════════════════
+
+# kg CO₂e per kg of input (EMISSION_FACTORS: generic NPK blend, average pesticide)
+CARBON_FACTORS = {"fertiliser": 1.20, "pesticide": 6.30}
+
+# litres per kg of produce (EMISSION_FACTORS: WATER FOOTPRINT)
+WATER_FOOTPRINT = {
+    "Rice": 2500, "Wheat": 1300, "Corn": 900, "Maize": 900, "Soybean": 2100,
+    "Cotton": 10000, "Sugarcane": 1500, "Groundnut": 3000, "Millet": 800,
+    "Tea": 7900, "Coffee": 15400, "Tomato": 180, "Potato": 250, "Onion": 270,
+    "Banana": 790, "Jute": 4000,
+}
+DEFAULT_WATER_FOOTPRINT = 1500          # unlisted crops: mid-table
+# Log scale: ~150 L/kg scores 10, ~16,000 L/kg scores 0
+_WATER_BEST, _WATER_WORST = local_scoring.log(150), local_scoring.log(16000)
+
+ENV_IMPACT_BANDS = ((7, "Low"), (5, "Medium"), (3, "High"))
+
+
+def score_sustainability(fertilizer_usage, organic_matter, ph, nitrogen,
+                         pesticide_usage, crop, land_size=1.0) -> Dict:
+    """Five dimension scores, overall score and CO₂e; scalars or arrays."""
+    ls = local_scoring
+    fertilizer, organic, ph, nitrogen, pesticide, land = (
+        ls.values(v) for v in
+        (fertilizer_usage, organic_matter, ph, nitrogen, pesticide_usage, land_size))
+
+    carbon_kg = (fertilizer * CARBON_FACTORS["fertiliser"]
+                 + pesticide * CARBON_FACTORS["pesticide"])            # per hectare
+    carbon = ls.clip(10 - carbon_kg / 100, 0, 10)
+
+    footprint = ls.lookup(WATER_FOOTPRINT, crop, DEFAULT_WATER_FOOTPRINT)
+    water = ls.clip(10 * (_WATER_WORST - ls.log(footprint)) / (_WATER_WORST - _WATER_BEST), 0, 10)
+
+    soil = 7.0 - 2.0 * ((ph < 5.0) | (ph > 8.5)) - 2.0 * (organic < 0.5)
+    biodiversity = 8.0 - ls.where(pesticide > 100, 3.0, ls.where(pesticide > 50, 1.5, 0.0))
+    nutrient = ls.where((nitrogen >= 40) & (nitrogen <= 150), 6.0, 4.0)
+
+    overall = (carbon * 0.25 + water * 0.20 + soil * 0.25
+               + biodiversity * 0.15 + nutrient * 0.15)
+    return {"overall": overall, "carbon": carbon, "water": water, "soil": soil,
+            "biodiversity": biodiversity, "nutrient": nutrient,
+            "carbon_kg": carbon_kg * land}
+
+
 # ═══════════════════════════════════════════════════════════════════════════════
 # Agent System Prompt
 # ═══════════════════════════════════════════════════════════════════════════════
@@ -88,6 +141,24 @@ Respond with a JSON object:
   "improvement_potential": "How much the farmer could improve with recommended changes"
 }"""
 
+RESPONSE_SCHEMA = Schema("SustainabilityExpert", {
+    "sustainability_score": Score(falsy_default=True),
+    "environmental_impact": Choice(("Low", "Medium", "High", "Critical"), "Medium"),
+    "carbon_footprint": Score(falsy_default=True),
+    "water_score": Score(falsy_default=True),
+    "soil_health_score": Score(falsy_default=True),
+    "biodiversity_score": Score(falsy_default=True),
+    "nutrient_efficiency_score": Score(falsy_default=True),
+    "recommendations": Text(),
+    "reasoning": Text(),
+    "carbon_kg_estimate": Number(0.0),
+    "improvement_potential": Text(),
+})
+
+# Deterministic mode: the LLM writes only these (field → default)
+NARRATIVE_FIELDS = {"recommendations": "", "reasoning": "", "improvement_potential": ""}
+NARRATIVE_SYSTEM_PROMPT = local_scoring.narrative_system_prompt(SYSTEM_PROMPT, NARRATIVE_FIELDS)
+
 
 # ═══════════════════════════════════════════════════════════════════════════════
 # SustainabilityExpert Agent
@@ -102,6 +173,7 @@ class SustainabilityExpert:
 
     # ── Public API ───────────────────────────────────────────────────
 
+    @memoized("sustainability")
     def assess_sustainability(self, fertilizer_usage: float = 80,
                               organic_matter: float = 1.0,
                               ph: float = 6.5,
@@ -128,11 +200,44 @@ class SustainabilityExpert:
             nitrogen, phosphorus, pesticide_usage, crop, land_size,
         )
 
+    @memoized("sustainability")
+    async def assess_sustainability_async(self, fertilizer_usage: float = 80,
+                                          organic_matter: float = 1.0,
+                                          ph: float = 6.5,
+                                          nitrogen: float = 80,
+                                          phosphorus: float = 30,
+                                          pesticide_usage: float = 50,
+                                          crop: str = "Rice",
+                                          land_size: float = 1.0) -> Dict:
+        """Async assess_sustainability — awaits the LLM without holding a thread."""
+        llm_result = await self._llm_assess_async(
+            fertilizer_usage, organic_matter, ph,
+            nitrogen, phosphorus, pesticide_usage,
+            crop, land_size,
+        )
+        if llm_result:
+            return llm_result
+
+        print("⚠️ SustainabilityExpert: LLM unavailable, using fallback scoring")
+        return self._fallback_assess(
+            fertilizer_usage, organic_matter, ph,
+            nitrogen, phosphorus, pesticide_usage, crop, land_size,
+        )
+
     def evaluate(self, crops: list = None, **kwargs) -> tuple:
         """Backward-compatible alias for agent_setup.py.
         Returns (label, scores_dict)."""
         crop = crops[0] if crops else kwargs.get("crop", "Rice")
-        result = self.assess_sustainability(crop=crop, **kwargs)
+        fertilizer = kwargs.get("fertilizer", 80)
+        # Same argument mapping as the coordinator, so a request scope
+        # serves this from the coordinator's result instead of a new call
+        result = self.assess_sustainability(
+            fertilizer_usage=fertilizer, organic_matter=1.0,
+            ph=kwargs.get("soil_ph", 6.5), nitrogen=fertilizer, phosphorus=30,
+            pesticide_usage=kwargs["pesticide"] * 30 if "pesticide" in kwargs else 50,
+            crop=crop,
+            land_size=kwargs.get("land_size", 1.0),
+        )
         scores = {
             "sustainability": result["sustainability_score"],
             "carbon": result["carbon_footprint"],
@@ -143,10 +248,10 @@ class SustainabilityExpert:
 
     # ── LLM Path ─────────────────────────────────────────────────────
 
-    def _llm_assess(self, fertilizer_usage, organic_matter, ph,
-                    nitrogen, phosphorus, pesticide_usage,
-                    crop, land_size) -> Optional[Dict]:
-        """Call Gemini for comprehensive sustainability analysis."""
+    def _assess_prompt(self, fertilizer_usage, organic_matter, ph,
+                       nitrogen, phosphorus, pesticide_usage,
+                       crop, land_size) -> str:
+        """Build the sustainability-assessment user prompt."""
 
         user_prompt = f"""Assess the sustainability of these farming practices:
 
@@ -166,59 +271,110 @@ ENVIRONMENTAL REFERENCE DATA:
 
 Evaluate these practices across all 5 sustainability dimensions (carbon, water, soil health, biodiversity, nutrient efficiency). Calculate actual carbon emissions estimate using the emission factors provided. Provide specific, actionable recommendations to improve sustainability."""
 
-        response = call_gemini(SYSTEM_PROMPT, user_prompt, temperature=0.3)
+        return user_prompt
+
+    def _llm_request(self, inputs: Dict):
+        """(system prompt, user prompt, max_tokens, local scores or None)."""
+        user_prompt = self._assess_prompt(**inputs)
+        if not local_scoring.DETERMINISTIC:
+            return SYSTEM_PROMPT, user_prompt, 2048, None
+        scores = self._local_assess(**inputs)
+        return (NARRATIVE_SYSTEM_PROMPT, user_prompt + local_scoring.scores_block(scores),
+                local_scoring.NARRATIVE_MAX_TOKENS, scores)
+
+    def _llm_result(self, response: Dict, scores: Optional[Dict]) -> Optional[Dict]:
+        if scores is None:
+            return self._validate_response(response)
+        return {**scores, **local_scoring.narrative_fields(response, NARRATIVE_FIELDS)}
+
+    def _llm_assess(self, fertilizer_usage, organic_matter, ph,
+                    nitrogen, phosphorus, pesticide_usage,
+                    crop, land_size) -> Optional[Dict]:
+        """Call Gemini for comprehensive sustainability analysis."""
+        raw = dict(fertilizer_usage=fertilizer_usage, organic_matter=organic_matter,
+                   ph=ph, nitrogen=nitrogen, phosphorus=phosphorus,
+                   pesticide_usage=pesticide_usage, crop=crop, land_size=land_size)
+        inputs = quantize_inputs("sustainability", raw)
+        system_prompt, user_prompt, max_tokens, scores = self._llm_request(inputs)
+        response = call_gemini(system_prompt, user_prompt, temperature=0.3,
+                               max_tokens=max_tokens, agent="sustainability")
+        if not response:
+            return None
+
+        return with_inputs(self._llm_result(response, scores), raw, inputs)
+
+    async def _llm_assess_async(self, fertilizer_usage, organic_matter, ph,
+                                nitrogen, phosphorus, pesticide_usage,
+                                crop, land_size) -> Optional[Dict]:
+        raw = dict(fertilizer_usage=fertilizer_usage, organic_matter=organic_matter,
+                   ph=ph, nitrogen=nitrogen, phosphorus=phosphorus,
+                   pesticide_usage=pesticide_usage, crop=crop, land_size=land_size)
+        inputs = quantize_inputs("sustainability", raw)
+        system_prompt, user_prompt, max_tokens, scores = self._llm_request(inputs)
+        response = await acall_gemini(system_prompt, user_prompt, temperature=0.3,
+                                      max_tokens=max_tokens, agent="sustainability")
         if not response:
             return None
 
-        return self._validate_response(response)
+        return with_inputs(self._llm_result(response, scores), raw, inputs)
 
     def _validate_response(self, resp: Dict) -> Optional[Dict]:
         """Validate LLM response."""
-        try:
-            def clamp(val, default=5.0):
-                return max(0.0, min(10.0, float(val or default)))
-
-            sust_score = clamp(resp.get("sustainability_score"))
-            env_impact = str(resp.get("environmental_impact", "Medium"))
-            if env_impact not in ("Low", "Medium", "High", "Critical"):
-                env_impact = "Medium"
-
-            carbon = clamp(resp.get("carbon_footprint"))
-            water = clamp(resp.get("water_score"))
-            soil = clamp(resp.get("soil_health_score"))
-            bio = clamp(resp.get("biodiversity_score"))
-            nutrient = clamp(resp.get("nutrient_efficiency_score"))
-
-            return {
-                "sustainability_score": round(sust_score, 1),
-                "environmental_impact": env_impact,
-                "carbon_footprint": round(carbon, 1),
-                "water_score": round(water, 1),
-                "soil_health_score": round(soil, 1),
-                "biodiversity_score": round(bio, 1),
-                "nutrient_efficiency_score": round(nutrient, 1),
-                "recommendations": str(resp.get("recommendations", "")),
-                "reasoning": str(resp.get("reasoning", "")),
-                "carbon_kg_estimate": float(resp.get("carbon_kg_estimate", 0)),
-                "improvement_potential": str(resp.get("improvement_potential", "")),
-                "detail": {
-                    "carbon_score": round(carbon, 1),
-                    "water_score": round(water, 1),
-                    "soil_health_score": round(soil, 1),
-                    "biodiversity_score": round(bio, 1),
-                    "nutrient_score": round(nutrient, 1),
-                },
+        result = RESPONSE_SCHEMA.validate(resp)
+        if result is not None:
+            result["detail"] = {
+                "carbon_score": result["carbon_footprint"],
+                "water_score": result["water_score"],
+                "soil_health_score": result["soil_health_score"],
+                "biodiversity_score": result["biodiversity_score"],
+                "nutrient_score": result["nutrient_efficiency_score"],
             }
-        except Exception as e:
-            print(f"⚠️ SustainabilityExpert: LLM response validation failed: {e}")
-            return None
-
-    # ── Fallback Path ────────────────────────────────────────────────
+        return result
+
+    # ── Local Scores / Fallback Path ─────────────────────────────────
+
+    def _local_assess(self, fertilizer_usage, organic_matter, ph,
+                      nitrogen, phosphorus, pesticide_usage,
+                      crop, land_size) -> Dict:
+        """Every numeric field of the assessment, from score_sustainability."""
+        s = local_scoring.scalars(score_sustainability(
+            fertilizer_usage, organic_matter, ph, nitrogen,
+            pesticide_usage, crop, land_size))
+        carbon, water, soil = round(s["carbon"], 1), round(s["water"], 1), round(s["soil"], 1)
+        bio, nutrient = round(s["biodiversity"], 1), round(s["nutrient"], 1)
+        return {
+            "sustainability_score": round(s["overall"], 1),
+            "environmental_impact": local_scoring.band(s["overall"], ENV_IMPACT_BANDS, "Critical"),
+            "carbon_footprint": carbon,
+            "water_score": water,
+            "soil_health_score": soil,
+            "biodiversity_score": bio,
+            "nutrient_efficiency_score": nutrient,
+            "carbon_kg_estimate": round(s["carbon_kg"], 1),
+            "detail": {
+                "carbon_score": carbon,
+                "water_score": water,
+                "soil_health_score": soil,
+                "biodiversity_score": bio,
+                "nutrient_score": nutrient,
+            },
+        }
 
     def _fallback_assess(self, fertilizer_usage, organic_matter, ph,
                          nitrogen, phosphorus, pesticide_usage,
                          crop, land_size) -> Dict:
-        """Formula-based fallback when LLM is unavailable."""
+        """Formula-based fallback when LLM is unavailable.
+
+        Deterministic mode uses the local scores; otherwise the original
+        fallback formulas below, unchanged."""
+        if local_scoring.DETERMINISTIC:
+            return {
+                **self._local_assess(fertilizer_usage, organic_matter, ph, nitrogen,
+                                     phosphorus, pesticide_usage, crop, land_size),
+                "recommendations": "Reduce chemical inputs, improve organic matter. (LLM offline — general advice)",
+                "reasoning": "Fallback formula-based assessment.",
+                "improvement_potential": "Unknown (AI agent offline)",
+            }
 
         # Carbon score (10 = low emissions)
         carbon_kg = fertilizer_usage * 1.2 + pesticide_usage * 6.3
@@ -9,14 +9,24 @@ Architecture:
   2. LLM analyses the specific conditions with meteorological reasoning
   3. Optional live weather via Open-Meteo API (free, no key) enriches the analysis
   4. Falls back to rule-based scoring when the LLM is unavailable
+  5. Deterministic mode (see local_scoring): the score and risks always come
+     from the crop's weather ranges, the LLM only writes forecast and advice
 """
 
 import os
+import re
 import requests as http_requests
 from datetime import datetime
 from typing import Dict, List, Optional
 
-from models.llm_config import call_gemini
+from models.deadline import clamp_timeout
+from models.llm_config import acall_gemini, call_gemini
+from models.request_scope import memoized
+from models.prompt_reference import ReferenceBlock
+from models.single_flight import SingleFlight
+from models.input_quantizer import quantize_inputs, with_inputs
+from models.response_schema import Choice, Schema, Score, Text, TextList
+from models import local_scoring
 
 
 # ═══════════════════════════════════════════════════════════════════════════════
@@ -40,10 +50,77 @@ WEATHER_PROFILES = {
     "Banana":     {"temp_opt": "25-32°C", "temp_stress": "<12 or >38°C", "rain_opt": "120-200mm", "rain_extremes": "drought<60mm, flood>350mm", "humidity": "70-90%", "drought_tol": "low",    "flood_tol": "low", "frost": "very sensitive"},
 }
 
+
+def _weather_line(name: str, data: Dict) -> str:
+    return (
+        f"  {name}: Temp opt {data['temp_opt']}, stress {data['temp_stress']}, "
+        f"Rain opt {data['rain_opt']}, {data['rain_extremes']}, "
+        f"Humidity {data['humidity']}, Drought tol: {data['drought_tol']}, "
+        f"Flood tol: {data['flood_tol']}, Frost: {data['frost']}"
+    )
+
+
+# Rendered once at import
+WEATHER_REFERENCE = ReferenceBlock.table(
+    {name: _weather_line(name, data) for name, data in WEATHER_PROFILES.items()})
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# Local scoring — vectorized, against each crop's ranges in WEATHER_PROFILES
+# ═══════════════════════════════════════════════════════════════════════════════
+
+def _bounds(text: str) -> List[float]:
+    return [float(x) for x in re.findall(r"\d+", text)]
+
+
+# field → {crop: bound}, parsed once from WEATHER_PROFILES
+WEATHER_BOUNDS = {field: {} for field in (
+    "temp_lo", "temp_hi", "stress_lo", "stress_hi",
+    "rain_lo", "rain_hi", "drought", "flood", "humidity_lo", "humidity_hi")}
+for _crop, _profile in WEATHER_PROFILES.items():
+    for _fields, _text in ((("temp_lo", "temp_hi"), _profile["temp_opt"]),
+                           (("stress_lo", "stress_hi"), _profile["temp_stress"]),
+                           (("rain_lo", "rain_hi"), _profile["rain_opt"]),
+                           (("drought", "flood"), _profile["rain_extremes"]),
+                           (("humidity_lo", "humidity_hi"), _profile["humidity"])):
+        for _field, _value in zip(_fields, _bounds(_text)):
+            WEATHER_BOUNDS[_field][_crop] = _value
+
+# Crops without a profile
+GENERIC_BOUNDS = {"temp_lo": 20, "temp_hi": 32, "stress_lo": 10, "stress_hi": 40,
+                  "rain_lo": 60, "rain_hi": 200, "drought": 30, "flood": 350,
+                  "humidity_lo": 50, "humidity_hi": 80}
+
+RISK_BANDS = ((7, "Low"), (5, "Moderate"), (3, "High"))
+
+
+def score_weather(temperature, rainfall, humidity, crop) -> Dict:
+    """Weather suitability score and risk flags; scalars or arrays."""
+    ls = local_scoring
+    temp, rain, hum = (ls.values(v) for v in (temperature, rainfall, humidity))
+    b = {field: ls.lookup(WEATHER_BOUNDS[field], crop, GENERIC_BOUNDS[field])
+         for field in WEATHER_BOUNDS}
+
+    extreme_temp = (temp < b["stress_lo"]) | (temp > b["stress_hi"])
+    drought, flood = rain < b["drought"], rain > b["flood"]
+    temp_ok = (b["temp_lo"] <= temp) & (temp <= b["temp_hi"])
+    rain_ok = (b["rain_lo"] <= rain) & (rain <= b["rain_hi"])
+    score = (5.0
+             + ls.where(temp_ok, 2.0, ls.where(extreme_temp, -2.0, 0.5))
+             + ls.where(rain_ok, 2.0, ls.where(drought | flood, -1.5, 0.5))
+             + ls.where((b["humidity_lo"] <= hum) & (hum <= b["humidity_hi"]), 1.0, 0.0))
+    return {"score": ls.clip(score, 0, 10), "extreme_temp": extreme_temp,
+            "drought": drought, "flood": flood,
+            "fungal": hum > b["humidity_hi"] + 10}
+
+
 # Open-Meteo API — free, no API key needed
 OPEN_METEO_BASE = "https://api.open-meteo.com/v1"
 OPEN_METEO_GEOCODE = "https://geocoding-api.open-meteo.com/v1/search"
 
+# Concurrent live-weather lookups for one city share a single fetch
+_live_weather_flight = SingleFlight("live_weather")
+
 
 # ═══════════════════════════════════════════════════════════════════════════════
 # Agent System Prompt
@@ -78,6 +155,20 @@ Respond with a JSON object:
   "advice": "Actionable weather-adaptive farming recommendations"
 }"""
 
+RESPONSE_SCHEMA = Schema("WeatherAnalyst", {
+    "weather_score": Score(),
+    "risk_level": Choice(("Low", "Moderate", "High", "Severe"), "Moderate"),
+    "forecast": Text(),
+    "predicted_yield_impact": Text("0%"),
+    "risks": TextList(),
+    "reasoning": Text(),
+    "advice": Text(),
+})
+
+# Deterministic mode: the LLM writes only these (field → default)
+NARRATIVE_FIELDS = {"forecast": "", "predicted_yield_impact": "0%", "reasoning": "", "advice": ""}
+NARRATIVE_SYSTEM_PROMPT = local_scoring.narrative_system_prompt(SYSTEM_PROMPT, NARRATIVE_FIELDS)
+
 
 # ═══════════════════════════════════════════════════════════════════════════════
 # WeatherAnalyst Agent
@@ -92,6 +183,7 @@ class WeatherAnalyst:
 
     # ── Public API ───────────────────────────────────────────────────
 
+    @memoized("weather")
     def analyze_weather_impact(self, temperature: float = 25,
                                rainfall: float = 100,
                                humidity: float = 60,
@@ -110,6 +202,19 @@ class WeatherAnalyst:
         print("⚠️ WeatherAnalyst: LLM unavailable, using fallback scoring")
         return self._fallback_analyse(temperature, rainfall, humidity, crop)
 
+    @memoized("weather")
+    async def analyze_weather_impact_async(self, temperature: float = 25,
+                                           rainfall: float = 100,
+                                           humidity: float = 60,
+                                           crop: str = "Rice") -> Dict:
+        """Async analyze_weather_impact — awaits the LLM without holding a thread."""
+        llm_result = await self._llm_analyse_async(temperature, rainfall, humidity, crop)
+        if llm_result:
+            return llm_result
+
+        print("⚠️ WeatherAnalyst: LLM unavailable, using fallback scoring")
+        return self._fallback_analyse(temperature, rainfall, humidity, crop)
+
     def forecast(self, soil_ph=6.5, soil_moisture=60,
                  fertilizer=50, pesticide=2.0) -> Dict:
         """Backward-compatible alias for agent_setup.py.
@@ -124,7 +229,7 @@ class WeatherAnalyst:
         try:
             resp = http_requests.get(OPEN_METEO_GEOCODE, params={
                 "name": city, "count": 1, "language": "en", "format": "json",
-            }, timeout=8)
+            }, timeout=clamp_timeout(8))
             resp.raise_for_status()
             results = resp.json().get("results", [])
             if results:
@@ -135,7 +240,14 @@ class WeatherAnalyst:
         return None
 
     def get_live_weather(self, city: str) -> Optional[Dict]:
-        """Fetch current weather from Open-Meteo (free, no API key)."""
+        """Fetch current weather from Open-Meteo (free, no API key).
+
+        Concurrent lookups for the same city share one upstream fetch.
+        """
+        return _live_weather_flight.do(
+            city.strip().lower(), self._fetch_live_weather, city)
+
+    def _fetch_live_weather(self, city: str) -> Optional[Dict]:
         try:
             geo = self._geocode_city(city)
             if not geo:
@@ -146,7 +258,7 @@ class WeatherAnalyst:
                 "latitude": geo["lat"], "longitude": geo["lon"],
                 "current": "temperature_2m,relative_humidity_2m,weather_code,wind_speed_10m,apparent_temperature",
                 "timezone": "auto",
-            }, timeout=10)
+            }, timeout=clamp_timeout(10))
             resp.raise_for_status()
             data = resp.json().get("current", {})
 
@@ -217,9 +329,9 @@ class WeatherAnalyst:
 
     # ── LLM Path ─────────────────────────────────────────────────────
 
-    def _llm_analyse(self, temperature, rainfall, humidity, crop,
-                     live_data=None) -> Optional[Dict]:
-        """Call Gemini for intelligent weather analysis."""
+    def _analyse_prompt(self, temperature, rainfall, humidity, crop,
+                        live_data=None) -> str:
+        """Build the weather-impact user prompt."""
 
         now = datetime.now()
         month_name = now.strftime("%B")
@@ -227,16 +339,7 @@ class WeatherAnalyst:
         crop_key = crop.strip().title()
         crop_profile = WEATHER_PROFILES.get(crop_key, {})
 
-        # Build weather profiles context
-        ref_lines = []
-        for name, data in WEATHER_PROFILES.items():
-            ref_lines.append(
-                f"  {name}: Temp opt {data['temp_opt']}, stress {data['temp_stress']}, "
-                f"Rain opt {data['rain_opt']}, {data['rain_extremes']}, "
-                f"Humidity {data['humidity']}, Drought tol: {data['drought_tol']}, "
-                f"Flood tol: {data['flood_tol']}, Frost: {data['frost']}"
-            )
-        weather_ref = "\n".join(ref_lines)
+        weather_ref = WEATHER_REFERENCE.full
 
         live_section = ""
         if live_data:
@@ -267,47 +370,88 @@ WEATHER REFERENCE DATA FOR ALL CROPS:
 
 Assess how suitable these weather conditions are for {crop}. Identify specific risks, estimate yield impact, and provide weather-adaptive farming advice."""
 
-        response = call_gemini(SYSTEM_PROMPT, user_prompt, temperature=0.3)
+        return user_prompt
+
+    def _llm_request(self, inputs: Dict, live_data=None):
+        """(system prompt, user prompt, max_tokens, local scores or None)."""
+        user_prompt = self._analyse_prompt(**inputs, live_data=live_data)
+        if not local_scoring.DETERMINISTIC:
+            return SYSTEM_PROMPT, user_prompt, 2048, None
+        scores = self._local_analyse(**inputs)
+        return (NARRATIVE_SYSTEM_PROMPT, user_prompt + local_scoring.scores_block(scores),
+                local_scoring.NARRATIVE_MAX_TOKENS, scores)
+
+    def _llm_result(self, response: Dict, scores: Optional[Dict]) -> Optional[Dict]:
+        if scores is None:
+            return self._validate_response(response)
+        return {**scores, **local_scoring.narrative_fields(response, NARRATIVE_FIELDS)}
+
+    def _llm_analyse(self, temperature, rainfall, humidity, crop,
+                     live_data=None) -> Optional[Dict]:
+        """Call Gemini for intelligent weather analysis."""
+        raw = dict(temperature=temperature, rainfall=rainfall,
+                   humidity=humidity, crop=crop)
+        inputs = quantize_inputs("weather", raw)
+        system_prompt, user_prompt, max_tokens, scores = self._llm_request(inputs, live_data)
+        response = call_gemini(system_prompt, user_prompt, temperature=0.3,
+                               max_tokens=max_tokens, agent="weather")
         if not response:
             return None
 
-        return self._validate_response(response)
+        return with_inputs(self._llm_result(response, scores), raw, inputs)
+
+    async def _llm_analyse_async(self, temperature, rainfall, humidity, crop,
+                                 live_data=None) -> Optional[Dict]:
+        raw = dict(temperature=temperature, rainfall=rainfall,
+                   humidity=humidity, crop=crop)
+        inputs = quantize_inputs("weather", raw)
+        system_prompt, user_prompt, max_tokens, scores = self._llm_request(inputs, live_data)
+        response = await acall_gemini(system_prompt, user_prompt, temperature=0.3,
+                                      max_tokens=max_tokens, agent="weather")
+        if not response:
+            return None
+
+        return with_inputs(self._llm_result(response, scores), raw, inputs)
 
     def _validate_response(self, resp: Dict) -> Optional[Dict]:
         """Validate LLM response."""
-        try:
-            weather_score = float(resp.get("weather_score", 5.0))
-            weather_score = max(0.0, min(10.0, weather_score))
+        return RESPONSE_SCHEMA.validate(resp)
 
-            risk_level = str(resp.get("risk_level", "Moderate"))
-            if risk_level not in ("Low", "Moderate", "High", "Severe"):
-                risk_level = "Moderate"
+    # ── Local Scores / Fallback Path ─────────────────────────────────
+
+    def _local_analyse(self, temperature, rainfall, humidity, crop) -> Dict:
+        """Score, risk level and risks from score_weather."""
+        s = local_scoring.scalars(score_weather(temperature, rainfall, humidity, crop))
+        risks = []
+        if s["extreme_temp"]:
+            risks.append(f"Extreme temperature ({temperature}°C)")
+        if s["drought"]:
+            risks.append("Drought risk — low rainfall")
+        if s["flood"]:
+            risks.append("Flood risk — excessive rainfall")
+        if s["fungal"]:
+            risks.append("High humidity — fungal disease risk")
+        return {
+            "weather_score": round(s["score"], 1),
+            "risk_level": local_scoring.band(s["score"], RISK_BANDS, "Severe"),
+            "risks": risks or ["No major weather risks detected"],
+        }
 
-            forecast = str(resp.get("forecast", ""))
-            reasoning = str(resp.get("reasoning", ""))
-            advice = str(resp.get("advice", ""))
-            risks = resp.get("risks", [])
-            if isinstance(risks, str):
-                risks = [risks]
+    def _fallback_analyse(self, temperature, rainfall, humidity,
+                          crop) -> Dict:
+        """Rule-based fallback when LLM is unavailable.
 
+        Deterministic mode uses the local scores; otherwise the original
+        generic thresholds below, unchanged."""
+        if local_scoring.DETERMINISTIC:
             return {
-                "weather_score": round(weather_score, 1),
-                "risk_level": risk_level,
-                "forecast": forecast,
-                "predicted_yield_impact": str(resp.get("predicted_yield_impact", "0%")),
-                "risks": risks,
-                "reasoning": reasoning,
-                "advice": advice,
+                **self._local_analyse(temperature, rainfall, humidity, crop),
+                "forecast": f"Temperature {temperature}°C with {rainfall}mm rainfall (offline analysis).",
+                "predicted_yield_impact": "0%",
+                "reasoning": "Fallback analysis — LLM unavailable.",
+                "advice": f"Monitor weather conditions for {crop} closely.",
             }
-        except Exception as e:
-            print(f"⚠️ WeatherAnalyst: LLM response validation failed: {e}")
-            return None
 
-    # ── Fallback Path ────────────────────────────────────────────────
-
-    def _fallback_analyse(self, temperature, rainfall, humidity,
-                          crop) -> Dict:
-        """Rule-based fallback when LLM is unavailable."""
         score = 5.0
         risks = []
 